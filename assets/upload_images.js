@@ -0,0 +1,32 @@
+// Pick images and post each one, as its raw bytes, to the backend's blob
+// route. Resolves to one {filename, name} or {filename, error} per file; an
+// empty list when the picker is dismissed.
+function vecdrawUploadImages(endpoint) {
+    return new Promise((resolve) => {
+        const input = document.createElement("input");
+        input.type = "file";
+        input.multiple = true;
+        input.accept = ".png,.jpg,.jpeg,.gif,.webp,image/png,image/jpeg,image/gif,image/webp";
+        input.oncancel = () => resolve([]);
+        input.onchange = () => {
+            const files = Array.from(input.files || []);
+            resolve(Promise.all(files.map((file) => uploadOne(endpoint, file))));
+        };
+        input.click();
+    });
+}
+
+async function uploadOne(endpoint, file) {
+    const url = `${endpoint}?filename=${encodeURIComponent(file.name)}`;
+    try {
+        const response = await fetch(url, {
+            method: "POST",
+            headers: { "Content-Type": "application/octet-stream" },
+            body: file,
+        });
+        const result = await response.json();
+        return { filename: file.name, ...result };
+    } catch (e) {
+        return { filename: file.name, error: `${file.name} could not be uploaded` };
+    }
+}
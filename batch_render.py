@@ -0,0 +1,146 @@
+"""Headless batch renderer for exported shape documents.
+
+Renders every ``*.json`` or ``*.vdoc`` document in a directory (as produced
+by the topbar "Export as JSON" and "Export as binary" menus) to SVG and/or
+PNG thumbnails across a worker pool, without starting a browser.
+
+    poetry run python batch_render.py exports/ --out renders/ --format both
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from PIL import Image
+
+from codoc_in_vecdraw.rendering.raster import render_tile
+from codoc_in_vecdraw.rendering.svg_renderer import document_bounds, iter_svg
+from codoc_in_vecdraw.states.editor_state import Shape
+from codoc_in_vecdraw.states.scene_graph import gather_groups
+from codoc_in_vecdraw.storage.document_format import is_document, load_document
+
+# Manifest of content hashes from previous runs, stored in the output directory.
+MANIFEST_NAME = ".batch_render_manifest.json"
+
+
+def _field_default(annotation):
+    """Return the blank value used by EditorState for a Shape field type."""
+    if getattr(annotation, "__origin__", None) is list:
+        return []
+    if annotation is bool:
+        return False
+    return 0 if annotation is int else ""
+
+
+def load_shapes(data: bytes) -> list[Shape]:
+    """Parse a JSON document into shapes, filling fields missing from older exports."""
+    if is_document(data):
+        return load_document(data)
+    shapes = json.loads(data)
+    if not isinstance(shapes, list):
+        raise ValueError("Document must be a JSON list of shapes")
+    fields = Shape.__annotations__
+    return [
+        {key: raw.get(key, _field_default(annotation)) for key, annotation in fields.items()}
+        for raw in shapes
+    ]
+
+
+def render_document(
+    path: str, out_dir: str, formats: list[str], thumb_size: int, upload_dir: str | None
+) -> tuple[str, int]:
+    """Render one document; runs in a worker process. Returns (name, shape count)."""
+    source = Path(path)
+    if source.suffix == ".vdoc":
+        # Mapped rather than read, so only the records are touched
+        shapes = load_document(source)
+    else:
+        shapes = load_shapes(source.read_bytes())
+    # Hand-edited documents may leave a group's members apart
+    shapes = gather_groups(shapes)
+    uploads = Path(upload_dir) if upload_dir else None
+
+    if "svg" in formats:
+        target = Path(out_dir) / f"{source.stem}.svg"
+        with open(target, "w", encoding="utf-8") as f:
+            for chunk in iter_svg(shapes, embed_images=uploads is not None, upload_dir=uploads):
+                f.write(chunk)
+
+    if "png" in formats:
+        padding = 20
+        min_x, min_y, max_x, max_y = document_bounds(shapes)
+        width = max_x - min_x + 2 * padding
+        height = max_y - min_y + 2 * padding
+        scale = thumb_size / max(width, height, 1)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # Thumbnails are small enough to draw as a single tile in this worker.
+        raw = render_tile(shapes, (min_x - padding, min_y - padding), size, scale, upload_dir=uploads)
+        Image.frombytes("RGB", size, raw).save(Path(out_dir) / f"{source.stem}.png", optimize=True)
+
+    return source.name, len(shapes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render exported shape JSON documents to SVG/PNG.")
+    parser.add_argument("input_dir", type=Path, help="Directory of exported *.json and *.vdoc documents")
+    parser.add_argument("--out", type=Path, default=Path("renders"), help="Output directory")
+    parser.add_argument("--format", choices=["svg", "png", "both"], default="both")
+    parser.add_argument("--thumb-size", type=int, default=256, help="Longest PNG thumbnail edge in pixels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--upload-dir", type=Path, default=None, help="Upload directory to embed images from")
+    parser.add_argument("--force", action="store_true", help="Re-render unchanged inputs too")
+    args = parser.parse_args()
+
+    formats = ["svg", "png"] if args.format == "both" else [args.format]
+    args.out.mkdir(parents=True, exist_ok=True)
+    manifest_path = args.out / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    # The options are part of the key so changing them re-renders everything.
+    options = f"{','.join(formats)}:{args.thumb_size}:{args.upload_dir or ''}"
+    jobs = {}
+    skipped = 0
+    paths = [*args.input_dir.glob("*.json"), *args.input_dir.glob("*.vdoc")]
+    for path in sorted(paths):
+        digest = hashlib.sha256(path.read_bytes() + options.encode()).hexdigest()
+        if not args.force and manifest.get(path.name) == digest:
+            skipped += 1
+            continue
+        jobs[str(path)] = digest
+
+    print(f"Rendering {len(jobs)} documents ({skipped} unchanged, skipped) with {args.workers} workers...")
+    started = time.perf_counter()
+    rendered = failed = total_shapes = 0
+    upload_dir = str(args.upload_dir) if args.upload_dir else None
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(render_document, path, str(args.out), formats, args.thumb_size, upload_dir): path
+            for path in jobs
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, count = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Failed to render {path}: {e}")
+                continue
+            rendered += 1
+            total_shapes += count
+            manifest[Path(path).name] = jobs[path]
+
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    elapsed = time.perf_counter() - started
+    rate = rendered / elapsed if elapsed else 0.0
+    print(
+        f"Done: {rendered} rendered, {failed} failed, {skipped} skipped in {elapsed:.2f}s "
+        f"({rate:.1f} docs/s, {total_shapes / elapsed if elapsed else 0.0:.0f} shapes/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
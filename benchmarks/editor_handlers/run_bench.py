@@ -0,0 +1,297 @@
+"""Headless benchmarks for EditorState event handlers.
+
+Drives the handlers directly on an EditorState instance, without a browser
+or server, on synthetic boards of increasing size, and writes a JSON report
+that can be diffed between releases.
+
+    poetry run python benchmarks/editor_handlers/run_bench.py --out bench_report.json
+    poetry run python benchmarks/editor_handlers/run_bench.py --sizes 10 1000 --compare old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from codoc_in_vecdraw.rendering.point_codec import pack_points
+from codoc_in_vecdraw.states.editor_state import EditorState, Shape, next_shape_version
+
+DEFAULT_SIZES = [10, 100, 1_000, 10_000, 50_000]
+
+# Board extent in canvas units; shapes are scattered uniformly inside it.
+BOARD_SIZE = 20_000
+
+SHAPE_TYPES = ["rectangle", "ellipse", "triangle", "line", "text", "pencil"]
+
+
+def make_shape(rng: random.Random, shape_type: str) -> Shape:
+    """Build a synthetic shape of the given type somewhere on the board."""
+    x = rng.randint(0, BOARD_SIZE)
+    y = rng.randint(0, BOARD_SIZE)
+    width = rng.randint(20, 200)
+    height = rng.randint(20, 200)
+    points = ""
+    path_data = ""
+    if shape_type == "pencil":
+        samples = [{"x": x + i * 2, "y": y + rng.randint(0, height)} for i in range(50)]
+        points = pack_points(samples)
+        path_data = "M " + " L ".join(f"{p['x']} {p['y']}" for p in samples)
+    return {
+        "id": f"bench-{rng.getrandbits(64):016x}",
+        "type": shape_type,
+        "x": x,
+        "y": y,
+        "width": width,
+        "height": height,
+        "fill": "#e9d5ff",
+        "stroke": "#7c3aed",
+        "stroke_width": 2,
+        "end_x": x + width if shape_type == "line" else 0,
+        "end_y": y + height if shape_type == "line" else 0,
+        "content": "Benchmark" if shape_type == "text" else "",
+        "points": points,
+        "path_data": path_data,
+        "src": "",
+        "display_src": "",
+        "tiled": False,
+        "groups": [],
+        "style": "",
+        "version": next_shape_version(),
+    }
+
+
+def make_state(size: int, seed: int = 0) -> EditorState:
+    """Create an EditorState holding a synthetic board of ``size`` shapes."""
+    rng = random.Random(seed)
+    state = EditorState(_reflex_internal_init=True)
+    state.shapes = [make_shape(rng, SHAPE_TYPES[i % len(SHAPE_TYPES)]) for i in range(size)]
+    return state
+
+
+def call(handler, state: EditorState, *args):
+    """Invoke an event handler directly, swallowing its debug prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return handler.fn(state, *args)
+
+
+def select(state: EditorState, ids: list[str]):
+    """Set the selection directly, as the select tool would."""
+    state.selected_ids = ids
+    state.selected_shape_id = ids[-1] if ids else ""
+
+
+def measure(samples: list[int]) -> dict:
+    """Summarise per-call timings given in nanoseconds."""
+    ordered = sorted(samples)
+    to_us = 1 / 1000
+    return {
+        "calls": len(ordered),
+        "min_us": ordered[0] * to_us,
+        "median_us": statistics.median(ordered) * to_us,
+        "p95_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * to_us,
+        "mean_us": statistics.fmean(ordered) * to_us,
+    }
+
+
+def bench_hit_test(size: int, repeat: int) -> dict:
+    """Mouse down with the select tool on empty canvas (full scan) and on the top shape."""
+    state = make_state(size)
+    top = state.shapes[-1]
+    miss, hit = [], []
+    for _ in range(repeat):
+        state.selected_ids, state.selected_shape_id = [], ""
+        start = time.perf_counter_ns()
+        call(EditorState.handle_mouse_down, state, {"x": -50_000, "y": -50_000})
+        miss.append(time.perf_counter_ns() - start)
+        call(EditorState.handle_mouse_up, state, {"x": -50_000, "y": -50_000})
+
+        state.selected_ids, state.selected_shape_id = [], ""
+        start = time.perf_counter_ns()
+        call(EditorState.handle_mouse_down, state, {"x": top["x"] + 1, "y": top["y"] + 1})
+        hit.append(time.perf_counter_ns() - start)
+        call(EditorState.handle_mouse_up, state, {"x": top["x"] + 1, "y": top["y"] + 1})
+    return {"miss": measure(miss), "hit_top": measure(hit)}
+
+
+def bench_drag(size: int, repeat: int) -> dict:
+    """Per-tick cost of dragging the top shape."""
+    state = make_state(size)
+    top = state.shapes[-1]
+    x, y = top["x"] + 1, top["y"] + 1
+    call(EditorState.handle_mouse_down, state, {"x": x, "y": y})
+    ticks = []
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        call(EditorState.handle_mouse_move, state, {"x": x + i, "y": y + i})
+        ticks.append(time.perf_counter_ns() - start)
+    start = time.perf_counter_ns()
+    call(EditorState.handle_mouse_up, state, {"x": x + repeat, "y": y + repeat})
+    return {"move": measure(ticks), "mouse_up": measure([time.perf_counter_ns() - start])}
+
+
+def bench_group_drag(size: int, repeat: int, group: int = 300) -> dict:
+    """Per-tick cost of dragging a multi-selection of up to ``group`` shapes."""
+    state = make_state(size)
+    selected = state.shapes[-group:]
+    select(state, [s["id"] for s in selected])
+    top = selected[-1]
+    x, y = top["x"] + 1, top["y"] + 1
+    call(EditorState.handle_mouse_down, state, {"x": x, "y": y})
+    ticks = []
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        call(EditorState.handle_mouse_move, state, {"x": x + i, "y": y + i})
+        ticks.append(time.perf_counter_ns() - start)
+    start = time.perf_counter_ns()
+    call(EditorState.handle_mouse_up, state, {"x": x + repeat, "y": y + repeat})
+    return {"move": measure(ticks), "mouse_up": measure([time.perf_counter_ns() - start])}
+
+
+def bench_pencil(size: int, repeat: int, points: int = 200) -> dict:
+    """Per-sample and commit cost of a pencil stroke."""
+    state = make_state(size)
+    state.current_tool = "pencil"
+    samples, commits = [], []
+    # Every stroke already yields ``points`` samples, so draw fewer strokes.
+    for _ in range(max(1, repeat // 10)):
+        call(EditorState.handle_mouse_down, state, {"x": 0, "y": 0})
+        for i in range(1, points):
+            start = time.perf_counter_ns()
+            call(EditorState.handle_mouse_move, state, {"x": i, "y": (i * 7) % 50})
+            samples.append(time.perf_counter_ns() - start)
+        start = time.perf_counter_ns()
+        call(EditorState.handle_mouse_up, state, {"x": points, "y": 0})
+        commits.append(time.perf_counter_ns() - start)
+    return {"sample": measure(samples), "commit": measure(commits)}
+
+
+def bench_undo_redo(size: int, repeat: int) -> dict:
+    """Undo followed by redo with a single-step history."""
+    state = make_state(size)
+    select(state, [state.shapes[0]["id"]])
+    call(EditorState.delete_selected, state)
+    undo, redo = [], []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        call(EditorState.undo, state)
+        undo.append(time.perf_counter_ns() - start)
+        start = time.perf_counter_ns()
+        call(EditorState.redo, state)
+        redo.append(time.perf_counter_ns() - start)
+    return {"undo": measure(undo), "redo": measure(redo)}
+
+
+def bench_update_property(size: int, repeat: int) -> dict:
+    """Changing the fill of the selected shape."""
+    state = make_state(size)
+    select(state, [state.shapes[len(state.shapes) // 2]["id"]])
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        call(EditorState.update_property, state, "fill", f"#{i % 256:02x}0000")
+        timings.append(time.perf_counter_ns() - start)
+        # Keep history from growing into the measurement.
+        state._past = []
+    return {"fill": measure(timings)}
+
+
+def bench_ai_ops(size: int, repeat: int, batch: int = 100) -> dict:
+    """Running a batch of addRect operations through run_ai_ops."""
+    ops = json.dumps(
+        [{"op": "addRect", "x": i, "y": i, "width": 10, "height": 10} for i in range(batch)]
+    )
+    timings = []
+    for _ in range(repeat):
+        state = make_state(size)
+        state.ai_ops_json = ops
+        start = time.perf_counter_ns()
+        call(EditorState.run_ai_ops, state)
+        timings.append(time.perf_counter_ns() - start)
+    return {f"add_{batch}_rects": measure(timings)}
+
+
+BENCHMARKS = {
+    "handle_mouse_down": bench_hit_test,
+    "handle_mouse_move_drag": bench_drag,
+    "group_drag": bench_group_drag,
+    "pencil_stroke": bench_pencil,
+    "undo_redo": bench_undo_redo,
+    "update_property": bench_update_property,
+    "run_ai_ops": bench_ai_ops,
+}
+
+
+def repeats_for(size: int, base: int) -> int:
+    """Scale the repeat count down on large boards to keep the run time bounded."""
+    return max(3, min(base, base * 1_000 // max(size, 1)))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(report: dict, baseline: dict):
+    """Print the median change of every measurement against a previous report."""
+    print(f"\nComparison against {baseline.get('meta', {}).get('revision') or 'baseline'}:")
+    for size, benches in report["results"].items():
+        for bench, groups in benches.items():
+            for name, stats in groups.items():
+                old = baseline.get("results", {}).get(size, {}).get(bench, {}).get(name)
+                if not old:
+                    continue
+                change = (stats["median_us"] - old["median_us"]) / old["median_us"] * 100
+                print(f"  {size:>6} {bench}.{name}: {old['median_us']:.1f} -> {stats['median_us']:.1f} us ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EditorState handlers without a browser.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Board sizes in shapes")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Run a subset of benchmarks")
+    parser.add_argument("--repeat", type=int, default=50, help="Repeats at 1k shapes (scaled by size)")
+    parser.add_argument("--out", type=Path, help="Write the JSON report to this file")
+    parser.add_argument("--compare", type=Path, help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": {},
+    }
+    for size in args.sizes:
+        repeat = repeats_for(size, args.repeat)
+        results = report["results"][str(size)] = {}
+        for name in args.only or BENCHMARKS:
+            started = time.perf_counter()
+            results[name] = BENCHMARKS[name](size, repeat)
+            print(f"{size:>6} shapes  {name:<24} {time.perf_counter() - started:6.2f}s")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
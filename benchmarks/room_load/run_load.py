@@ -0,0 +1,219 @@
+"""Websocket load generator for a shared room.
+
+Connects N simulated clients to a running backend, joins them all to one
+``?room=`` id and has each replay draw, drag and pencil gestures through the
+same socket events and EditorState handlers the browser uses. Reports the
+event-to-broadcast latency seen by the other clients in the room, bytes
+exchanged per client and, given the server's PID, its CPU usage.
+
+    poetry run reflex run --backend-only
+    poetry run python benchmarks/room_load/run_load.py --clients 20 --duration 30 --server-pid <pid>
+
+Requires the asyncio Socket.IO client: ``pip install "python-socketio[asyncio_client]"``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import socketio
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from reflex import constants
+from reflex.state import State
+
+from codoc_in_vecdraw.states.editor_state import EditorState
+
+ROOT_STATE = State.get_full_name()
+EDITOR_STATE = EditorState.get_full_name()
+
+# Each client's x coordinates come from its own band, so the value of
+# current_x in a broadcast identifies which client's event produced it.
+X_BAND = 1000
+
+SHAPE_TOOLS = ["rectangle", "ellipse", "triangle", "line"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+class LoadStats:
+    """Measurements shared by all simulated clients."""
+
+    def __init__(self):
+        # current_x value -> perf_counter time it was sent
+        self.sent_at: dict[int, float] = {}
+        self.latencies_ms: list[float] = []
+        self.events_sent = 0
+
+
+class SimClient:
+    """One simulated browser tab in the room."""
+
+    def __init__(self, index: int, args: argparse.Namespace, stats: LoadStats):
+        self.index = index
+        self.args = args
+        self.stats = stats
+        self.token = str(uuid.uuid4())
+        self.rng = random.Random(index)
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.step = 0
+        self.last_shape = (0, 0)
+        self.joined = asyncio.Event()
+        self.router_data = {
+            constants.RouteVar.PATH: "/",
+            constants.RouteVar.QUERY: {"room": args.room},
+            constants.RouteVar.ORIGIN: f"/?room={args.room}",
+        }
+        self.namespace = str(constants.Endpoint.EVENT)
+        self.sio.on(str(constants.SocketEvent.EVENT), self.on_update, namespace=self.namespace)
+
+    async def connect(self):
+        await self.sio.connect(
+            f"{self.args.url}?token={self.token}",
+            socketio_path=self.namespace,
+            namespaces=[self.namespace],
+            transports=["websocket"],
+        )
+        await self.emit(f"{ROOT_STATE}.hydrate")
+        await self.emit(f"{ROOT_STATE}.{constants.CompileVars.ON_LOAD_INTERNAL}")
+
+    async def emit(self, name: str, **payload):
+        event = {
+            "token": self.token,
+            "name": name,
+            "payload": payload,
+            "router_data": self.router_data,
+        }
+        self.bytes_out += len(json.dumps(event))
+        await self.sio.emit(str(constants.SocketEvent.EVENT), event, namespace=self.namespace)
+
+    async def on_update(self, update: dict):
+        received = time.perf_counter()
+        self.bytes_in += len(json.dumps(update))
+        for substate, delta in update.get("delta", {}).items():
+            if substate.endswith("editor_state") and "room_id_rx_state_" in delta:
+                self.joined.set()
+            for key, value in delta.items():
+                if key.startswith("current_x") and isinstance(value, int):
+                    sender = value // X_BAND
+                    sent = self.stats.sent_at.get(value)
+                    if sent is not None and sender != self.index:
+                        self.stats.latencies_ms.append((received - sent) * 1000)
+        # Events chained from the backend (e.g. on_load) are run by the client.
+        for event in update.get("events", []):
+            if not event.get("name", "").startswith("_"):
+                await self.emit(event["name"], **event.get("payload", {}))
+
+    def point(self, x: int, y: int) -> dict:
+        """Build a pointer payload in this client's band and record its send time."""
+        self.step = (self.step + 1) % X_BAND
+        x = self.index * X_BAND + (x + self.step) % X_BAND
+        self.stats.sent_at[x] = time.perf_counter()
+        return {"x": x, "y": y}
+
+    async def pointer(self, handler: str, x: int, y: int):
+        arg = "data" if handler == "handle_mouse_move" else "point"
+        await self.emit(f"{EDITOR_STATE}.{handler}", **{arg: self.point(x, y)})
+        self.stats.events_sent += 1
+        await asyncio.sleep(1 / self.args.rate)
+
+    async def gesture(self, tool: str, moves: int):
+        await self.emit(f"{EDITOR_STATE}.set_tool", tool=tool)
+        if tool == "select":
+            x, y = self.last_shape
+        else:
+            x, y = self.rng.randint(0, 400), self.rng.randint(0, 2000)
+        await self.pointer("handle_mouse_down", x, y)
+        for i in range(moves):
+            await self.pointer("handle_mouse_move", x + i * 3, y + self.rng.randint(-2, 2) + i)
+        await self.pointer("handle_mouse_up", x + moves * 3, y + moves)
+        if tool != "select":
+            self.last_shape = (x + 1, y + 1)
+
+    async def run(self, deadline: float):
+        while time.perf_counter() < deadline:
+            kind = self.rng.choices(["draw", "drag", "pencil"], weights=self.args.mix)[0]
+            if kind == "draw":
+                await self.gesture(self.rng.choice(SHAPE_TOOLS), 10)
+            elif kind == "drag":
+                await self.gesture("select", 20)
+            else:
+                await self.gesture("pencil", 60)
+        await self.sio.disconnect()
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """Return user+system CPU seconds used by a process (Linux /proc only)."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent editors in one shared room.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend URL")
+    parser.add_argument("--room", default=f"load{uuid.uuid4().hex[:6]}", help="Room id to join")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load per client")
+    parser.add_argument("--rate", type=float, default=30.0, help="Pointer events per second per client")
+    parser.add_argument("--mix", type=float, nargs=3, default=[3, 2, 1], metavar=("DRAW", "DRAG", "PENCIL"))
+    parser.add_argument("--server-pid", type=int, help="Backend PID to sample CPU usage from")
+    parser.add_argument("--out", type=Path, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    stats = LoadStats()
+    clients = [SimClient(i, args, stats) for i in range(args.clients)]
+    await asyncio.gather(*(c.connect() for c in clients))
+    await asyncio.wait_for(asyncio.gather(*(c.joined.wait() for c in clients)), timeout=30)
+    print(f"{args.clients} clients joined room '{args.room}', running for {args.duration}s...")
+
+    cpu_start = cpu_seconds(args.server_pid) if args.server_pid else None
+    started = time.perf_counter()
+    await asyncio.gather(*(c.run(started + args.duration) for c in clients))
+    elapsed = time.perf_counter() - started
+    cpu_end = cpu_seconds(args.server_pid) if args.server_pid else None
+
+    lat = stats.latencies_ms
+    report = {
+        "room": args.room,
+        "clients": args.clients,
+        "elapsed_s": elapsed,
+        "events_sent": stats.events_sent,
+        "events_per_s": stats.events_sent / elapsed,
+        "broadcasts_measured": len(lat),
+        "latency_ms": {
+            "p50": percentile(lat, 50),
+            "p95": percentile(lat, 95),
+            "p99": percentile(lat, 99),
+            "mean": statistics.fmean(lat) if lat else 0.0,
+        },
+        "bytes_per_client": {
+            "in": statistics.fmean(c.bytes_in for c in clients),
+            "out": statistics.fmean(c.bytes_out for c in clients),
+        },
+        "server_cpu_percent": (
+            (cpu_end - cpu_start) / elapsed * 100 if cpu_start is not None and cpu_end is not None else None
+        ),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
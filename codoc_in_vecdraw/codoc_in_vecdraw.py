@@ -1,9 +1,16 @@
+import tracemalloc
+
 import reflex as rx
 from codoc_in_vecdraw.components.toolbar import toolbar
 from codoc_in_vecdraw.components.topbar import topbar
 from codoc_in_vecdraw.components.canvas import canvas
 from codoc_in_vecdraw.components.properties_panel import properties_panel
 from codoc_in_vecdraw.states.editor_state import EditorState, PENDING_AI_OPS
+from codoc_in_vecdraw.storage.blob_store import immutable_blob_cache
+from codoc_in_vecdraw.storage.exports import attachment_exports
+from codoc_in_vecdraw.storage.uploads import UPLOAD_ROUTE, upload_endpoint
+from codoc_in_vecdraw.monitoring.metrics import METRICS_ENABLED, instrument_state, metrics_endpoint
+from codoc_in_vecdraw.monitoring import room_stats
 from fastapi import Request
 
 
@@ -11,6 +18,7 @@ def index() -> rx.Component:
     """Main editor interface."""
     return rx.el.main(
         rx.script(src="/export_canvas.js"),
+        rx.script(src="/upload_images.js"),
         # Poll for AI ops every 1 second
         rx.moment(interval=1000, on_change=EditorState.check_pending_ai_ops, display="none"),
         topbar(),
@@ -24,6 +32,14 @@ def index() -> rx.Component:
     )
 
 
+# Opt-in handler timing (VECDRAW_METRICS=1); must wrap the handlers before compiling.
+instrument_state(EditorState)
+# Per-room accounting is only collected when its admin route is enabled.
+if room_stats.ADMIN_TOKEN:
+    room_stats.track_room_state(EditorState)
+if room_stats.TRACEMALLOC_ENABLED:
+    tracemalloc.start()
+
 app = rx.App(
     theme=rx.theme(appearance="light"),
     head_components=[
@@ -34,6 +50,9 @@ app = rx.App(
             rel="stylesheet",
         ),
     ],
+    # Content-addressed uploads never change, so let clients cache them forever;
+    # export files download instead of opening in the tab.
+    api_transformer=[immutable_blob_cache, attachment_exports],
 )
 app.add_page(index, route="/", on_load=EditorState.on_load)
 
@@ -55,4 +74,16 @@ async def push_ai_ops_wrapper(request):
     res = await push_ai_ops(request)
     return JSONResponse(res)
 
-app._api.add_route("/mcp/push_ops", push_ai_ops_wrapper, methods=["POST"])
\ No newline at end of file
+app._api.add_route("/mcp/push_ops", push_ai_ops_wrapper, methods=["POST"])
+
+# Images are streamed to disk here rather than through Reflex's buffering upload endpoint.
+app._api.add_route(UPLOAD_ROUTE, upload_endpoint, methods=["POST"])
+
+if METRICS_ENABLED:
+    if not room_stats.ADMIN_TOKEN:
+        print("VECDRAW_METRICS is set but VECDRAW_ADMIN_TOKEN is not; /metrics will refuse every request")
+    app._api.add_route("/metrics", metrics_endpoint, methods=["GET"])
+
+if room_stats.ADMIN_TOKEN:
+    app.register_lifespan_task(room_stats.sample_rooms_forever)
+    app._api.add_route("/admin/rooms", room_stats.admin_rooms_endpoint, methods=["GET"])
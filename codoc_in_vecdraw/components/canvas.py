@@ -1,6 +1,15 @@
 import reflex as rx
 from codoc_in_vecdraw.states.editor_state import EditorState
-from codoc_in_vecdraw.components.shapes import render_shape, render_preview
+from codoc_in_vecdraw.components.shapes import (
+    render_active_shape,
+    render_group_selection,
+    render_marquee,
+    render_preview,
+    render_selection_overlay,
+    render_shape,
+    render_snap_guide,
+    render_symbol,
+)
 from reflex_mouse_track import mouse_track
 
 GET_COORDS_SCRIPT = """
@@ -17,11 +26,21 @@ GET_COORDS_SCRIPT = """
     
     return {
         x: Math.round(e.clientX - rect.left),
-        y: Math.round(e.clientY - rect.top)
+        y: Math.round(e.clientY - rect.top),
+        shift: !!e.shiftKey
     };
 })()
 """
 
+GET_VIEWPORT_SCRIPT = """
+(function() {
+    var elem = document.getElementById('main-canvas');
+    if (!elem) return {width: window.innerWidth, height: window.innerHeight};
+    var rect = elem.getBoundingClientRect();
+    return {width: Math.round(rect.width), height: Math.round(rect.height)};
+})()
+"""
+
 def canvas() -> rx.Component:
     """The main drawing canvas area."""
     return rx.box(
@@ -30,7 +49,7 @@ def canvas() -> rx.Component:
                 class_name="absolute inset-0 opacity-[0.03] pointer-events-none",
                 style={
                     "backgroundImage": "radial-gradient(circle, #000 1px, transparent 1px)",
-                    "backgroundSize": "20px 20px",
+                    "backgroundSize": f"{EditorState.zoom * 20}px {EditorState.zoom * 20}px",
                     "backgroundPosition": f"{EditorState.pan_x}px {EditorState.pan_y}px",
                 },
             ),
@@ -38,12 +57,27 @@ def canvas() -> rx.Component:
                 rx.el.rect(
                     width="100%", height="100%", fill="transparent", id="canvas-bg"
                 ),
+                # Each symbol is defined once; instances on the board <use> it
+                rx.el.defs(rx.foreach(EditorState.symbols, render_symbol)),
+                rx.el.style(EditorState.active_layer_css),
                 rx.el.g(
-                    rx.foreach(EditorState.shapes, render_shape),
+                    # Static layer: the whole board, untouched by selection and drags
+                    rx.el.g(rx.foreach(EditorState.shapes, render_shape), id="static-layer"),
+                    # Active layer: the shapes being dragged, live, and the selection overlay
+                    rx.el.g(
+                        rx.foreach(EditorState.lifted_shapes, render_active_shape),
+                        render_selection_overlay(),
+                        id="active-layer",
+                    ),
+                    render_group_selection(),
+                    rx.foreach(EditorState.snap_guides, render_snap_guide),
+                    render_marquee(),
                     rx.cond(EditorState.is_drawing, render_preview(), rx.fragment()),
                     style={
-                        "pointerEvents": rx.cond(EditorState.is_drawing, "none", "auto"),
-                        "transform": f"translate({EditorState.pan_x}px, {EditorState.pan_y}px)",
+                        "pointerEvents": rx.cond(
+                            EditorState.is_drawing | EditorState.is_marquee, "none", "auto"
+                        ),
+                        "transform": f"translate({EditorState.pan_x}px, {EditorState.pan_y}px) scale({EditorState.zoom})",
                     },
                 ),
                 width="100%",
@@ -64,6 +98,7 @@ def canvas() -> rx.Component:
                 )
             )
         },
+        on_mount=rx.call_script(GET_VIEWPORT_SCRIPT, callback=EditorState.set_viewport),
         on_mouse_down=rx.call_script(GET_COORDS_SCRIPT, callback=EditorState.handle_mouse_down),
         on_mouse_move=rx.call_script(GET_COORDS_SCRIPT, callback=EditorState.handle_mouse_move),
         on_mouse_up=rx.call_script(GET_COORDS_SCRIPT, callback=EditorState.handle_mouse_up),
@@ -2,13 +2,22 @@ import reflex as rx
 from codoc_in_vecdraw.states.editor_state import EditorState
 
 
+# Milliseconds a colour picker must rest before its value is applied; every
+# applied paint is an undo step and may add a room style entry.
+COLOR_DEBOUNCE_MS = 300
+
+
 def property_input(label: str, prop: str, type_: str = "text") -> rx.Component:
     """Helper to create a property input field."""
+    if type_ == "color":
+        on_change = lambda val: EditorState.update_property(prop, val).debounce(COLOR_DEBOUNCE_MS)
+    else:
+        on_change = lambda val: EditorState.update_property(prop, val)
     return rx.el.div(
         rx.el.label(label, class_name="block text-xs font-medium text-gray-500 mb-1"),
         rx.el.input(
             type=type_,
-            on_change=lambda val: EditorState.update_property(prop, val),
+            on_change=on_change,
             class_name="w-full text-sm border border-gray-200 rounded-md px-2 py-1.5 focus:border-violet-500 focus:ring-1 focus:ring-violet-500 outline-none",
             default_value=EditorState.selected_shape[prop],
             key=EditorState.selected_shape["id"] + prop,
@@ -45,6 +54,50 @@ def stroke_width_control() -> rx.Component:
     )
 
 
+def shared_style_toggle() -> rx.Component:
+    """Checkbox routing paint edits to the style entry shared with other shapes."""
+    return rx.el.label(
+        rx.el.input(
+            type="checkbox",
+            checked=EditorState.restyle_shared,
+            on_change=EditorState.set_restyle_shared,
+            class_name="mr-2 accent-violet-600",
+        ),
+        "Restyle every shape with this style",
+        class_name="flex items-center text-xs text-gray-500 mb-4",
+    )
+
+
+def stroke_settings() -> rx.Component:
+    """Room-wide simplification settings for pencil strokes."""
+    return rx.el.div(
+        rx.el.label(
+            "Stroke Smoothing",
+            class_name="block text-xs font-medium text-gray-500 mb-1",
+        ),
+        rx.el.select(
+            rx.el.option("Exact (every sample)", value="exact"),
+            rx.el.option("Fine", value="fine"),
+            rx.el.option("Balanced", value="balanced"),
+            rx.el.option("Compact", value="compact"),
+            value=EditorState.stroke_fidelity,
+            on_change=EditorState.set_stroke_fidelity,
+            class_name="w-full text-sm border border-gray-200 rounded-md px-2 py-1.5 focus:border-violet-500 outline-none mb-2",
+        ),
+        rx.el.label(
+            rx.el.input(
+                type="checkbox",
+                checked=EditorState.keep_raw_points,
+                on_change=EditorState.set_keep_raw_points,
+                class_name="mr-2 accent-violet-600",
+            ),
+            "Keep raw points",
+            class_name="flex items-center text-xs text-gray-500",
+        ),
+        class_name="mb-4",
+    )
+
+
 def properties_panel() -> rx.Component:
     """The right-side properties panel."""
     return rx.el.aside(
@@ -85,35 +138,95 @@ def properties_panel() -> rx.Component:
                             rx.fragment(
                                 property_input("Stroke Color", "stroke", "color"),
                                 stroke_width_control(),
+                                stroke_settings(),
+                                rx.el.button(
+                                    rx.icon("spline", class_name="w-4 h-4 mr-2"),
+                                    "Re-simplify",
+                                    on_click=EditorState.resimplify_selected,
+                                    class_name="flex items-center justify-center w-full px-4 py-2 mb-2 bg-gray-50 text-gray-700 rounded-lg hover:bg-gray-100 transition-colors text-sm font-medium",
+                                ),
                             ),
                         ),
                         (
                             "image",
                             rx.fragment(),
                         ),
+                        (
+                            "instance",
+                            rx.el.button(
+                                rx.icon("unlink", class_name="w-4 h-4 mr-2"),
+                                "Detach Instance",
+                                on_click=EditorState.detach_instances,
+                                class_name="flex items-center justify-center w-full px-4 py-2 mb-4 bg-gray-50 text-gray-700 rounded-lg hover:bg-gray-100 transition-colors text-sm font-medium",
+                            ),
+                        ),
                         rx.fragment(
                             property_input("Fill Color", "fill", "color"),
                             property_input("Stroke Color", "stroke", "color"),
                             stroke_width_control(),
                         ),
                     ),
+                    rx.cond(
+                        (EditorState.selected_shape["type"] != "image")
+                        & (EditorState.selected_shape["type"] != "instance"),
+                        shared_style_toggle(),
+                    ),
+                    rx.el.div(
+                        rx.cond(
+                            EditorState.selected_ids.length() > 1,
+                            rx.el.button(
+                                rx.icon("group", class_name="w-4 h-4 mr-2"),
+                                "Group",
+                                on_click=EditorState.group_selected,
+                                class_name="flex flex-1 items-center justify-center px-4 py-2 bg-gray-50 text-gray-700 rounded-lg hover:bg-gray-100 transition-colors text-sm font-medium",
+                            ),
+                        ),
+                        rx.cond(
+                            EditorState.selected_shape["groups"].length() > 0,
+                            rx.el.button(
+                                rx.icon("ungroup", class_name="w-4 h-4 mr-2"),
+                                "Ungroup",
+                                on_click=EditorState.ungroup_selected,
+                                class_name="flex flex-1 items-center justify-center px-4 py-2 bg-gray-50 text-gray-700 rounded-lg hover:bg-gray-100 transition-colors text-sm font-medium",
+                            ),
+                        ),
+                        class_name="flex gap-2 mb-2",
+                    ),
+                    rx.cond(
+                        (EditorState.selected_ids.length() > 1)
+                        | (EditorState.selected_shape["type"] != "instance"),
+                        rx.el.button(
+                            rx.icon("component", class_name="w-4 h-4 mr-2"),
+                            "Make Symbol",
+                            on_click=EditorState.make_symbol,
+                            class_name="flex items-center justify-center w-full px-4 py-2 mb-2 bg-gray-50 text-gray-700 rounded-lg hover:bg-gray-100 transition-colors text-sm font-medium",
+                        ),
+                    ),
                     rx.el.button(
                         rx.icon("trash-2", class_name="w-4 h-4 mr-2"),
-                        "Delete Shape",
+                        rx.cond(
+                            EditorState.selected_ids.length() > 1,
+                            f"Delete {EditorState.selected_ids.length()} Shapes",
+                            "Delete Shape",
+                        ),
                         on_click=EditorState.delete_selected,
                         class_name="flex items-center justify-center w-full px-4 py-2 bg-red-50 text-red-600 rounded-lg hover:bg-red-100 transition-colors text-sm font-medium",
                     ),
                     class_name="animate-in fade-in slide-in-from-right-4 duration-200",
                 ),
-                rx.el.div(
-                    rx.icon(
-                        "mouse-pointer-click", class_name="w-8 h-8 text-gray-300 mb-2"
-                    ),
-                    rx.el.p(
-                        "Select a shape to edit properties",
-                        class_name="text-sm text-gray-400 text-center",
+                rx.cond(
+                    EditorState.current_tool == "pencil",
+                    stroke_settings(),
+                    rx.el.div(
+                        rx.icon(
+                            "mouse-pointer-click", class_name="w-8 h-8 text-gray-300 mb-2"
+                        ),
+                        rx.el.p(
+                            "Select a shape to edit properties",
+                            class_name="text-sm text-gray-400 text-center",
+                        ),
+                        class_name="flex flex-col items-center justify-center h-64",
                     ),
-                    class_name="flex flex-col items-center justify-center h-64",
                 ),
             ),
             class_name="p-4",
@@ -1,107 +1,256 @@
 import reflex as rx
+from codoc_in_vecdraw.rendering.lod import MIN_TEXT_PIXELS
 from codoc_in_vecdraw.states.editor_state import Shape, EditorState
 
 
-def render_selection_overlay(shape: Shape) -> rx.Component:
-    """Render the selection handles and border for a selected shape."""
+def selection_handle(x, y, cursor: str) -> rx.Component:
+    """Render one square resize handle centered on (x, y)."""
+    return rx.el.rect(
+        x=x - 4,
+        y=y - 4,
+        width=8,
+        height=8,
+        fill="white",
+        stroke="#7c3aed",
+        stroke_width=1,
+        class_name=cursor,
+    )
+
+
+def render_member_outline(shape: Shape) -> rx.Component:
+    """Outline one member of a multi-selection; the group box carries the handles."""
     return rx.cond(
-        shape["id"] == EditorState.selected_shape_id,
-        rx.match(
-            shape["type"],
-            (
-                "line",
-                rx.fragment(
-                    rx.el.circle(
-                        cx=shape["x"],
-                        cy=shape["y"],
-                        r=4,
-                        fill="white",
-                        stroke="#7c3aed",
-                        stroke_width=2,
-                        class_name="cursor-move",
-                    ),
-                    rx.el.circle(
-                        cx=shape["end_x"],
-                        cy=shape["end_y"],
-                        r=4,
-                        fill="white",
-                        stroke="#7c3aed",
-                        stroke_width=2,
-                        class_name="cursor-move",
-                    ),
-                ),
+        shape["type"] == "line",
+        rx.fragment(
+            rx.el.circle(cx=shape["x"], cy=shape["y"], r=3, fill="#7c3aed", pointer_events="none"),
+            rx.el.circle(cx=shape["end_x"], cy=shape["end_y"], r=3, fill="#7c3aed", pointer_events="none"),
+        ),
+        rx.el.rect(
+            x=shape["x"] - 2,
+            y=shape["y"] - 2,
+            width=shape["width"] + 4,
+            height=shape["height"] + 4,
+            fill="none",
+            stroke="#7c3aed",
+            stroke_width=1,
+            stroke_dasharray="4,4",
+            pointer_events="none",
+        ),
+    )
+
+
+def render_selection_overlay() -> rx.Component:
+    """Render the selection border and handles once, over the active shapes."""
+    return rx.cond(
+        EditorState.selected_ids.length() > 1,
+        rx.foreach(EditorState.active_shapes, render_member_outline),
+        rx.foreach(EditorState.active_shapes, render_single_selection),
+    )
+
+
+def render_group_selection() -> rx.Component:
+    """Render the box and resize handles around a multi-shape selection."""
+    box = EditorState.selection_bounds
+    return rx.cond(
+        EditorState.selected_ids.length() > 1,
+        rx.el.g(
+            rx.el.rect(
+                x=box["x"] - 4,
+                y=box["y"] - 4,
+                width=box["width"] + 8,
+                height=box["height"] + 8,
+                fill="none",
+                stroke="#7c3aed",
+                stroke_width=1,
+                pointer_events="none",
             ),
+            selection_handle(box["x"], box["y"], "cursor-nw-resize"),
+            selection_handle(box["x"] + box["width"], box["y"], "cursor-ne-resize"),
+            selection_handle(box["x"] + box["width"], box["y"] + box["height"], "cursor-se-resize"),
+            selection_handle(box["x"], box["y"] + box["height"], "cursor-sw-resize"),
+        ),
+        rx.fragment(),
+    )
+
+
+def render_snap_guide(guide: dict) -> rx.Component:
+    """Render one alignment or spacing guide of the current snap."""
+    return rx.el.line(
+        x1=guide["x1"],
+        y1=guide["y1"],
+        x2=guide["x2"],
+        y2=guide["y2"],
+        stroke="#ec4899",
+        stroke_width=1,
+        pointer_events="none",
+        custom_attrs={"vectorEffect": "non-scaling-stroke"},
+    )
+
+
+def render_marquee() -> rx.Component:
+    """Render the rubber-band rectangle of a marquee selection."""
+    return rx.cond(
+        EditorState.is_marquee,
+        rx.el.rect(
+            x=rx.cond(
+                EditorState.start_x < EditorState.current_x,
+                EditorState.start_x,
+                EditorState.current_x,
+            ),
+            y=rx.cond(
+                EditorState.start_y < EditorState.current_y,
+                EditorState.start_y,
+                EditorState.current_y,
+            ),
+            width=abs(EditorState.current_x - EditorState.start_x),
+            height=abs(EditorState.current_y - EditorState.start_y),
+            fill="#7c3aed",
+            fill_opacity=0.08,
+            stroke="#7c3aed",
+            stroke_width=1,
+            pointer_events="none",
+        ),
+        rx.fragment(),
+    )
+
+
+def render_single_selection(shape: Shape) -> rx.Component:
+    """Render the handles and border of the only selected shape."""
+    return rx.match(
+        shape["type"],
+        (
+            "line",
             rx.fragment(
-                rx.el.rect(
-                    x=shape["x"] - 2,
-                    y=shape["y"] - 2,
-                    width=shape["width"] + 4,
-                    height=shape["height"] + 4,
-                    fill="none",
-                    stroke="#7c3aed",
-                    stroke_width=1,
-                    stroke_dasharray="4,4",
-                    pointer_events="none",
-                ),
-                rx.el.rect(
-                    x=shape["x"] - 4,
-                    y=shape["y"] - 4,
-                    width=8,
-                    height=8,
-                    fill="white",
-                    stroke="#7c3aed",
-                    stroke_width=1,
-                    class_name="cursor-nw-resize",
-                ),
-                rx.el.rect(
-                    x=shape["x"] + shape["width"] - 4,
-                    y=shape["y"] - 4,
-                    width=8,
-                    height=8,
+                rx.el.circle(
+                    cx=shape["x"],
+                    cy=shape["y"],
+                    r=4,
                     fill="white",
                     stroke="#7c3aed",
-                    stroke_width=1,
-                    class_name="cursor-ne-resize",
-                ),
-                rx.el.rect(
-                    x=shape["x"] + shape["width"] - 4,
-                    y=shape["y"] + shape["height"] - 4,
-                    width=8,
-                    height=8,
-                    fill="white",
-                    stroke="#7c3aed",
-                    stroke_width=1,
-                    class_name="cursor-se-resize",
+                    stroke_width=2,
+                    class_name="cursor-move",
                 ),
-                rx.el.rect(
-                    x=shape["x"] - 4,
-                    y=shape["y"] + shape["height"] - 4,
-                    width=8,
-                    height=8,
+                rx.el.circle(
+                    cx=shape["end_x"],
+                    cy=shape["end_y"],
+                    r=4,
                     fill="white",
                     stroke="#7c3aed",
-                    stroke_width=1,
-                    class_name="cursor-sw-resize",
+                    stroke_width=2,
+                    class_name="cursor-move",
                 ),
             ),
         ),
-        rx.fragment(),
+        rx.fragment(
+            rx.el.rect(
+                x=shape["x"] - 2,
+                y=shape["y"] - 2,
+                width=shape["width"] + 4,
+                height=shape["height"] + 4,
+                fill="none",
+                stroke="#7c3aed",
+                stroke_width=1,
+                stroke_dasharray="4,4",
+                pointer_events="none",
+            ),
+            rx.el.rect(
+                x=shape["x"] - 4,
+                y=shape["y"] - 4,
+                width=8,
+                height=8,
+                fill="white",
+                stroke="#7c3aed",
+                stroke_width=1,
+                class_name="cursor-nw-resize",
+            ),
+            rx.el.rect(
+                x=shape["x"] + shape["width"] - 4,
+                y=shape["y"] - 4,
+                width=8,
+                height=8,
+                fill="white",
+                stroke="#7c3aed",
+                stroke_width=1,
+                class_name="cursor-ne-resize",
+            ),
+            rx.el.rect(
+                x=shape["x"] + shape["width"] - 4,
+                y=shape["y"] + shape["height"] - 4,
+                width=8,
+                height=8,
+                fill="white",
+                stroke="#7c3aed",
+                stroke_width=1,
+                class_name="cursor-se-resize",
+            ),
+            rx.el.rect(
+                x=shape["x"] - 4,
+                y=shape["y"] + shape["height"] - 4,
+                width=8,
+                height=8,
+                fill="white",
+                stroke="#7c3aed",
+                stroke_width=1,
+                class_name="cursor-sw-resize",
+            ),
+        ),
     )
 
 
+def render_image_tile(tile: dict) -> rx.Component:
+    """Render one pyramid tile of a tiled image shape."""
+    return rx.el.image(
+        tag="image",
+        custom_attrs={
+            "href": rx.get_upload_url(tile["src"]),
+            "x": tile["x"],
+            "y": tile["y"],
+            "width": tile["width"],
+            "height": tile["height"],
+            "preserveAspectRatio": "none",
+        },
+        key=tile["src"],
+        pointer_events="none",
+    )
+
+
+def shape_paint(shape: Shape) -> dict[str, rx.Var]:
+    """The fill, stroke and stroke width of a shape, from its room style entry if it has one."""
+    style = EditorState.styles[shape["style"]]
+    has_style = shape["style"] != ""
+    return {
+        field: rx.cond(has_style, style[field], shape[field])
+        for field in ("fill", "stroke", "stroke_width")
+    }
+
+
 def render_shape(shape: Shape) -> rx.Component:
-    """Render a single shape based on its type."""
-    is_selected = shape["id"] == EditorState.selected_shape_id
+    """Render a shape of the static layer."""
+    return _render_shape(shape, active=False)
+
+
+def render_active_shape(shape: Shape) -> rx.Component:
+    """Render a dragged shape in the active layer."""
+    return _render_shape(shape, active=True)
+
+
+def _render_shape(shape: Shape, active: bool) -> rx.Component:
+    """Render a single shape based on its type.
+
+    Nothing here reads the selection, so selecting or dragging never touches
+    the static layer; mid-gesture the active layer renders the dragged
+    shapes again with ``active`` set.
+    """
+    paint = shape_paint(shape)
+    cursor = "cursor-move outline-none" if active else "cursor-pointer hover:opacity-80 transition-opacity"
+    # Pencils and images come in a variant for the zoom when one exists
+    lod_variant = EditorState.lod_overrides[shape["id"]]
+    has_lod_variant = EditorState.lod_overrides.contains(shape["id"])
     common_props = {
-        "id": f"shape-{shape['id']}",
-        "stroke": shape["stroke"],
-        "stroke_width": shape["stroke_width"],
-        "fill": shape["fill"],
-        "class_name": rx.cond(
-            is_selected,
-            "cursor-move outline-none",
-            "cursor-pointer hover:opacity-80 transition-opacity",
-        ),
+        "stroke": paint["stroke"],
+        "stroke_width": paint["stroke_width"],
+        "fill": paint["fill"],
+        "class_name": cursor,
     }
     shape_element = rx.match(
         shape["type"],
@@ -144,32 +293,135 @@ def render_shape(shape: Shape) -> rx.Component:
         ),
         (
             "image",
-            rx.el.image(
-                tag="image",
-                # Pass SVG attributes as custom_attrs to avoid validation/filtering by Img component
-                # and to ensure they are passed to the DOM element.
-                # Note: Reflex might still try to validate known props, so we use custom_attrs for safety.
-                # However, custom_attrs usually takes a dict of strings.
-                # Let's try passing them as direct args first, but if they were dropped, maybe they are not valid for Img.
-                # Img has src, alt, etc. It does NOT have x, y, width, height (as simple props maybe?).
-                # Actually width/height are valid for Img.
-                # But href is NOT.
-                # So let's use custom_attrs for href and others.
-                custom_attrs={
-                    "href": rx.get_upload_url(shape["src"]),
-                    "x": shape["x"],
-                    "y": shape["y"],
-                    "width": shape["width"],
-                    "height": shape["height"],
-                    "preserveAspectRatio": "none",
-                },
-                class_name=rx.cond(
-                    is_selected,
-                    "cursor-move outline-none",
-                    "cursor-pointer hover:opacity-80 transition-opacity",
+            rx.cond(
+                shape["tiled"],
+                rx.el.g(
+                    rx.foreach(
+                        EditorState.visible_image_tiles[shape["id"]],
+                        render_image_tile,
+                    ),
+                    # Transparent hit area so the tiled image selects like a plain one
+                    rx.el.rect(
+                        x=shape["x"],
+                        y=shape["y"],
+                        width=shape["width"],
+                        height=shape["height"],
+                        fill="transparent",
+                    ),
+                    class_name=cursor,
+                ),
+                rx.el.image(
+                    tag="image",
+                    # Pass SVG attributes as custom_attrs to avoid validation/filtering by Img component
+                    # and to ensure they are passed to the DOM element.
+                    # Note: Reflex might still try to validate known props, so we use custom_attrs for safety.
+                    # However, custom_attrs usually takes a dict of strings.
+                    # Let's try passing them as direct args first, but if they were dropped, maybe they are not valid for Img.
+                    # Img has src, alt, etc. It does NOT have x, y, width, height (as simple props maybe?).
+                    # Actually width/height are valid for Img.
+                    # But href is NOT.
+                    # So let's use custom_attrs for href and others.
+                    custom_attrs={
+                        # Prefer the downscaled derivative chosen for the shape's size
+                        "href": rx.cond(
+                            has_lod_variant,
+                            rx.get_upload_url(lod_variant),
+                            rx.cond(
+                                shape["display_src"],
+                                rx.get_upload_url(shape["display_src"]),
+                                rx.get_upload_url(shape["src"]),
+                            ),
+                        ),
+                        "x": shape["x"],
+                        "y": shape["y"],
+                        "width": shape["width"],
+                        "height": shape["height"],
+                        "preserveAspectRatio": "none",
+                    },
+                    class_name=cursor,
                 ),
             ),
         ),
+        (
+            "text",
+            rx.cond(
+                shape["height"] * EditorState.zoom < MIN_TEXT_PIXELS,
+                # Too small to read: a bar stands in for the glyphs
+                rx.el.rect(
+                    x=shape["x"],
+                    y=shape["y"] + shape["height"] / 4,
+                    width=shape["width"],
+                    height=shape["height"] / 2,
+                    fill=paint["fill"],
+                    opacity=0.3,
+                ),
+                rx.el.text(
+                    shape["content"],
+                    x=shape["x"],
+                    y=shape["y"],
+                    font_size=shape["height"],
+                    fill=paint["fill"],
+                    dominant_baseline="hanging",
+                    class_name=f"{cursor} select-none",
+                    style={"userSelect": "none"},
+                ),
+            ),
+        ),
+        (
+            "pencil",
+            rx.el.path(
+                d=rx.cond(has_lod_variant, lod_variant, shape["path_data"]),
+                fill="none",
+                stroke=paint["stroke"],
+                stroke_width=paint["stroke_width"],
+                stroke_linecap="round",
+                stroke_linejoin="round",
+                class_name=cursor,
+            ),
+        ),
+        (
+            "instance",
+            rx.el.svg.use(
+                href="#symbol-" + shape["src"],
+                x=shape["x"],
+                y=shape["y"],
+                width=shape["width"],
+                height=shape["height"],
+                class_name=common_props["class_name"],
+            ),
+        ),
+        rx.fragment(),
+    )
+    if active:
+        return rx.el.g(shape_element, key=shape["id"])
+    # The static copy is hidden by id while the shape is lifted into the active layer
+    return rx.el.g(shape_element, id=f"shape-{shape['id']}", key=shape["id"])
+
+
+def render_symbol_shape(shape: Shape) -> rx.Component:
+    """Render a shape inside a symbol definition; symbol shapes are static and carry inline paint."""
+    paint = {"fill": shape["fill"], "stroke": shape["stroke"], "stroke_width": shape["stroke_width"]}
+    return rx.match(
+        shape["type"],
+        ("rectangle", rx.el.rect(x=shape["x"], y=shape["y"], width=shape["width"], height=shape["height"], **paint)),
+        (
+            "ellipse",
+            rx.el.ellipse(
+                cx=shape["x"] + shape["width"] / 2,
+                cy=shape["y"] + shape["height"] / 2,
+                rx=shape["width"] / 2,
+                ry=shape["height"] / 2,
+                **paint,
+            ),
+        ),
+        ("line", rx.el.line(x1=shape["x"], y1=shape["y"], x2=shape["end_x"], y2=shape["end_y"], **paint)),
+        (
+            "triangle",
+            rx.el.polygon(
+                points=f"{shape['x'] + shape['width']/2},{shape['y']} {shape['x']},{shape['y'] + shape['height']} {shape['x'] + shape['width']},{shape['y'] + shape['height']}",
+                **paint,
+            ),
+        ),
         (
             "text",
             rx.el.text(
@@ -179,11 +431,6 @@ def render_shape(shape: Shape) -> rx.Component:
                 font_size=shape["height"],
                 fill=shape["fill"],
                 dominant_baseline="hanging",
-                class_name=rx.cond(
-                    is_selected,
-                    "cursor-move outline-none select-none",
-                    "cursor-pointer hover:opacity-80 transition-opacity select-none",
-                ),
                 style={"userSelect": "none"},
             ),
         ),
@@ -196,16 +443,37 @@ def render_shape(shape: Shape) -> rx.Component:
                 stroke_width=shape["stroke_width"],
                 stroke_linecap="round",
                 stroke_linejoin="round",
-                class_name=rx.cond(
-                    is_selected,
-                    "cursor-move outline-none",
-                    "cursor-pointer hover:opacity-80 transition-opacity",
-                ),
+            ),
+        ),
+        (
+            "image",
+            rx.el.image(
+                tag="image",
+                custom_attrs={
+                    "href": rx.get_upload_url(shape["src"]),
+                    "x": shape["x"],
+                    "y": shape["y"],
+                    "width": shape["width"],
+                    "height": shape["height"],
+                    "preserveAspectRatio": "none",
+                },
             ),
         ),
         rx.fragment(),
     )
-    return rx.el.g(shape_element, render_selection_overlay(shape), key=shape["id"])
+
+
+def render_symbol(item: rx.Var) -> rx.Component:
+    """Define one symbol of the room's table, drawn by every instance through <use>."""
+    symbol_id, symbol = item[0], item[1]
+    return rx.el.svg.symbol(
+        rx.foreach(symbol["shapes"], render_symbol_shape),
+        id="symbol-" + symbol_id,
+        view_box=f"0 0 {symbol['width']} {symbol['height']}",
+        preserve_aspect_ratio="none",
+        overflow="visible",
+        key=symbol_id,
+    )
 
 
 def render_preview() -> rx.Component:
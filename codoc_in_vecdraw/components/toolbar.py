@@ -1,5 +1,6 @@
 import reflex as rx
 from codoc_in_vecdraw.states.editor_state import EditorState
+from codoc_in_vecdraw.storage.uploads import UPLOAD_ROUTE
 
 
 def tool_button(icon_name: str, tool_name: str, label: str) -> rx.Component:
@@ -35,21 +36,17 @@ def toolbar() -> rx.Component:
                 tool_button("minus", "line", "Line"),
                 tool_button("pencil", "pencil", "Pencil"),
                 tool_button("type", "text", "Text"),
-                rx.upload(
-                    rx.el.div(
-                        rx.icon("image", class_name="w-6 h-6 mb-1"),
-                        rx.el.span("Image", class_name="text-xs font-medium"),
-                        class_name="flex flex-col items-center justify-center p-3 rounded-xl hover:bg-gray-100 text-gray-600 transition-colors w-full cursor-pointer",
+                rx.el.button(
+                    rx.icon("image", class_name="w-6 h-6 mb-1"),
+                    rx.el.span("Image", class_name="text-xs font-medium"),
+                    # Files go straight to the streaming blob route, not through the state
+                    on_click=rx.call_script(
+                        f'vecdrawUploadImages(new URL("{UPLOAD_ROUTE}", "{rx.get_upload_url("")}").href)',
+                        callback=EditorState.add_uploaded_images,
                     ),
+                    class_name="flex flex-col items-center justify-center p-3 rounded-xl hover:bg-gray-100 text-gray-600 transition-colors w-full",
+                    title="Image",
                     id="upload1",
-                    on_drop=EditorState.handle_upload,
-                    no_click=False,
-                    no_drag=True,
-                    padding="0px",
-                    border="0px",
-                    class_name="w-full border-none outline-none",
-                    style={"background": "transparent"},
-                    accept={"image/*": [".png", ".jpg", ".jpeg", ".gif", ".webp"]},
                 ),
                 class_name="flex flex-col gap-2",
             ),
@@ -16,19 +16,64 @@ def topbar() -> rx.Component:
                     rx.el.button(
                         rx.icon("undo-2", class_name="w-4 h-4"),
                         on_click=EditorState.undo,
-                        disabled=~EditorState.past,
+                        disabled=~EditorState.can_undo,
                         class_name="p-2 text-gray-600 hover:bg-gray-100 rounded-lg disabled:opacity-30 disabled:hover:bg-transparent transition-colors",
                         title="Undo",
                     ),
                     rx.el.button(
                         rx.icon("redo-2", class_name="w-4 h-4"),
                         on_click=EditorState.redo,
-                        disabled=~EditorState.future,
+                        disabled=~EditorState.can_redo,
                         class_name="p-2 text-gray-600 hover:bg-gray-100 rounded-lg disabled:opacity-30 disabled:hover:bg-transparent transition-colors",
                         title="Redo",
                     ),
                     class_name="flex items-center gap-1 mr-6 border-r border-gray-200 pr-4",
                 ),
+                rx.el.div(
+                    rx.el.button(
+                        rx.icon("zoom-out", class_name="w-4 h-4"),
+                        on_click=EditorState.zoom_out,
+                        class_name="p-2 text-gray-600 hover:bg-gray-100 rounded-lg transition-colors",
+                        title="Zoom Out",
+                    ),
+                    rx.el.button(
+                        f"{(EditorState.zoom * 100).to(int)}%",
+                        on_click=EditorState.reset_zoom,
+                        class_name="px-2 py-1 text-xs font-medium text-gray-600 hover:bg-gray-100 rounded-lg transition-colors w-14",
+                        title="Reset Zoom",
+                    ),
+                    rx.el.button(
+                        rx.icon("zoom-in", class_name="w-4 h-4"),
+                        on_click=EditorState.zoom_in,
+                        class_name="p-2 text-gray-600 hover:bg-gray-100 rounded-lg transition-colors",
+                        title="Zoom In",
+                    ),
+                    class_name="flex items-center gap-1 mr-6 border-r border-gray-200 pr-4",
+                ),
+                rx.el.div(
+                    rx.el.button(
+                        rx.icon("magnet", class_name="w-4 h-4"),
+                        on_click=EditorState.toggle_snap,
+                        class_name=rx.cond(
+                            EditorState.snap_enabled,
+                            "p-2 text-violet-700 bg-violet-100 rounded-lg transition-colors",
+                            "p-2 text-gray-600 hover:bg-gray-100 rounded-lg transition-colors",
+                        ),
+                        title="Snap to Shapes",
+                    ),
+                    rx.el.button(
+                        rx.icon("grid-3x3", class_name="w-4 h-4"),
+                        on_click=EditorState.toggle_snap_to_grid,
+                        disabled=~EditorState.snap_enabled,
+                        class_name=rx.cond(
+                            EditorState.snap_enabled & EditorState.snap_to_grid,
+                            "p-2 text-violet-700 bg-violet-100 rounded-lg transition-colors",
+                            "p-2 text-gray-600 hover:bg-gray-100 rounded-lg disabled:opacity-30 transition-colors",
+                        ),
+                        title="Snap to Grid",
+                    ),
+                    class_name="flex items-center gap-1 mr-6 border-r border-gray-200 pr-4",
+                ),
                 rx.el.span(
                     f"Mode: ",
                     rx.el.span(
@@ -67,6 +112,30 @@ def topbar() -> rx.Component:
                     on_click=EditorState.toggle_ai_modal,
                     class_name="flex items-center text-sm font-medium bg-emerald-100 text-emerald-700 px-3 py-1.5 rounded-lg hover:bg-emerald-200 transition-colors mr-2",
                 ),
+                rx.upload(
+                    rx.el.button(
+                        rx.cond(
+                            EditorState.is_importing,
+                            rx.icon("loader-circle", class_name="w-4 h-4 mr-2 animate-spin"),
+                            rx.icon("upload", class_name="w-4 h-4 mr-2"),
+                        ),
+                        rx.cond(
+                            EditorState.is_importing,
+                            f"Importing {EditorState.import_progress}%",
+                            "Import",
+                        ),
+                        disabled=EditorState.is_importing,
+                        class_name="flex items-center text-sm font-medium bg-gray-100 text-gray-700 px-3 py-1.5 rounded-lg hover:bg-gray-200 disabled:opacity-60 transition-colors",
+                    ),
+                    id="import_upload",
+                    on_drop=EditorState.handle_import,
+                    multiple=False,
+                    no_drag=True,
+                    padding="0px",
+                    border="0px",
+                    class_name="mr-2",
+                    accept={"application/json": [".json"]},
+                ),
                 rx.menu.root(
                     rx.menu.trigger(
                         rx.el.button(
@@ -77,8 +146,10 @@ def topbar() -> rx.Component:
                     ),
                     rx.menu.content(
                         rx.menu.item("Export as JSON", on_click=rx.call_script(f"window.exportJSON(atob('{EditorState.json_data_base64}'))")),
-                        rx.menu.item("Export as SVG", on_click=rx.call_script("window.exportSVG()")),
-                        rx.menu.item("Export as PNG", on_click=rx.call_script("window.exportPNG()")),
+                        rx.menu.item("Export as binary (.vdoc)", on_click=EditorState.export_document),
+                        rx.menu.item("Export as SVG", on_click=EditorState.export_svg(True)),
+                        rx.menu.item("Export as PNG", on_click=EditorState.export_png(96)),
+                        rx.menu.item("Export as PNG (300 DPI)", on_click=EditorState.export_png(300)),
                     ),
                 ),
                 class_name="flex items-center",
@@ -99,6 +170,8 @@ def topbar() -> rx.Component:
 *   **addEllipse**: `{"op": "addEllipse", "cx": 100, "cy": 100, "rx": 50, "ry": 50, "fill": "blue"}`
 *   **addText**: `{"op": "addText", "x": 10, "y": 10, "content": "Hello", "font_size": 20, "fill": "black"}`
 *   **addLine**: `{"op": "addLine", "x": 10, "y": 10, "end_x": 100, "end_y": 100, "stroke": "black", "stroke_width": 2}`
+*   **defineSymbol**: `{"op": "defineSymbol", "id": "server", "shapes": [{"op": "addRect", "x": 0, "y": 0, "width": 40, "height": 60}]}`
+*   **addInstance**: `{"op": "addInstance", "symbol": "server", "x": 200, "y": 10, "width": 40, "height": 60}` (size defaults to the symbol's; a symbol no instance places by the end of its batch is dropped)
 *   **clear**: `{"op": "clear"}`
                         """),
                         class_name="p-4 bg-gray-50 rounded-md mb-4 text-sm overflow-y-auto max-h-60 border border-gray-200",
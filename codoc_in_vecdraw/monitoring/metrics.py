@@ -0,0 +1,231 @@
+"""Opt-in timing of EditorState handlers and computed vars.
+
+Set ``VECDRAW_METRICS=1`` to wrap every event handler and computed var of a
+state class, recording call counts and latency histograms, plus the size of
+one state delta in ``DELTA_SAMPLE_EVERY`` sent back to clients per room. The
+numbers are served in the Prometheus text format on ``/metrics`` to holders of
+the admin token. A room id is all it takes to join a room, so rooms are
+labelled by a short hash; past ``MAX_ROOM_LABELS`` rooms, newer ones share
+the ``other`` label so the series count stays bounded.
+"""
+
+import dataclasses
+import functools
+import hashlib
+import inspect
+import itertools
+import os
+import time
+from collections import defaultdict
+
+from reflex.event import EventHandler
+from starlette.responses import PlainTextResponse
+
+METRICS_ENABLED = os.environ.get("VECDRAW_METRICS", "").lower() in ("1", "true", "yes")
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Upper bounds of the state delta size buckets, in bytes.
+DELTA_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Serialize one state update in this many to measure delta sizes.
+DELTA_SAMPLE_EVERY = 10
+
+# Rooms given their own label; later rooms are counted under "other".
+MAX_ROOM_LABELS = 500
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the shape Prometheus expects."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            out.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        out.append(f"{name}_sum{{{labels}}} {self.total}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+        return out
+
+
+# (kind, name, room) -> number of calls; kind is "handler" or "computed_var"
+_calls: dict[tuple[str, str, str], int] = defaultdict(int)
+# (kind, name) -> latency histogram in seconds
+_latency: dict[tuple[str, str], Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+# room -> state delta size histogram in bytes
+_delta_bytes: dict[str, Histogram] = defaultdict(lambda: Histogram(DELTA_BUCKETS))
+# Labels of the rooms seen so far, up to MAX_ROOM_LABELS
+_room_labels: set[str] = set()
+_updates = itertools.count()
+
+
+@functools.lru_cache(maxsize=4096)
+def room_label(room: str) -> str:
+    """Return the metric label of a room: a hash that cannot be used to join it."""
+    if not room:
+        return "default"
+    return hashlib.sha256(room.encode()).hexdigest()[:12]
+
+
+def room_of(state) -> str:
+    """Return the label of the room a state instance belongs to."""
+    try:
+        label = room_label(state.room_id)
+    except Exception:
+        return "default"
+    if label not in _room_labels:
+        if len(_room_labels) >= MAX_ROOM_LABELS:
+            return "other"
+        _room_labels.add(label)
+    return label
+
+
+def record_call(kind: str, name: str, room: str, seconds: float):
+    _calls[(kind, name, room)] += 1
+    _latency[(kind, name)].observe(seconds)
+
+
+def record_delta(room: str, size: int):
+    _delta_bytes[room].observe(size)
+
+
+def _timed(kind: str, name: str, fn):
+    """Wrap a state method so each call is timed, keeping its sync/async/generator kind."""
+    if inspect.isasyncgenfunction(fn):
+
+        @functools.wraps(fn)
+        async def wrapper(state, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                async for item in fn(state, *args, **kwargs):
+                    yield item
+            finally:
+                record_call(kind, name, room_of(state), time.perf_counter() - start)
+
+    elif inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def wrapper(state, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(state, *args, **kwargs)
+            finally:
+                record_call(kind, name, room_of(state), time.perf_counter() - start)
+
+    elif inspect.isgeneratorfunction(fn):
+
+        @functools.wraps(fn)
+        def wrapper(state, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                yield from fn(state, *args, **kwargs)
+            finally:
+                record_call(kind, name, room_of(state), time.perf_counter() - start)
+
+    else:
+
+        @functools.wraps(fn)
+        def wrapper(state, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(state, *args, **kwargs)
+            finally:
+                record_call(kind, name, room_of(state), time.perf_counter() - start)
+
+    return wrapper
+
+
+def instrument_state(state_cls):
+    """Time every event handler and computed var of a state class, and its deltas.
+
+    Must run before the app is compiled. Does nothing unless METRICS_ENABLED.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    for name, handler in list(state_cls.event_handlers.items()):
+        # Skip the generic setvar handler, which is not a plain function.
+        if type(handler) is EventHandler:
+            state_cls.event_handlers[name] = dataclasses.replace(
+                handler, fn=_timed("handler", name, handler.fn)
+            )
+
+    for name, var in list(state_cls.computed_vars.items()):
+        # Freeze the dependencies found on the original getter, since the
+        # wrapper hides the attribute accesses Reflex looks for.
+        timed = var._replace(
+            fget=_timed("computed_var", name, var.fget),
+            deps=var._deps(objclass=state_cls),
+            auto_deps=False,
+        )
+        setattr(state_cls, name, timed)
+        state_cls.computed_vars[name] = timed
+        state_cls.vars[name] = timed
+    state_cls._init_var_dependency_dicts()
+
+    as_state_update = state_cls._as_state_update
+
+    async def _as_state_update(self, handler, events, final):
+        update = await as_state_update(self, handler, events, final)
+        if next(_updates) % DELTA_SAMPLE_EVERY == 0:
+            record_delta(room_of(self), len(update.json()))
+        return update
+
+    state_cls._as_state_update = _as_state_update
+
+
+def render_metrics() -> str:
+    """Return all recorded metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP vecdraw_calls_total Calls of EditorState event handlers and computed vars.",
+        "# TYPE vecdraw_calls_total counter",
+    ]
+    for (kind, name, room), count in sorted(_calls.items()):
+        lines.append(f'vecdraw_calls_total{{kind="{kind}",name="{name}",room="{_escape(room)}"}} {count}')
+
+    lines += [
+        "# HELP vecdraw_call_seconds Latency of EditorState event handlers and computed vars.",
+        "# TYPE vecdraw_call_seconds histogram",
+    ]
+    for (kind, name), hist in sorted(_latency.items()):
+        lines += hist.lines("vecdraw_call_seconds", f'kind="{kind}",name="{name}"')
+
+    lines += [
+        f"# HELP vecdraw_state_delta_bytes Size of one in {DELTA_SAMPLE_EVERY} state updates sent to clients.",
+        "# TYPE vecdraw_state_delta_bytes histogram",
+    ]
+    for room, hist in sorted(_delta_bytes.items()):
+        lines += hist.lines("vecdraw_state_delta_bytes", f'room="{_escape(room)}"')
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+async def metrics_endpoint(request):
+    """Serve the recorded metrics for Prometheus to scrape, to holders of the admin token."""
+    from codoc_in_vecdraw.monitoring.room_stats import is_admin
+
+    if not is_admin(request):
+        return PlainTextResponse("forbidden\n", status_code=403)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,231 @@
+"""Per-room memory and payload accounting.
+
+When a worker's memory grows this shows which room is responsible. Every
+room's (or unshared session's) EditorState is tracked weakly as it produces
+updates, and a background task periodically records cheap counts: shapes,
+pencil points, history depth and queued AI ops. One state update in
+``DELTA_SAMPLE_EVERY`` is serialized to track delta payload sizes. Rooms whose
+state is gone are reported for ``STATS_TTL_SECONDS`` after their last update,
+then forgotten. The report is served as JSON on ``/admin/rooms`` to requests
+sending the admin token as ``Authorization: Bearer <token>``. With ``deep=1`` each room's state is
+also measured in bytes. When tracemalloc is running (``VECDRAW_TRACEMALLOC=1``),
+``tracemalloc=1`` adds the top allocation sites and their growth since the
+previous request.
+"""
+
+import asyncio
+import hmac
+import os
+import sys
+import time
+import tracemalloc
+import weakref
+from dataclasses import asdict, dataclass
+
+from starlette.responses import JSONResponse
+
+ADMIN_TOKEN = os.environ.get("VECDRAW_ADMIN_TOKEN", "")
+
+TRACEMALLOC_ENABLED = os.environ.get("VECDRAW_TRACEMALLOC", "").lower() in ("1", "true", "yes")
+
+# Seconds between background samples of the tracked rooms.
+SAMPLE_INTERVAL_SECONDS = 30
+
+# Serialize one state update in this many to measure payload sizes.
+DELTA_SAMPLE_EVERY = 10
+
+# Seconds the numbers of a room whose state is gone are kept after its last update.
+STATS_TTL_SECONDS = 3600
+
+# Allocation sites listed in the tracemalloc report.
+TRACEMALLOC_TOP = 25
+
+
+@dataclass
+class RoomStats:
+    shapes: int = 0
+    pencil_points: int = 0
+    past_snapshots: int = 0
+    future_snapshots: int = 0
+    history_shapes: int = 0
+    pending_ai_ops: int = 0
+    updates: int = 0
+    delta_samples: int = 0
+    delta_bytes_total: int = 0
+    delta_bytes_max: int = 0
+    updated_at: float = 0.0
+    sampled_at: float = 0.0
+    live: bool = True
+
+
+# room -> weak reference to the EditorState instance serving it
+_states: dict[str, weakref.ref] = {}
+_stats: dict[str, RoomStats] = {}
+_last_snapshot: tracemalloc.Snapshot | None = None
+
+
+def room_key(state) -> str:
+    """Return the accounting key of a state: its room, or its session when unshared."""
+    return state.room_id or state.router.session.client_token
+
+
+def track_room_state(state_cls):
+    """Register rooms as their states send updates, and sample update sizes."""
+    as_state_update = state_cls._as_state_update
+
+    async def _as_state_update(self, handler, events, final):
+        update = await as_state_update(self, handler, events, final)
+        room = room_key(self)
+        ref = _states.get(room)
+        if ref is None or ref() is not self:
+            _states[room] = weakref.ref(self)
+        stats = _stats.setdefault(room, RoomStats())
+        stats.updates += 1
+        stats.updated_at = time.time()
+        if stats.updates % DELTA_SAMPLE_EVERY == 1:
+            size = len(update.json())
+            stats.delta_samples += 1
+            stats.delta_bytes_total += size
+            stats.delta_bytes_max = max(stats.delta_bytes_max, size)
+        return update
+
+    state_cls._as_state_update = _as_state_update
+
+
+def _points(shapes) -> int:
+    from codoc_in_vecdraw.rendering.point_codec import point_count
+
+    return sum(point_count(s.get("points")) for s in shapes)
+
+
+def sample_rooms():
+    """Refresh the cheap counters of every tracked room and drop expired ones."""
+    from codoc_in_vecdraw.states.editor_state import PENDING_AI_OPS
+
+    now = time.time()
+    for room, ref in list(_states.items()):
+        stats = _stats.setdefault(room, RoomStats())
+        state = ref()
+        if state is None:
+            # Keep the last numbers around, flagged, until the room is active again.
+            stats.live = False
+            del _states[room]
+            continue
+        shapes = state.shapes
+        stats.shapes = len(shapes)
+        stats.pencil_points = _points(shapes)
+        stats.past_snapshots = len(state._past)
+        stats.future_snapshots = len(state._future)
+        stats.history_shapes = sum(len(shapes) for shapes, *_ in [*state._past, *state._future])
+        stats.pending_ai_ops = len(PENDING_AI_OPS.get(state.room_id or "default", ()))
+        stats.sampled_at = now
+        stats.live = True
+    for room, stats in list(_stats.items()):
+        if room not in _states and now - stats.updated_at > STATS_TTL_SECONDS:
+            del _stats[room]
+
+
+async def sample_rooms_forever():
+    """Lifespan task sampling the tracked rooms every SAMPLE_INTERVAL_SECONDS."""
+    while True:
+        sample_rooms()
+        await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+
+
+def deep_size(obj, seen: set[int] | None = None) -> int:
+    """Approximate the memory held by a container tree, counting shared objects once."""
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size
+
+
+def _room_bytes(state) -> dict[str, int]:
+    seen: set[int] = set()
+    return {
+        "shapes_bytes": deep_size(state.shapes, seen),
+        "history_bytes": deep_size(state._past, seen) + deep_size(state._future, seen),
+    }
+
+
+def _tracemalloc_report() -> list[dict]:
+    """Return the top allocation sites and their growth since the last report."""
+    global _last_snapshot
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+    if _last_snapshot is None:
+        stats = snapshot.statistics("lineno")
+    else:
+        stats = snapshot.compare_to(_last_snapshot, "lineno")
+    _last_snapshot = snapshot
+    return [
+        {
+            "site": str(stat.traceback[0]),
+            "bytes": stat.size,
+            "count": stat.count,
+            "bytes_diff": getattr(stat, "size_diff", 0),
+        }
+        for stat in stats[:TRACEMALLOC_TOP]
+    ]
+
+
+def _rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def build_report(deep: bool = False, trace: bool = False) -> dict:
+    """Assemble the accounting report, optionally with byte sizes and tracemalloc."""
+    rooms = {}
+    for room, stats in sorted(_stats.items()):
+        entry = asdict(stats)
+        entry["delta_bytes_avg"] = (
+            stats.delta_bytes_total / stats.delta_samples if stats.delta_samples else 0
+        )
+        state = _states[room]() if deep and room in _states else None
+        if state is not None:
+            entry.update(_room_bytes(state))
+        rooms[room] = entry
+    report = {"pid": os.getpid(), "rss_bytes": _rss_bytes(), "rooms": rooms}
+    if trace and tracemalloc.is_tracing():
+        report["tracemalloc"] = _tracemalloc_report()
+    return report
+
+
+def is_admin(request) -> bool:
+    """Whether a request sends the admin token as a bearer token, compared in constant time.
+
+    A header rather than a query parameter keeps the token out of access logs.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+async def admin_rooms_endpoint(request):
+    """Serve the per-room accounting report to holders of the admin token."""
+    if not is_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    # The deep modes are slow, but run on the event loop so no handler
+    # mutates a room's shapes while they are being walked.
+    report = build_report(
+        deep=request.query_params.get("deep") == "1",
+        trace=request.query_params.get("tracemalloc") == "1",
+    )
+    return JSONResponse(report)
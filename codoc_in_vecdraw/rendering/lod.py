@@ -0,0 +1,143 @@
+"""Level-of-detail variants of shapes for zoomed-out views.
+
+Zoom is split into a few bands. Below full detail, pencil strokes are drawn
+from a simplified copy of their points, and images from a derivative sized
+for the band's zoom, so an overview of a large board neither ships nor
+draws every vertex and full-size bitmap. Zoomed in, images switch to a
+derivative (or the original) large enough for the zoom. Variants are
+cached per shape version, like the SVG fragments; versions are never reused
+across rooms or processes, and shapes never stamped (version 0) are not cached.
+"""
+
+import math
+from collections import OrderedDict
+from typing import Iterable
+
+from codoc_in_vecdraw.rendering.point_codec import unpack_points
+from codoc_in_vecdraw.rendering.strokes import polyline_path, simplify_points
+
+# Lower zoom bound of each band; band 0 is full detail.
+LOD_BAND_ZOOMS = (0.5, 0.125, 0.0)
+
+# Zoom limits of the canvas.
+MIN_ZOOM = 0.05
+MAX_ZOOM = 8.0
+
+# Simplification tolerance of pencil strokes in screen pixels.
+SCREEN_TOLERANCE = 0.75
+
+# Text drawn smaller than this many screen pixels becomes a placeholder bar.
+MIN_TEXT_PIXELS = 4
+
+LOD_CACHE_SIZE = 50_000
+_lod_cache: OrderedDict[tuple, str] = OrderedDict()
+
+
+def lod_band(zoom: float) -> int:
+    """Return the detail band of a zoom level (0 is full detail)."""
+    for band, lowest in enumerate(LOD_BAND_ZOOMS):
+        if zoom >= lowest:
+            return band
+    return len(LOD_BAND_ZOOMS) - 1
+
+
+def band_zoom(band: int) -> float:
+    """Return the smallest zoom served by a band, never below MIN_ZOOM."""
+    return max(LOD_BAND_ZOOMS[band], MIN_ZOOM)
+
+
+def lod_scale(zoom: float) -> float:
+    """Return the zoom that image variants are sized for.
+
+    Zoomed out it is the highest zoom of the band; zoomed in it is the power
+    of two at or above the zoom, so images sharpen in a few steps rather
+    than on every zoom press.
+    """
+    band = lod_band(zoom)
+    if band > 0:
+        return LOD_BAND_ZOOMS[band - 1]
+    return float(2 ** max(0, math.ceil(math.log2(min(zoom, MAX_ZOOM)))))
+
+
+def _lod_variant(shape: dict, band: int, scale: float) -> str:
+    if shape["type"] == "pencil":
+        if band == 0:
+            return ""
+        return polyline_path(simplify_points(unpack_points(shape["points"]), SCREEN_TOLERANCE / band_zoom(band)))
+    from codoc_in_vecdraw.storage.derivatives import pick_display_src
+
+    # Nothing big enough means the original upload
+    src = pick_display_src(shape["src"], shape["width"], shape["height"], scale) or shape["src"]
+    return "" if src == (shape.get("display_src") or shape["src"]) else src
+
+
+def lod_variant(shape: dict, band: int, scale: float) -> str:
+    """Return a pencil's simplified path data or an image's source for a band and scale.
+
+    An empty string means the shape is drawn as it is.
+    """
+    version = shape.get("version")
+    if not version:
+        return _lod_variant(shape, band, scale)
+    key = (shape["id"], version, band, scale)
+    variant = _lod_cache.get(key)
+    if variant is not None:
+        _lod_cache.move_to_end(key)
+        return variant
+    variant = _lod_variant(shape, band, scale)
+    _lod_cache[key] = variant
+    if len(_lod_cache) > LOD_CACHE_SIZE:
+        _lod_cache.popitem(last=False)
+    return variant
+
+
+def _has_variants(shape: dict) -> bool:
+    return shape["type"] == "pencil" or (shape["type"] == "image" and not shape.get("tiled"))
+
+
+class LodOverrides:
+    """The path data or image source to draw for each shape at one band and scale.
+
+    Built once per zoom step; edits then update only the shapes they touch.
+    """
+
+    def __init__(self, shapes: list[dict], band: int, scale: float):
+        self.band = band
+        self.scale = scale
+        self.shapes = shapes
+        self.size = len(shapes)
+        self.overrides: dict[str, str] = {}
+        if self.active:
+            for shape in shapes:
+                self._set(shape)
+
+    @property
+    def active(self) -> bool:
+        """Whether any shape can be drawn differently at this band and scale."""
+        return self.band > 0 or self.scale > 1
+
+    def is_current(self, shapes: list[dict], band: int, scale: float) -> bool:
+        """Whether the overrides were built or updated for this list at this band and scale."""
+        return self.shapes is shapes and self.size == len(shapes) and self.band == band and self.scale == scale
+
+    def _set(self, shape: dict) -> bool:
+        variant = lod_variant(shape, self.band, self.scale) if _has_variants(shape) else ""
+        if not variant:
+            return self.overrides.pop(shape["id"], None) is not None
+        if self.overrides.get(shape["id"]) == variant:
+            return False
+        self.overrides[shape["id"]] = variant
+        return True
+
+    def update(self, shapes: list[dict], changed: Iterable[dict], removed: Iterable[str] = ()) -> bool:
+        """Follow an edit of ``shapes``; return whether any override changed."""
+        self.shapes = shapes
+        self.size = len(shapes)
+        if not self.active:
+            return False
+        updated = False
+        for shape_id in removed:
+            updated = self.overrides.pop(shape_id, None) is not None or updated
+        for shape in changed:
+            updated = self._set(shape) or updated
+        return updated
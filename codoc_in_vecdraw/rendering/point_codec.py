@@ -0,0 +1,114 @@
+"""Compact storage of pencil stroke points.
+
+Points used to be kept as one ``{"x": .., "y": ..}`` dict per sample, a few
+hundred bytes each in CPython and deep-copied into every history entry.
+Shapes now hold them as a short immutable string: the first point followed
+by the delta to each next point, as a packed integer array, base64 encoded.
+Deltas between pointer samples are small, so most strokes fit 16-bit
+integers. Strings are shared rather than copied by ``deepcopy`` and go over
+the wire as is.
+
+Every reader goes through ``unpack_points``, which also accepts the old
+list-of-dicts form, so existing documents keep loading; ``expand_points``
+turns shapes back into that form for JSON export.
+"""
+
+import base64
+import sys
+from array import array
+
+_INT16_RANGE = range(-32768, 32768)
+
+# Array typecodes a packed string can start with: 16-bit, else 32-bit deltas.
+PACKED_TYPECODES = ("h", "i")
+
+
+def _flat(points) -> array:
+    """Interleave x and y of dict points as [x0, y0, dx1, dy1, ...]."""
+    values = array("i")
+    prev_x = prev_y = 0
+    for p in points:
+        x, y = int(p["x"]), int(p["y"])
+        values.append(x - prev_x)
+        values.append(y - prev_y)
+        prev_x, prev_y = x, y
+    return values
+
+
+def pack_points(points) -> str:
+    """Encode points (dicts or an already packed string) in the packed form."""
+    if isinstance(points, str):
+        return points
+    if not points:
+        return ""
+    values = _flat(points)
+    if min(values) in _INT16_RANGE and max(values) in _INT16_RANGE:
+        values = array("h", values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.typecode + base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _deltas(packed: str) -> array:
+    values = array(packed[0])
+    values.frombytes(base64.b64decode(packed[1:]))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def unpack_xy(points) -> tuple[list[int], list[int]]:
+    """Return the absolute x and y coordinates of packed or legacy points."""
+    if not points:
+        return [], []
+    if not isinstance(points, str):
+        return [int(p["x"]) for p in points], [int(p["y"]) for p in points]
+    values = _deltas(points)
+    xs, ys = [], []
+    x = y = 0
+    for i in range(0, len(values), 2):
+        x += values[i]
+        y += values[i + 1]
+        xs.append(x)
+        ys.append(y)
+    return xs, ys
+
+
+def unpack_points(points) -> list[dict[str, int]]:
+    """Decode packed points, or pass the legacy list-of-dicts form through."""
+    if not isinstance(points, str):
+        return list(points or [])
+    xs, ys = unpack_xy(points)
+    return [{"x": x, "y": y} for x, y in zip(xs, ys)]
+
+
+def point_count(points) -> int:
+    """Return the number of points without decoding them."""
+    if not isinstance(points, str):
+        return len(points or ())
+    if not points:
+        return 0
+    size = 2 if points[0] == "h" else 4
+    return len(base64.b64decode(points[1:])) // (2 * size)
+
+
+def translate_points(points, dx: int, dy: int) -> str:
+    """Move packed points by (dx, dy); only the leading absolute point changes."""
+    packed = pack_points(points)
+    if not packed:
+        return packed
+    values = _deltas(packed)
+    x, y = values[0] + dx, values[1] + dy
+    if values.typecode == "h" and (x not in _INT16_RANGE or y not in _INT16_RANGE):
+        values = array("i", values)
+    values[0], values[1] = x, y
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.typecode + base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def expand_points(shape: dict) -> dict:
+    """Return the shape with its points in the JSON list-of-dicts form."""
+    if isinstance(shape.get("points"), str):
+        return {**shape, "points": unpack_points(shape["points"])}
+    return shape
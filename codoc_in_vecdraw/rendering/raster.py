@@ -0,0 +1,295 @@
+"""Tile-parallel PNG rasterization of EditorState shape documents.
+
+The requested region is cut into square tiles which are drawn with Pillow in
+a process pool. Tiles are stitched one horizontal band at a time and streamed
+straight into a PNG encoder, so peak memory is bounded by
+``tile_size * output_width`` rather than by the size of the whole image; the
+output width and height are capped so that bound holds for any document.
+Images are cropped to the part a tile shows before they are scaled.
+"""
+
+import multiprocessing
+import re
+import threading
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from codoc_in_vecdraw.rendering.point_codec import unpack_xy
+from codoc_in_vecdraw.rendering.svg_renderer import document_bounds, shape_bounds
+
+# SVG user units are CSS pixels, which are defined at 96 DPI.
+CSS_DPI = 96
+
+# Highest export resolution; requests above it are clamped.
+MAX_DPI = 600
+
+# Largest output width or height in pixels; larger exports are scaled down to fit.
+# A band of tiles then holds at most tile_size * MAX_OUTPUT_SIDE * 3 bytes.
+MAX_OUTPUT_SIDE = 16384
+
+# Tile workers shared by every export, started on first use.
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+_PATH_NUMBERS = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _color(value: str) -> tuple[int, int, int, int] | None:
+    """Parse an SVG paint value, returning None for no paint."""
+    if not value or value in ("none", "transparent"):
+        return None
+    try:
+        return ImageColor.getcolor(value, "RGBA")
+    except ValueError:
+        return None
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    """Load the default font at a pixel size, if Pillow supports sizing it."""
+    try:
+        return ImageFont.load_default(size=max(size, 1))
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _pencil_points(shape: dict) -> list[tuple[float, float]]:
+    """Return a pencil stroke's vertices, falling back to its path data."""
+    if shape.get("points"):
+        return list(zip(*unpack_xy(shape["points"])))
+    numbers = [float(n) for n in _PATH_NUMBERS.findall(shape.get("path_data", ""))]
+    return list(zip(numbers[0::2], numbers[1::2]))
+
+
+def _cull_bounds(shape: dict) -> tuple[float, float, float, float]:
+    """Return a shape's bounds padded for stroke width and text overflow."""
+    min_x, min_y, max_x, max_y = shape_bounds(shape)
+    pad = shape.get("stroke_width", 0) or 0
+    if shape["type"] == "text":
+        # Text is not clipped to its box; estimate the run length instead.
+        max_x = max(max_x, min_x + len(shape["content"]) * shape["height"])
+    return (min_x - pad, min_y - pad, max_x + pad, max_y + pad)
+
+
+def _draw_shape(
+    image: Image.Image,
+    draw: ImageDraw.ImageDraw,
+    shape: dict,
+    origin: tuple[float, float],
+    scale: float,
+    upload_dir: Path | None,
+):
+    """Draw one shape onto a tile whose top-left maps to ``origin``."""
+    ox, oy = origin
+
+    def px(x: float, y: float) -> tuple[float, float]:
+        return ((x - ox) * scale, (y - oy) * scale)
+
+    shape_type = shape["type"]
+    fill = _color(shape["fill"])
+    stroke = _color(shape["stroke"])
+    width = max(1, round((shape["stroke_width"] or 0) * scale)) if stroke else 0
+    x0, y0 = px(shape["x"], shape["y"])
+    x1, y1 = px(shape["x"] + shape["width"], shape["y"] + shape["height"])
+
+    if shape_type == "rectangle":
+        draw.rectangle((x0, y0, x1, y1), fill=fill, outline=stroke, width=width)
+    elif shape_type == "ellipse":
+        draw.ellipse((x0, y0, x1, y1), fill=fill, outline=stroke, width=width)
+    elif shape_type == "triangle":
+        points = [((x0 + x1) / 2, y0), (x0, y1), (x1, y1)]
+        draw.polygon(points, fill=fill, outline=stroke, width=width)
+    elif shape_type == "line":
+        if stroke:
+            end = px(shape["end_x"], shape["end_y"])
+            draw.line([(x0, y0), end], fill=stroke, width=width)
+    elif shape_type == "pencil":
+        points = [px(x, y) for x, y in _pencil_points(shape)]
+        if stroke and len(points) > 1:
+            draw.line(points, fill=stroke, width=width, joint="curve")
+    elif shape_type == "text":
+        if fill:
+            draw.text((x0, y0), shape["content"], fill=fill, font=_font(round(shape["height"] * scale)))
+    elif shape_type == "image" and upload_dir is not None:
+        _draw_image(image, upload_dir / shape["src"], (x0, y0, x1, y1))
+
+
+def _draw_image(image: Image.Image, path: Path, box: tuple[float, float, float, float]):
+    """Paste the part of an image file that falls on the tile, scaled to ``box``.
+
+    Only the source pixels under the tile are converted and resampled, so the
+    buffer is at most one tile however large the image is drawn.
+    """
+    x0, y0, x1, y1 = box
+    # The visible part of the box, in whole tile pixels
+    left, top = max(0, round(x0)), max(0, round(y0))
+    right, bottom = min(image.width, round(x1)), min(image.height, round(y1))
+    if right <= left or bottom <= top or x1 <= x0 or y1 <= y0 or not path.is_file():
+        return
+    with Image.open(path) as source:
+        sx = source.width / (x1 - x0)
+        sy = source.height / (y1 - y0)
+        # The same region in source pixels, and whole pixels around it to decode
+        src = ((left - x0) * sx, (top - y0) * sy, (right - x0) * sx, (bottom - y0) * sy)
+        crop = (
+            max(0, int(src[0])),
+            max(0, int(src[1])),
+            min(source.width, -int(-src[2] // 1)),
+            min(source.height, -int(-src[3] // 1)),
+        )
+        region = source.crop(crop).convert("RGBA")
+    picture = region.resize(
+        (right - left, bottom - top),
+        Image.Resampling.LANCZOS,
+        box=(src[0] - crop[0], src[1] - crop[1], src[2] - crop[0], src[3] - crop[1]),
+    )
+    image.paste(picture, (left, top), picture)
+
+
+def render_tile(
+    shapes: list[dict],
+    origin: tuple[float, float],
+    size: tuple[int, int],
+    scale: float,
+    background: str = "white",
+    upload_dir: Path | None = None,
+    supersample: int = 2,
+) -> bytes:
+    """Rasterize the shapes covering one tile and return its raw RGB bytes.
+
+    This runs inside the worker processes, so it only takes picklable
+    arguments and returns plain bytes.
+    """
+    factor = max(1, supersample)
+    canvas_size = (size[0] * factor, size[1] * factor)
+    image = Image.new("RGBA", canvas_size, _color(background) or (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for shape in shapes:
+        _draw_shape(image, draw, shape, origin, scale * factor, upload_dir)
+    if factor > 1:
+        image = image.resize(size, Image.Resampling.BOX)
+    return image.convert("RGB").tobytes()
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _pool_context():
+    """Return a start method that does not fork the calling process.
+
+    Exports run in worker threads of a threaded server, and forking a process
+    with other threads running can copy locks held mid-operation.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _shared_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(mp_context=_pool_context())
+        return _pool
+
+
+def rasterize_png(
+    shapes: list[dict],
+    out: BinaryIO,
+    region: tuple[float, float, float, float] | None = None,
+    dpi: int = CSS_DPI,
+    tile_size: int = 512,
+    max_workers: int | None = None,
+    upload_dir: Path | None = None,
+    background: str = "white",
+    padding: int = 20,
+) -> tuple[int, int]:
+    """Rasterize shapes into a PNG written to ``out`` and return its pixel size.
+
+    ``region`` is ``(x, y, width, height)`` in document units and defaults to
+    the padded bounds of all shapes. ``dpi`` scales document units, which are
+    CSS pixels, to output pixels, and is clamped to ``MAX_DPI``; it is lowered
+    further when either side would exceed ``MAX_OUTPUT_SIDE`` pixels. Tiles are
+    drawn in a process pool shared by all exports unless ``max_workers``
+    asks for a pool of its own.
+    """
+    dpi = min(max(1, int(dpi)), MAX_DPI)
+    if region is None:
+        min_x, min_y, max_x, max_y = document_bounds(shapes)
+        region = (min_x - padding, min_y - padding, max_x - min_x + 2 * padding, max_y - min_y + 2 * padding)
+    region_x, region_y, region_w, region_h = region
+    scale = min(dpi / CSS_DPI, MAX_OUTPUT_SIDE / max(region_w, region_h, 1e-9))
+    out_w = max(1, round(region_w * scale))
+    out_h = max(1, round(region_h * scale))
+
+    boxes = [(s, _cull_bounds(s)) for s in shapes]
+
+    def tile_job(col: int, row: int) -> tuple:
+        px0, py0 = col * tile_size, row * tile_size
+        w = min(tile_size, out_w - px0)
+        h = min(tile_size, out_h - py0)
+        doc_x0 = region_x + px0 / scale
+        doc_y0 = region_y + py0 / scale
+        doc_x1 = region_x + (px0 + w) / scale
+        doc_y1 = region_y + (py0 + h) / scale
+        visible = [
+            s
+            for s, (bx0, by0, bx1, by1) in boxes
+            if bx1 >= doc_x0 and bx0 <= doc_x1 and by1 >= doc_y0 and by0 <= doc_y1
+        ]
+        return (visible, (doc_x0, doc_y0), (w, h), scale, background, upload_dir)
+
+    cols = -(-out_w // tile_size)
+    rows = -(-out_h // tile_size)
+
+    out.write(b"\x89PNG\r\n\x1a\n")
+    out.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", out_w, out_h, 8, 2, 0, 0, 0)))
+    compressor = zlib.compressobj(6)
+
+    own_pool = max_workers is not None
+    pool = (
+        ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context())
+        if own_pool
+        else _shared_pool()
+    )
+
+    def submit_band(row: int) -> list:
+        return [pool.submit(render_tile, *tile_job(col, row)) for col in range(cols)]
+
+    pending = upcoming = []
+    try:
+        pending = submit_band(0)
+        for row in range(rows):
+            # Queue the next band before stitching this one so the pool stays busy.
+            upcoming = submit_band(row + 1) if row + 1 < rows else []
+            band_h = min(tile_size, out_h - row * tile_size)
+            band = Image.new("RGB", (out_w, band_h))
+            for col, future in enumerate(pending):
+                w = min(tile_size, out_w - col * tile_size)
+                band.paste(Image.frombytes("RGB", (w, band_h), future.result()), (col * tile_size, 0))
+            raw = memoryview(band.tobytes())
+            del band
+            stride = out_w * 3
+            # Feed the encoder row by row rather than building a filtered copy of the band
+            data = []
+            for y in range(band_h):
+                data.append(compressor.compress(b"\x00"))
+                data.append(compressor.compress(raw[y * stride:(y + 1) * stride]))
+            data = b"".join(data)
+            if data:
+                out.write(_png_chunk(b"IDAT", data))
+            pending = upcoming
+    finally:
+        # A failed export must not leave its tiles queued in the shared pool
+        for future in [*pending, *upcoming]:
+            future.cancel()
+        if own_pool:
+            pool.shutdown()
+
+    out.write(_png_chunk(b"IDAT", compressor.flush()))
+    out.write(_png_chunk(b"IEND", b""))
+    return out_w, out_h
@@ -0,0 +1,249 @@
+"""Simplification and curve fitting of freehand pencil strokes.
+
+A committed stroke is reduced with Ramer-Douglas-Peucker, and cubic
+Béziers are fitted along its samples (Schneider's algorithm,
+Graphics Gems 1990), so a scribble of thousands of pointer samples is
+stored and drawn as a handful of curve segments. The tolerance, in canvas
+units, is chosen per room from ``STROKE_FIDELITY``.
+"""
+
+import math
+import re
+
+# Stroke fidelity presets and their tolerance in canvas units; 0 keeps every sample.
+STROKE_FIDELITY = {
+    "exact": 0.0,
+    "fine": 1.0,
+    "balanced": 2.0,
+    "compact": 4.0,
+}
+
+# Newton-Raphson passes tried before splitting a segment that nearly fits.
+MAX_REPARAMETERIZE = 4
+
+# Samples on each side used to estimate a tangent, smoothing pointer jitter.
+TANGENT_WINDOW = 3
+
+_PATH_TOKENS = re.compile(r"[A-Za-z]|-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def simplify_points(points: list[dict[str, int]], tolerance: float) -> list[dict[str, int]]:
+    """Drop points closer than ``tolerance`` to the line through their neighbours.
+
+    Ramer-Douglas-Peucker, iterative so long strokes cannot hit the recursion limit.
+    """
+    if len(points) < 3:
+        return list(points)
+    xs = [p["x"] for p in points]
+    ys = [p["y"] for p in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    tol2 = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        seg2 = dx * dx + dy * dy
+        worst, worst_d2 = -1, tol2
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if seg2:
+                cross = px * dy - py * dx
+                d2 = cross * cross / seg2
+            else:
+                d2 = px * px + py * py
+            if d2 > worst_d2:
+                worst, worst_d2 = i, d2
+        if worst >= 0:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _num(value: float) -> str:
+    """Format a coordinate with at most one decimal."""
+    value = round(value, 1)
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def polyline_path(points: list[dict[str, int]]) -> str:
+    """Build SVG path data joining the points with straight segments."""
+    if not points:
+        return ""
+    return "M " + " L ".join(f"{_num(p['x'])} {_num(p['y'])}" for p in points)
+
+
+def map_path(path_data: str, fn) -> str:
+    """Apply ``fn(x, y) -> (x, y)`` to every point of absolute M/L/C path data."""
+    out = []
+    pending = None
+    for token in _PATH_TOKENS.findall(path_data):
+        if token.isalpha():
+            out.append(token)
+        elif pending is None:
+            pending = float(token)
+        else:
+            x, y = fn(pending, float(token))
+            out.append(f"{_num(x)} {_num(y)}")
+            pending = None
+    return " ".join(out)
+
+
+# Small 2D vector helpers on (x, y) tuples
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1])
+
+
+def _add(a, b):
+    return (a[0] + b[0], a[1] + b[1])
+
+
+def _mul(a, k):
+    return (a[0] * k, a[1] * k)
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1]
+
+
+def _unit(a):
+    length = math.hypot(a[0], a[1])
+    return (a[0] / length, a[1] / length) if length else (0.0, 0.0)
+
+
+def _bezier(ctrl, t):
+    """Point on a cubic Bézier at parameter t."""
+    mt = 1 - t
+    b0, b1, b2, b3 = mt * mt * mt, 3 * mt * mt * t, 3 * mt * t * t, t * t * t
+    return (
+        b0 * ctrl[0][0] + b1 * ctrl[1][0] + b2 * ctrl[2][0] + b3 * ctrl[3][0],
+        b0 * ctrl[0][1] + b1 * ctrl[1][1] + b2 * ctrl[2][1] + b3 * ctrl[3][1],
+    )
+
+
+def _chord_params(pts, first, last):
+    u = [0.0]
+    for i in range(first + 1, last + 1):
+        u.append(u[-1] + math.dist(pts[i], pts[i - 1]))
+    total = u[-1] or 1.0
+    return [v / total for v in u]
+
+
+def _generate_bezier(pts, first, last, u, t1, t2):
+    """Least-squares cubic through pts[first..last] with fixed end tangents."""
+    p0, p3 = pts[first], pts[last]
+    c00 = c01 = c11 = x0 = x1 = 0.0
+    for i, t in enumerate(u):
+        mt = 1 - t
+        b0, b1, b2, b3 = mt * mt * mt, 3 * mt * mt * t, 3 * mt * t * t, t * t * t
+        a0, a1 = _mul(t1, b1), _mul(t2, b2)
+        c00 += _dot(a0, a0)
+        c01 += _dot(a0, a1)
+        c11 += _dot(a1, a1)
+        tmp = _sub(pts[first + i], _add(_mul(p0, b0 + b1), _mul(p3, b2 + b3)))
+        x0 += _dot(a0, tmp)
+        x1 += _dot(a1, tmp)
+    det = c00 * c11 - c01 * c01
+    alpha_l = (x0 * c11 - x1 * c01) / det if det else 0.0
+    alpha_r = (c00 * x1 - c01 * x0) / det if det else 0.0
+    seg = math.dist(p0, p3)
+    if alpha_l < 1e-6 * seg or alpha_r < 1e-6 * seg:
+        # Degenerate fit: fall back to the Wu/Barsky heuristic
+        alpha_l = alpha_r = seg / 3
+    return (p0, _add(p0, _mul(t1, alpha_l)), _add(p3, _mul(t2, alpha_r)), p3)
+
+
+def _max_error(pts, first, last, ctrl, u):
+    worst, split = 0.0, (first + last) // 2
+    for i in range(first + 1, last):
+        d = _sub(_bezier(ctrl, u[i - first]), pts[i])
+        d2 = _dot(d, d)
+        if d2 >= worst:
+            worst, split = d2, i
+    return worst, split
+
+
+def _reparameterize(pts, first, ctrl, u):
+    """Improve each parameter with one Newton-Raphson step towards its point."""
+    d1 = [_mul(_sub(ctrl[i + 1], ctrl[i]), 3) for i in range(3)]
+    d2 = [_mul(_sub(d1[i + 1], d1[i]), 2) for i in range(2)]
+    improved = []
+    for i, t in enumerate(u):
+        mt = 1 - t
+        diff = _sub(_bezier(ctrl, t), pts[first + i])
+        q1 = (
+            mt * mt * d1[0][0] + 2 * mt * t * d1[1][0] + t * t * d1[2][0],
+            mt * mt * d1[0][1] + 2 * mt * t * d1[1][1] + t * t * d1[2][1],
+        )
+        q2 = (mt * d2[0][0] + t * d2[1][0], mt * d2[0][1] + t * d2[1][1])
+        denominator = _dot(q1, q1) + _dot(diff, q2)
+        improved.append(t - _dot(diff, q1) / denominator if denominator else t)
+    return improved
+
+
+def fit_beziers(pts: list[tuple[float, float]], tolerance: float) -> list[tuple]:
+    """Fit cubic Béziers along the points within ``tolerance``; returns control quads."""
+    error = tolerance * tolerance
+    end = len(pts) - 1
+    w = TANGENT_WINDOW
+    curves = []
+    # Segments still to fit, in order: (first, last, left tangent, right tangent)
+    todo = [(0, end, _unit(_sub(pts[min(w, end)], pts[0])), _unit(_sub(pts[max(end - w, 0)], pts[end])))]
+    while todo:
+        first, last, t1, t2 = todo.pop()
+        if last - first == 1:
+            dist = math.dist(pts[first], pts[last]) / 3
+            curves.append((pts[first], _add(pts[first], _mul(t1, dist)), _add(pts[last], _mul(t2, dist)), pts[last]))
+            continue
+        u = _chord_params(pts, first, last)
+        ctrl = _generate_bezier(pts, first, last, u, t1, t2)
+        worst, split = _max_error(pts, first, last, ctrl, u)
+        if worst > error and worst < error * 4:
+            for _ in range(MAX_REPARAMETERIZE):
+                u = _reparameterize(pts, first, ctrl, u)
+                ctrl = _generate_bezier(pts, first, last, u, t1, t2)
+                worst, split = _max_error(pts, first, last, ctrl, u)
+                if worst <= error:
+                    break
+        if worst <= error:
+            curves.append(ctrl)
+            continue
+        center = _unit(_sub(pts[max(split - w, first)], pts[min(split + w, last)]))
+        # The right half is pushed first so the left one is fitted (and emitted) first
+        todo.append((split, last, _mul(center, -1), t2))
+        todo.append((first, split, t1, center))
+    return curves
+
+
+def fit_stroke(points: list[dict[str, int]], tolerance: float) -> tuple[list[dict[str, int]], str]:
+    """Simplify a raw stroke and fit curves along it.
+
+    Returns the Ramer-Douglas-Peucker vertices, kept as the stroke's points,
+    and path data of Béziers fitted to the samples, each within
+    ``tolerance`` of the curve, or the vertices joined by straight segments
+    when the curves would be no shorter than the raw samples. A zero
+    tolerance keeps every sample joined by straight segments.
+    """
+    deduped = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+    if tolerance <= 0 or len(deduped) < 3:
+        kept = deduped if len(deduped) > 1 else deduped * 2
+        return kept, polyline_path(kept)
+    kept = simplify_points(deduped, tolerance)
+    if len(kept) < 3:
+        return kept, polyline_path(kept)
+    # Fitting against every sample, not just the vertices, keeps the curve
+    # from bowing away from the stroke between sparse vertices
+    curves = fit_beziers([(p["x"], p["y"]) for p in deduped], tolerance)
+    segments = " ".join(
+        "C " + " ".join(f"{_num(x)} {_num(y)}" for x, y in ctrl[1:]) for ctrl in curves
+    )
+    fitted = f"M {_num(kept[0]['x'])} {_num(kept[0]['y'])} {segments}"
+    if len(fitted) >= len(polyline_path(deduped)):
+        # On noisy strokes the curves can outgrow the raw samples; the
+        # simplified vertices are as close to them and never longer
+        return kept, polyline_path(kept)
+    return kept, fitted
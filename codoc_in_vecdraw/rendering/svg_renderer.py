@@ -0,0 +1,258 @@
+"""Server-side SVG rendering of EditorState shape documents.
+
+The browser export in ``assets/export_canvas.js`` clones the live DOM, so it
+only sees mounted elements and drags selection handles along. This module
+builds the SVG straight from the shape dicts instead, yielding it chunk by
+chunk so callers can stream it to a file or a response.
+"""
+
+import base64
+import mimetypes
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape, quoteattr
+
+from reflex.constants import Endpoint
+
+# Cache of rendered fragments keyed by shape id and version, which every edit
+# renews and no two processes share, plus the paint, which exports inline
+# from the room's style table. Shapes never stamped (version 0) and embedded
+# images, whose fragments carry the whole file, are rendered every time. The
+# LRU bound keeps memory in check for long-running workers; exports run on
+# worker threads, so the cache is only touched under its lock.
+FRAGMENT_CACHE_BYTES = 64 * 1024 * 1024
+
+_fragment_cache: OrderedDict[tuple, str] = OrderedDict()
+_fragment_cache_bytes = 0
+_fragment_cache_lock = threading.Lock()
+
+
+def _attrs(**attrs) -> str:
+    """Format keyword arguments as SVG attributes (underscores become dashes)."""
+    return " ".join(
+        f"{key.replace('_', '-')}={quoteattr(str(value))}"
+        for key, value in attrs.items()
+        if value is not None
+    )
+
+
+def _image_href(src: str, upload_dir: Path | None) -> str:
+    """Return a data URI for an upload when embedding, otherwise its URL."""
+    if upload_dir is not None:
+        path = upload_dir / src
+        if path.is_file():
+            mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            data = base64.b64encode(path.read_bytes()).decode("ascii")
+            return f"data:{mime};base64,{data}"
+    return f"{Endpoint.UPLOAD.get_url()}/{src}"
+
+
+def render_shape_svg(shape: dict, upload_dir: Path | None = None) -> str:
+    """Render a single shape to an SVG fragment, mirroring ``render_shape``."""
+    shape_type = shape["type"]
+    x, y = shape["x"], shape["y"]
+    width, height = shape["width"], shape["height"]
+    if shape_type == "instance":
+        # Instances carry no paint; the symbol is defined once in <defs>
+        href = "#symbol-" + shape["src"]
+        return f"<use {_attrs(href=href, x=x, y=y, width=width, height=height)}/>"
+    paint = {
+        "fill": shape["fill"],
+        "stroke": shape["stroke"],
+        "stroke_width": shape["stroke_width"],
+    }
+
+    if shape_type == "rectangle":
+        return f"<rect {_attrs(x=x, y=y, width=width, height=height, **paint)}/>"
+    if shape_type == "ellipse":
+        return "<ellipse {}/>".format(
+            _attrs(
+                cx=x + width / 2, cy=y + height / 2, rx=width / 2, ry=height / 2, **paint
+            )
+        )
+    if shape_type == "line":
+        return "<line {}/>".format(
+            _attrs(x1=x, y1=y, x2=shape["end_x"], y2=shape["end_y"], **paint)
+        )
+    if shape_type == "triangle":
+        points = f"{x + width / 2},{y} {x},{y + height} {x + width},{y + height}"
+        return f"<polygon {_attrs(points=points, **paint)}/>"
+    if shape_type == "image":
+        return "<image {}/>".format(
+            _attrs(
+                href=_image_href(shape["src"], upload_dir),
+                x=x,
+                y=y,
+                width=width,
+                height=height,
+                preserveAspectRatio="none",
+            )
+        )
+    if shape_type == "text":
+        return "<text {}>{}</text>".format(
+            _attrs(
+                x=x,
+                y=y,
+                font_size=height,
+                fill=shape["fill"],
+                dominant_baseline="hanging",
+                font_family="Inter, sans-serif",
+            ),
+            escape(shape["content"]),
+        )
+    if shape_type == "pencil":
+        return "<path {}/>".format(
+            _attrs(
+                d=shape["path_data"],
+                fill="none",
+                stroke=shape["stroke"],
+                stroke_width=shape["stroke_width"],
+                stroke_linecap="round",
+                stroke_linejoin="round",
+            )
+        )
+    return ""
+
+
+def cached_shape_svg(shape: dict, upload_dir: Path | None = None) -> str:
+    """Render a shape, reusing the fragment cached for the same shape version."""
+    global _fragment_cache_bytes
+
+    version = shape.get("version")
+    if not version or (upload_dir is not None and shape["type"] == "image"):
+        return render_shape_svg(shape, upload_dir)
+    paint = (shape.get("fill"), shape.get("stroke"), shape.get("stroke_width"))
+    key = (shape["id"], version, *paint, upload_dir is not None)
+    with _fragment_cache_lock:
+        fragment = _fragment_cache.get(key)
+        if fragment is not None:
+            _fragment_cache.move_to_end(key)
+            return fragment
+
+    fragment = render_shape_svg(shape, upload_dir)
+    with _fragment_cache_lock:
+        if key not in _fragment_cache:
+            _fragment_cache[key] = fragment
+            _fragment_cache_bytes += len(fragment)
+        while _fragment_cache_bytes > FRAGMENT_CACHE_BYTES:
+            _, evicted = _fragment_cache.popitem(last=False)
+            _fragment_cache_bytes -= len(evicted)
+    return fragment
+
+
+def shape_bounds(shape: dict) -> tuple[float, float, float, float]:
+    """Return the (min_x, min_y, max_x, max_y) box covered by a shape."""
+    if shape["type"] == "line":
+        return (
+            min(shape["x"], shape["end_x"]),
+            min(shape["y"], shape["end_y"]),
+            max(shape["x"], shape["end_x"]),
+            max(shape["y"], shape["end_y"]),
+        )
+    return (
+        shape["x"],
+        shape["y"],
+        shape["x"] + shape["width"],
+        shape["y"] + shape["height"],
+    )
+
+
+def document_bounds(shapes: Iterable[dict]) -> tuple[float, float, float, float]:
+    """Return the bounding box of every shape, or an empty box at the origin."""
+    boxes = [shape_bounds(s) for s in shapes]
+    if not boxes:
+        return (0, 0, 0, 0)
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _iter_symbol_defs(shapes: list[dict], symbols: dict, upload_dir: Path | None) -> Iterator[str]:
+    """Yield one <symbol> per symbol the shapes place, inside <defs>."""
+    used = list(dict.fromkeys(s["src"] for s in shapes if s["type"] == "instance"))
+    used = [symbol_id for symbol_id in used if symbol_id in symbols]
+    if not used:
+        return
+    yield "<defs>\n"
+    for symbol_id in used:
+        symbol = symbols[symbol_id]
+        view_box = f"0 0 {symbol['width']} {symbol['height']}"
+        yield "<symbol {}>\n".format(
+            _attrs(
+                id=f"symbol-{symbol_id}",
+                viewBox=view_box,
+                preserveAspectRatio="none",
+                overflow="visible",
+            )
+        )
+        for shape in symbol["shapes"]:
+            fragment = cached_shape_svg(shape, upload_dir)
+            if fragment:
+                yield fragment + "\n"
+        yield "</symbol>\n"
+    yield "</defs>\n"
+
+
+def iter_svg(
+    shapes: list[dict],
+    embed_images: bool = False,
+    upload_dir: Path | None = None,
+    padding: int = 20,
+    symbols: dict | None = None,
+) -> Iterator[str]:
+    """Yield a standalone SVG document for the shapes, one fragment at a time.
+
+    With ``embed_images`` the uploads are inlined as data URIs read from
+    ``upload_dir`` (defaulting to Reflex's upload directory); otherwise image
+    shapes link to the backend upload URL. Instance shapes are written as
+    ``<use>`` of a ``<symbol>`` from ``symbols``, each defined once.
+    """
+    if embed_images and upload_dir is None:
+        import reflex as rx
+
+        upload_dir = rx.get_upload_dir()
+    if not embed_images:
+        upload_dir = None
+
+    min_x, min_y, max_x, max_y = document_bounds(shapes)
+    min_x -= padding
+    min_y -= padding
+    width = max_x - min_x + padding
+    height = max_y - min_y + padding
+
+    yield '<?xml version="1.0" standalone="no"?>\n'
+    yield (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f"{_attrs(width=width, height=height, viewBox=f'{min_x} {min_y} {width} {height}')}>\n"
+    )
+    yield from _iter_symbol_defs(shapes, symbols or {}, upload_dir)
+    yield f"<rect {_attrs(x=min_x, y=min_y, width=width, height=height, fill='white')}/>\n"
+    # Groups are written as nested <g> elements; their shapes are contiguous
+    open_groups: list[str] = []
+    for shape in shapes:
+        path = shape.get("groups") or []
+        common = 0
+        while common < min(len(open_groups), len(path)) and open_groups[common] == path[common]:
+            common += 1
+        for _ in open_groups[common:]:
+            yield "</g>\n"
+        for group_id in path[common:]:
+            yield f"<g {_attrs(id=group_id)}>\n"
+        open_groups = list(path)
+        fragment = cached_shape_svg(shape, upload_dir)
+        if fragment:
+            yield fragment + "\n"
+    for _ in open_groups:
+        yield "</g>\n"
+    yield "</svg>\n"
+
+
+def render_svg(shapes: list[dict], embed_images: bool = False, **kwargs) -> str:
+    """Render the shapes to a complete SVG string."""
+    return "".join(iter_svg(shapes, embed_images=embed_images, **kwargs))
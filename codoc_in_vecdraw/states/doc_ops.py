@@ -0,0 +1,265 @@
+"""Operation-based document model with per-field last-writer-wins.
+
+Every change to a room's shapes can be written as operations: ``add`` a
+shape, ``set`` some of its fields, or ``remove`` it. Each operation carries
+a Lamport stamp ``(counter, actor)``, so stamps order causally related
+writes and break ties between concurrent ones by actor. The room's
+``DocClock`` remembers the stamp of the last write to every field of every
+shape, and a write only lands on fields it is newer than.
+
+Applying operations therefore commutes: a gesture computed from a stale
+copy of the board only writes the fields it actually changed, and an undo
+leaves alone the fields, shapes and deletions that other collaborators
+wrote after the undone step began.
+
+Operations are plain dicts:
+
+    {"op": "add", "shape": {...}, "index": 3, "stamp": (12, "token")}
+    {"op": "set", "id": "...", "fields": {"x": 10}, "stamp": (13, "token")}
+    {"op": "remove", "id": "...", "stamp": (14, "token")}
+
+A ``set`` field with the value ``ABSENT`` deletes the key, as styled shapes
+do with their inline paint. Shape order is not a field: ``index`` only
+places an added shape.
+
+Stamps only matter against steps that can still be undone, so the clock
+drops those older than every open step (``DocClock.compact``) and forgets
+a shape's field stamps when it is removed.
+"""
+
+from collections import deque
+from typing import Any, Iterable
+
+Stamp = tuple[int, str]
+
+ZERO: Stamp = (0, "")
+
+# Clock ticks between compactions of its stamps.
+COMPACT_TICKS = 1000
+
+
+class _Absent:
+    def __repr__(self) -> str:
+        return "ABSENT"
+
+
+# Value of a field removed from a shape.
+ABSENT: Any = _Absent()
+
+
+def changed_fields(before: dict, after: dict) -> dict[str, Any]:
+    """Return the fields of ``after`` that differ from ``before``; dropped keys map to ABSENT."""
+    changed = {k: v for k, v in after.items() if k != "version" and before.get(k, ABSENT) != v}
+    changed.update({k: ABSENT for k in before.keys() - after.keys()})
+    return changed
+
+
+def diff_ops(before: list[dict], after: list[dict], stamp: Stamp) -> list[dict]:
+    """Return the operations turning the shapes ``before`` into ``after``.
+
+    Shapes are replaced, never mutated, so unchanged ones are skipped by
+    identity without comparing their fields.
+    """
+    old = {s["id"]: s for s in before}
+    seen = set()
+    ops = []
+    for index, shape in enumerate(after):
+        shape_id = shape["id"]
+        seen.add(shape_id)
+        prev = old.get(shape_id)
+        if prev is shape:
+            continue
+        if prev is None:
+            ops.append({"op": "add", "shape": shape, "index": index, "stamp": stamp})
+            continue
+        fields = changed_fields(prev, shape)
+        if fields:
+            ops.append({"op": "set", "id": shape_id, "fields": fields, "stamp": stamp})
+    ops += [{"op": "remove", "id": shape_id, "stamp": stamp} for shape_id in old if shape_id not in seen]
+    return ops
+
+
+def _after(stamp: Stamp, since: Stamp) -> bool:
+    """Whether ``stamp`` is a write by someone other than the author of ``since``, made after it."""
+    return stamp[0] > since[0] and stamp[1] != since[1]
+
+
+class DocClock:
+    """Lamport clock of a room, with the stamp of the last write to each field."""
+
+    def __init__(self):
+        self.counter = 0
+        self.fields: dict[str, dict[str, Stamp]] = {}
+        self.added: dict[str, Stamp] = {}
+        self.removed: dict[str, Stamp] = {}
+        # Sets for shapes whose add has not been applied yet, replayed on add
+        self.pending: dict[str, list[dict]] = {}
+        # Counter at the last compaction
+        self.compacted = 0
+
+    def tick(self, actor: str) -> Stamp:
+        """Return a stamp newer than every stamp seen so far."""
+        self.counter += 1
+        return (self.counter, actor)
+
+    def receive(self, stamp: Stamp):
+        """Advance past a stamp made elsewhere, keeping later local stamps causal."""
+        self.counter = max(self.counter, stamp[0])
+
+    def field_stamp(self, shape_id: str, field: str) -> Stamp:
+        """Return the stamp of the last write to a field, or of the shape's add."""
+        stamp = self.fields.get(shape_id, {}).get(field, ZERO)
+        return max(stamp, self.added.get(shape_id, ZERO))
+
+    def record(self, op: dict):
+        """Note the stamps of an operation applied outside ``apply_ops``."""
+        stamp = tuple(op["stamp"])
+        self.receive(stamp)
+        if op["op"] == "set":
+            fields = self.fields.setdefault(op["id"], {})
+            for name in op["fields"]:
+                fields[name] = max(fields.get(name, ZERO), stamp)
+        elif op["op"] == "add":
+            shape_id = op["shape"]["id"]
+            self.added[shape_id] = max(self.added.get(shape_id, ZERO), stamp)
+            self.removed.pop(shape_id, None)
+        elif op["op"] == "remove":
+            self.removed[op["id"]] = max(self.removed.get(op["id"], ZERO), stamp)
+            self.fields.pop(op["id"], None)
+            self.added.pop(op["id"], None)
+            self.pending.pop(op["id"], None)
+
+    def compact(self, horizon: Stamp):
+        """Drop the stamps no later than ``horizon``, the oldest stamp an open step began at.
+
+        Every actor has seen those writes: none of them counts as a later
+        write when undoing a step that began at or after the horizon, and
+        every new operation is stamped after them. Tombstones, add and field
+        stamps and waiting sets that old are removed.
+        """
+        def newer(stamps: dict[str, Stamp]) -> dict[str, Stamp]:
+            return {key: stamp for key, stamp in stamps.items() if stamp[0] > horizon[0]}
+
+        self.removed = newer(self.removed)
+        self.added = newer(self.added)
+        fields = {}
+        for shape_id, stamps in self.fields.items():
+            stamps = newer(stamps)
+            if stamps:
+                fields[shape_id] = stamps
+        self.fields = fields
+        pending = {}
+        for shape_id, ops in self.pending.items():
+            ops = [op for op in ops if op["stamp"][0] > horizon[0]]
+            if ops:
+                pending[shape_id] = ops
+        self.pending = pending
+        self.compacted = self.counter
+
+    def without_later_writes(self, ops: Iterable[dict], since: Stamp) -> list[dict]:
+        """Drop what ``ops`` would change that others wrote after ``since``.
+
+        Used to undo a step that began at ``since``: fields edited, shapes
+        added and shapes deleted by other actors since then are kept.
+        Operations left whole are returned as they are.
+        """
+        kept = []
+        for op in ops:
+            if op["op"] == "set":
+                fields = {
+                    name: value
+                    for name, value in op["fields"].items()
+                    if not _after(self.field_stamp(op["id"], name), since)
+                }
+                if len(fields) == len(op["fields"]):
+                    kept.append(op)
+                elif fields:
+                    kept.append({**op, "fields": fields})
+            elif op["op"] == "remove":
+                if not _after(self.added.get(op["id"], ZERO), since):
+                    kept.append(op)
+            elif not _after(self.removed.get(op["shape"]["id"], ZERO), since):
+                kept.append(op)
+        return kept
+
+
+def op_ids(ops: Iterable[dict]) -> set[str]:
+    """Return the ids of the shapes some operation touches."""
+    return {op["shape"]["id"] if op["op"] == "add" else op["id"] for op in ops}
+
+
+def apply_ops(
+    shapes: list[dict],
+    ops: Iterable[dict],
+    clock: DocClock,
+    new_version,
+    rows: dict[str, int] | None = None,
+) -> tuple[dict[int, dict], list[tuple[int, dict]], set[str]]:
+    """Apply operations to ``shapes`` with per-field last-writer-wins.
+
+    Returns the replaced shapes by index, the added shapes with the index
+    they ask for, and the ids of removed shapes; the caller writes them
+    back. ``new_version`` gives each changed shape a fresh version.
+    ``rows`` maps at least the ``op_ids`` present in ``shapes`` to their
+    index; without it every shape is indexed.
+    """
+    if rows is None:
+        rows = {s["id"]: i for i, s in enumerate(shapes)}
+    replaced: dict[int, dict] = {}
+    added: dict[str, tuple[int, dict]] = {}
+    removed: set[str] = set()
+    queue = deque(ops)
+    while queue:
+        op = queue.popleft()
+        stamp = tuple(op["stamp"])
+        clock.receive(stamp)
+        kind = op["op"]
+        if kind == "add":
+            shape = op["shape"]
+            shape_id = shape["id"]
+            if shape_id in rows or shape_id in added or stamp <= clock.removed.get(shape_id, ZERO):
+                continue
+            shape = {**shape, "version": new_version()}
+            added[shape_id] = (op.get("index", len(shapes)), shape)
+            removed.discard(shape_id)
+            clock.record(op)
+            # Sets that arrived before the add now have a shape to land on
+            queue.extendleft(reversed(clock.pending.pop(shape_id, [])))
+        elif kind == "remove":
+            shape_id = op["id"]
+            if stamp <= clock.added.get(shape_id, ZERO):
+                continue
+            clock.record(op)
+            if shape_id in rows or shape_id in added:
+                added.pop(shape_id, None)
+                removed.add(shape_id)
+        else:
+            shape_id = op["id"]
+            if shape_id in added:
+                index, current = added[shape_id]
+            elif shape_id in rows and shape_id not in removed:
+                index = rows[shape_id]
+                current = replaced.get(index, shapes[index])
+            else:
+                if stamp > clock.removed.get(shape_id, ZERO):
+                    clock.pending.setdefault(shape_id, []).append(op)
+                continue
+            fields = clock.fields.setdefault(shape_id, {})
+            merged = None
+            for name, value in op["fields"].items():
+                if stamp <= clock.field_stamp(shape_id, name):
+                    continue
+                merged = merged or dict(current)
+                if value is ABSENT:
+                    merged.pop(name, None)
+                else:
+                    merged[name] = value
+                fields[name] = stamp
+            if merged is None:
+                continue
+            merged["version"] = new_version()
+            if shape_id in added:
+                added[shape_id] = (index, merged)
+            else:
+                replaced[index] = merged
+    return replaced, list(added.values()), removed
@@ -1,18 +1,57 @@
 import reflex as rx
-from typing import TypedDict, Any
+from typing import TypedDict, Any, Iterable
 import uuid
-import copy
 import random
+import secrets
 import string
+import time
 import json
 import base64
 import dataclasses
+import itertools
+import math
+from array import array
 from collections import defaultdict
 
 # Global store for pending AI operations
 # Key: room_id (str), Value: list of op dicts
 PENDING_AI_OPS = defaultdict(list)
 
+# Zoom factor of one press of the zoom buttons.
+ZOOM_STEP = 1.25
+
+# Fields of AI operations that must be numbers.
+AI_NUMBER_FIELDS = ("x", "y", "width", "height", "end_x", "end_y", "stroke_width", "cx", "cy", "rx", "ry", "font_size")
+
+# Undo steps kept per room. Dropping older ones also lets the room clock
+# compact the stamps that only those steps still needed.
+HISTORY_LIMIT = 100
+
+# Revision counter for shapes. Every edit stamps the shape with a fresh value,
+# so (id, version) uniquely identifies a shape's content and caches key on it.
+# Each process counts up from its own random base (below 2**53, so versions
+# stay exact in JavaScript), so versions minted by other workers or earlier
+# runs, which documents carry, do not meet this one's. 0 means never stamped.
+_shape_versions = itertools.count((secrets.randbits(20) << 33) + 1)
+
+
+def next_shape_version() -> int:
+    """Return a new, never reused shape version."""
+    return next(_shape_versions)
+
+
+def _number(value: Any) -> int | float | None:
+    """Return a finite number sent by a client (a number or numeric string), or None."""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
 @dataclasses.dataclass
 class Point:
     x: int
@@ -32,9 +71,33 @@ class Shape(TypedDict):
     end_x: int
     end_y: int
     content: str
-    points: list[dict[str, int]]
+    # Pencil samples packed by rendering.point_codec ("" for other shapes).
+    points: str
     path_data: str
+    # Upload name of an image, or symbol id of an instance.
     src: str
+    display_src: str
+    tiled: bool
+    version: int
+    # Ids of the groups containing the shape, outermost first.
+    groups: list[str]
+    # Id of the room style entry painting the shape; "" uses fill, stroke and
+    # stroke_width above, whose keys are left out otherwise.
+    style: str
+
+
+class Style(TypedDict):
+    fill: str
+    stroke: str
+    stroke_width: int
+
+
+class Symbol(TypedDict):
+    name: str
+    width: int
+    height: int
+    # Shapes with inline paint, in coordinates local to the symbol's box.
+    shapes: list[Shape]
 
 
 class EditorState(rx.SharedState):
@@ -42,10 +105,13 @@ class EditorState(rx.SharedState):
 
     shapes: list[Shape] = []
     selected_shape_id: str = ""
+    # Every selected shape id; selected_shape_id is the primary one, shown in the panel.
+    selected_ids: list[str] = []
     current_tool: str = "select"
     is_drawing: bool = False
     is_dragging: bool = False
     is_panning: bool = False
+    is_marquee: bool = False
     active_handle: str = ""
     start_x: int = 0
     start_y: int = 0
@@ -55,22 +121,92 @@ class EditorState(rx.SharedState):
     drag_offset_y: int = 0
     pan_x: int = 0
     pan_y: int = 0
-    current_points: list[dict[str, int]] = []
-    past: list[list[Shape]] = []
-    future: list[list[Shape]] = []
-    snapshot_shapes: list[Shape] = []
+    # Screen pixels per canvas unit, the level-of-detail band it falls in, and
+    # the zoom image variants are sized for.
+    zoom: float = 1.0
+    lod_band: int = 0
+    lod_scale: float = 1.0
+    # LodOverrides for the current band and scale, updated with each edit, and
+    # a counter bumped when an edit changes them.
+    _lod: Any = None
+    _lod_revision: int = 0
+    # Path of the stroke being drawn; its samples are kept in _stroke_points.
+    current_path_string: str = ""
+    # Undo and redo snapshots of (shapes, styles, symbols, stamp the step began at).
+    # Shapes, style entries and symbols are never mutated in place, so a
+    # snapshot is a shallow copy sharing unchanged ones with the board and the
+    # other snapshots; it stays on the server, and clients only see whether one exists.
+    _past: list[tuple[list[Shape], dict[str, Style], dict[str, Symbol], tuple[int, str]]] = []
+    _future: list[tuple[list[Shape], dict[str, Style], dict[str, Symbol], tuple[int, str]]] = []
+    can_undo: bool = False
+    can_redo: bool = False
+    # Shapes at the start of the current gesture, pushed as its single history
+    # entry, and the clock stamp the gesture began at.
+    _snapshot_shapes: list[Shape] = []
+    _snapshot_since: tuple[int, str] = (0, "")
+    # Indices in shapes of the selected shapes being dragged or resized.
+    _drag_indices: list[int] = []
+    # Moved or resized copies of the dragged shapes, in document order; shapes
+    # itself is only written when the gesture ends
+    live_shapes: list[Shape] = []
+    # Box of the dragged shapes when the gesture began, and the offset applied so far
+    _drag_box: list[float] = []
+    _drag_moved: list[int] = [0, 0]
+    # Snap to other shapes' edges, centres and spacing, and optionally to the grid
+    snap_enabled: bool = True
+    snap_to_grid: bool = False
+    # Alignment guides of the current snap, in canvas units
+    snap_guides: list[dict[str, int]] = []
+    # Selection box (min_x, min_y, max_x, max_y) at the start of a group resize.
+    _group_bounds: list[int] = []
+    # Selection kept under a shift-marquee, and the index the marquee queries.
+    _marquee_base: list[str] = []
+    _marquee_index: Any = None
+    # Interleaved x, y samples of the pencil stroke being drawn (an array("i")).
+    _stroke_points: Any = None
+    # Scene graph over shapes, rebuilt lazily after structural edits.
+    _scene: Any = None
+    # (shapes, its length, tiled image shapes, GridIndex over them) for visible_image_tiles.
+    _tiled_index: Any = None
+    # Blob use counts of history snapshots by id(), each counted once; see _sync_blob_refs.
+    _blob_counts: Any = None
+    # When this unshared session last renewed its lease on the blobs it uses.
+    _blob_lease_renewed: float = 0.0
+    # Columnar ShapeTable mirroring shapes for vectorized queries, when NumPy is installed.
+    _table: Any = None
+    # Sorted edge coordinates for snapping, kept in step with shapes like _scene
+    _snap: Any = None
+    # Lamport clock of the room's edits and the stamp of the last write to each shape field
+    _clock: Any = None
+    # Room style table referenced by the shapes' style field, and its reverse lookup.
+    styles: dict[str, Style] = {}
+    _style_index: Any = None
+    # Whether paint edits in the panel change the selected shape's shared style entry.
+    restyle_shared: bool = False
+    # Room symbol table placed by instance shapes; symbols are never changed once
+    # added, and are dropped when no instance places them (undo brings them back).
+    symbols: dict[str, Symbol] = {}
+    # Document import in progress and how much of the upload it has read (%)
+    is_importing: bool = False
+    import_progress: int = 0
     room_id: str = ""
+    # Pencil simplification preset for this room, and whether raw samples are kept.
+    stroke_fidelity: str = "balanced"
+    keep_raw_points: bool = False
     offset_x: int = 96
     offset_y: int = 64
+    viewport_width: int = 1920
+    viewport_height: int = 1080
 
     @rx.event
     async def on_load(self):
         """Handle page load to join room if specified."""
         room_param = self.router.url.query_parameters.get("room")
         if room_param:
-            self.room_id = room_param
             safe_token = room_param.replace("_", "-")
-            await self._link_to(safe_token)
+            # Set the id on the shared state, not the private one it replaces.
+            linked = await self._link_to(safe_token)
+            linked.room_id = room_param
 
     @rx.event
     def create_room(self):
@@ -93,10 +229,13 @@ class EditorState(rx.SharedState):
 
     @rx.var
     def selected_shape(self) -> Shape:
-        """Return the currently selected shape or a default empty shape."""
+        """Return the currently selected shape, with its style inlined, or a default empty shape."""
+        from codoc_in_vecdraw.states.styles import inline_style
+
         for shape in self.shapes:
             if shape["id"] == self.selected_shape_id:
-                return shape
+                # Instances have no paint at all; the panel still reads the keys
+                return {"fill": "", "stroke": "", "stroke_width": 0, **inline_style(shape, self.styles)}
         return {
             "id": "",
             "type": "",
@@ -110,25 +249,188 @@ class EditorState(rx.SharedState):
             "end_x": 0,
             "end_y": 0,
             "content": "",
-            "points": [],
+            "points": "",
             "path_data": "",
             "src": "",
+            "display_src": "",
+            "tiled": False,
+            "groups": [],
+            "style": "",
+            "version": 0,
         }
 
-    @rx.var
-    def current_path_string(self) -> str:
-        """Generate SVG path data for the current pencil drawing."""
-        if not self.current_points:
+    # shapes is read unproxied, which dependency tracking cannot see
+    @rx.var(
+        deps=["shapes", "pan_x", "pan_y", "zoom", "viewport_width", "viewport_height"],
+        auto_deps=False,
+    )
+    def visible_image_tiles(self) -> dict[str, list[dict[str, Any]]]:
+        """Map each tiled image shape to the pyramid tiles inside the viewport.
+
+        Pan and zoom only query the grid index of tiled images; images
+        outside the viewport map to no tiles.
+        """
+        from codoc_in_vecdraw.storage.tile_pyramid import visible_tiles
+
+        viewport = (
+            -self.pan_x / self.zoom,
+            -self.pan_y / self.zoom,
+            (-self.pan_x + self.viewport_width) / self.zoom,
+            (-self.pan_y + self.viewport_height) / self.zoom,
+        )
+        images, index = self._tiled_images()
+        tiles: dict[str, list[dict[str, Any]]] = {s["id"]: [] for s in images}
+        for i in index.query(viewport):
+            tiles[images[i]["id"]] = visible_tiles(images[i], viewport, self.zoom)
+        return tiles
+
+    def _tiled_images(self) -> tuple[list[Shape], Any]:
+        """Return the tiled image shapes and a grid index over them.
+
+        The index is rebuilt when shapes is replaced or an edit touches a
+        tiled image; see _update_lod.
+        """
+        from codoc_in_vecdraw.states.spatial_index import GridIndex
+
+        shapes = self._unproxied("shapes")
+        cached = self._unproxied("_tiled_index")
+        if cached is None or cached[0] is not shapes or cached[1] != len(shapes):
+            images = [s for s in shapes if s["type"] == "image" and s.get("tiled")]
+            cached = self._tiled_index = (shapes, len(shapes), images, GridIndex(images))
+        return cached[2], cached[3]
+
+    def _active_shapes(self) -> list[Shape]:
+        """Return the selected shapes as currently drawn, live copies mid-gesture."""
+        live = self._unproxied("live_shapes")
+        if live:
+            return list(live)
+        shapes = self._unproxied("shapes")
+        return [shapes[i] for i in self._selected_indices()]
+
+    # shapes is read unproxied, which dependency tracking cannot see
+    @rx.var(deps=["shapes", "selected_ids", "live_shapes"], auto_deps=False)
+    def active_shapes(self) -> list[Shape]:
+        """The selected shapes as currently drawn, which the selection overlay outlines.
+
+        Selecting only changes this short list, so the static layer holding
+        the board is left alone.
+        """
+        return self._active_shapes()
+
+    @rx.var(deps=["live_shapes"], auto_deps=False)
+    def lifted_shapes(self) -> list[Shape]:
+        """The shapes being dragged, drawn in the active layer above every other shape.
+
+        Only a gesture lifts shapes out of the static layer, so a selection
+        at rest keeps its place in the stacking order.
+        """
+        return list(self._unproxied("live_shapes"))
+
+    @rx.var(deps=["selected_ids", "live_shapes"], auto_deps=False)
+    def active_layer_css(self) -> str:
+        """One rule for the static layer's copies of the selected shapes.
+
+        They are hidden while lifted shapes stand in for them mid-gesture,
+        and otherwise only take the move cursor.
+        """
+        live = self._unproxied("live_shapes")
+        ids = [s["id"] for s in live] if live else self._unproxied("selected_ids")
+        if not ids:
             return ""
-        
-        # Start with Move to first point
-        d = f"M {self.current_points[0]['x']} {self.current_points[0]['y']}"
-        
-        # Line to subsequent points
-        for p in self.current_points[1:]:
-            d += f" L {p['x']} {p['y']}"
-            
-        return d
+        # json.dumps quotes and escapes like a CSS string; the cursor is set on
+        # the drawn elements, which carry their own
+        target = "" if live else " *"
+        selectors = ",".join(f"#static-layer > [id={json.dumps('shape-' + i)}]{target}" for i in ids)
+        return selectors + ("{visibility:hidden}" if live else "{cursor:move}")
+
+    @rx.var(deps=["shapes", "selected_ids", "live_shapes"], auto_deps=False)
+    def selection_bounds(self) -> dict[str, int]:
+        """Box around a multi-shape selection, drawn with the group resize handles."""
+        from codoc_in_vecdraw.states.transforms import selection_box
+
+        ids = self._unproxied("selected_ids")
+        box = None
+        if len(ids) > 1:
+            # Mid-gesture the box follows the live copies, which the table does not hold
+            table = None if self._unproxied("live_shapes") else self._shape_table()
+            if table is not None:
+                box = table.bounds(self._selected_indices())
+            else:
+                box = selection_box(self._active_shapes(), ids)
+        if box is None:
+            return {"x": 0, "y": 0, "width": 0, "height": 0}
+        return {"x": box[0], "y": box[1], "width": box[2] - box[0], "height": box[3] - box[1]}
+
+    # Edits that leave every override as it was do not resend them
+    @rx.var(deps=["_lod_revision", "lod_band", "lod_scale"], auto_deps=False)
+    def lod_overrides(self) -> dict[str, str]:
+        """Simplified pencil paths and image sources sized for the current zoom."""
+        from codoc_in_vecdraw.rendering.lod import LodOverrides
+
+        shapes = self._unproxied("shapes")
+        lod = self._unproxied("_lod")
+        if lod is None or not lod.is_current(shapes, self.lod_band, self.lod_scale):
+            lod = self._lod = LodOverrides(shapes, self.lod_band, self.lod_scale)
+        return dict(lod.overrides)
+
+    def _update_lod(self, changed: Iterable[Shape], removed: Iterable[str] = ()):
+        """Recompute the overrides of edited shapes after shapes was written.
+
+        The tiled image index is dropped if the edit touched a tiled image.
+        """
+        changed, removed = list(changed), list(removed)
+        tiled = self._unproxied("_tiled_index")
+        if tiled is not None:
+            tiled_ids = {s["id"] for s in tiled[2]}
+            touched = [s["id"] for s in changed if s["type"] == "image"] + removed
+            if any(s.get("tiled") for s in changed if s["type"] == "image") or not tiled_ids.isdisjoint(touched):
+                self._tiled_index = None
+        lod = self._unproxied("_lod")
+        if lod is not None and lod.update(self._unproxied("shapes"), changed, removed):
+            self._lod_revision += 1
+
+    def _to_canvas(self, raw_x: int, raw_y: int) -> tuple[int, int]:
+        """Convert a point on screen to canvas coordinates."""
+        return round((raw_x - self.pan_x) / self.zoom), round((raw_y - self.pan_y) / self.zoom)
+
+    def _set_zoom(self, zoom: float, anchor_x: float, anchor_y: float):
+        """Zoom to ``zoom``, keeping the canvas point under the screen anchor in place."""
+        from codoc_in_vecdraw.rendering.lod import MAX_ZOOM, MIN_ZOOM, lod_band, lod_scale
+
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        if zoom == self.zoom:
+            return
+        self.pan_x = round(anchor_x - (anchor_x - self.pan_x) * zoom / self.zoom)
+        self.pan_y = round(anchor_y - (anchor_y - self.pan_y) * zoom / self.zoom)
+        self.zoom = zoom
+        band = lod_band(zoom)
+        if band != self.lod_band:
+            self.lod_band = band
+        scale = lod_scale(zoom)
+        if scale != self.lod_scale:
+            self.lod_scale = scale
+
+    @rx.event
+    def zoom_in(self):
+        """Zoom in around the middle of the canvas."""
+        self._set_zoom(self.zoom * ZOOM_STEP, self.viewport_width / 2, self.viewport_height / 2)
+
+    @rx.event
+    def zoom_out(self):
+        """Zoom out around the middle of the canvas."""
+        self._set_zoom(self.zoom / ZOOM_STEP, self.viewport_width / 2, self.viewport_height / 2)
+
+    @rx.event
+    def reset_zoom(self):
+        """Return to 100% around the middle of the canvas."""
+        self._set_zoom(1.0, self.viewport_width / 2, self.viewport_height / 2)
+
+    @rx.event
+    def set_viewport(self, size: dict[str, int]):
+        """Record the canvas size reported by the browser."""
+        if isinstance(size, dict) and size.get("width") and size.get("height"):
+            self.viewport_width = size["width"]
+            self.viewport_height = size["height"]
 
     def _get_handle_under_point(self, x: int, y: int, shape: Shape) -> str:
         """Check if a point is over a resize handle."""
@@ -165,14 +467,434 @@ class EditorState(rx.SharedState):
 
     def _save_to_history(self):
         """Save current state to history stack."""
-        self.past.append(copy.deepcopy(self.shapes))
-        self.future.clear()
+        self._push_history(list(self._unproxied("shapes")))
+
+    def _push_history(
+        self,
+        snapshot: list[Shape],
+        styles: dict[str, Style] | None = None,
+        since: tuple[int, str] | None = None,
+        symbols: dict[str, Symbol] | None = None,
+    ):
+        """Record the shapes before an edit as one undo step and drop the redo stack.
+
+        ``since`` is the clock stamp the step began at, for gestures recorded
+        when they end; undoing the step keeps what others wrote after it.
+        The style and symbol tables default to their current contents.
+        """
+        if styles is None:
+            styles = dict(self._unproxied("styles"))
+        if symbols is None:
+            symbols = dict(self._unproxied("symbols"))
+        self._past.append((snapshot, styles, symbols, since or self._since()))
+        del self._past[:-HISTORY_LIMIT]
+        self._future.clear()
+        self.can_undo = True
+        self.can_redo = False
+        self._compact_clock()
+
+    def _compact_clock(self):
+        """Every so often, drop the clock stamps older than every undo step still open."""
+        from codoc_in_vecdraw.states.doc_ops import COMPACT_TICKS
+
+        clock = self._doc_clock()
+        if clock.counter - clock.compacted < COMPACT_TICKS:
+            return
+        open_since = [since for *_, since in [*self._past, *self._future]]
+        if self._unproxied("_snapshot_shapes"):
+            open_since.append(self._snapshot_since)
+        clock.compact(min(open_since, default=self._since()))
+
+    def _fit_stroke(self, raw_points: list[dict[str, int]]) -> tuple[str, str]:
+        """Return the points to store and the path data of a stroke at the room's fidelity."""
+        from codoc_in_vecdraw.rendering.point_codec import pack_points
+        from codoc_in_vecdraw.rendering.strokes import STROKE_FIDELITY, fit_stroke
+
+        points, d = fit_stroke(raw_points, STROKE_FIDELITY[self.stroke_fidelity])
+        return pack_points(raw_points if self.keep_raw_points else points), d
+
+    def _style_for(self, paint: dict) -> str:
+        """Return the id of the room style entry with this paint, adding one if needed."""
+        from codoc_in_vecdraw.states.styles import STYLE_FIELDS, StyleIndex, new_style_id
+
+        styles = self._unproxied("styles")
+        index = self._unproxied("_style_index")
+        if index is None or not index.is_current(styles):
+            index = self._style_index = StyleIndex(styles)
+        style_id = index.find(paint)
+        if not style_id:
+            style_id = new_style_id(styles)
+            entry = {field: paint[field] for field in STYLE_FIELDS}
+            self.styles[style_id] = entry
+            index.add(style_id, entry)
+        return style_id
+
+    def _prune_styles(self, candidates: set[str]):
+        """Drop the style entries among ``candidates`` that no shape uses any more.
+
+        History snapshots keep their own copy of the table, so undo brings
+        pruned entries back with the shapes that used them.
+        """
+        from codoc_in_vecdraw.states.styles import unused_styles
+
+        candidates.discard("")
+        unused = unused_styles(candidates, self._unproxied("shapes")) if candidates else set()
+        for style_id in unused:
+            del self.styles[style_id]
+        if unused:
+            self._style_index = None
+
+    def _prune_symbols(self, candidates: set[str]):
+        """Drop the symbols among ``candidates`` that no instance places any more.
+
+        As with styles, history snapshots keep their own copy of the table.
+        """
+        from codoc_in_vecdraw.states.symbols import unused_symbols
+
+        unused = unused_symbols(candidates, self._unproxied("shapes")) if candidates else set()
+        for symbol_id in unused:
+            del self.symbols[symbol_id]
+
+    def _with_style(self, shape: Shape) -> Shape:
+        """Move a shape's inline paint into the room style table."""
+        from codoc_in_vecdraw.states.styles import styled
+
+        return styled(shape, self._style_for(shape))
+
+    def _with_display_src(self, shape: Shape) -> Shape:
+        """Return an image shape pointed at the smallest derivative covering its size.
+
+        The stored derivative suits 100% zoom; lod_overrides swaps in another
+        for the zoom each view is at.
+        """
+        from codoc_in_vecdraw.storage.derivatives import pick_display_src
+
+        display_src = pick_display_src(shape["src"], shape["width"], shape["height"])
+        if display_src == shape.get("display_src", ""):
+            return shape
+        s = dict(shape)
+        s["display_src"] = display_src
+        s["version"] = next_shape_version()
+        return s
+
+    def _sync_blob_refs(self):
+        """Report the uploads used by this room's shapes and history to the blob store.
+
+        History snapshots are never mutated, so each is counted once and its
+        counts reused until it leaves the history. The store is written on
+        its own thread; an unshared session's refs are a lease its tabs renew.
+        """
+        from codoc_in_vecdraw.storage.blob_store import SESSION_LEASE_SECONDS, blob_uses, get_blob_store
+
+        counts = blob_uses(self._unproxied("shapes"))
+        # Each symbol, on the board or kept by undo, is counted once
+        symbols = {id(symbol): symbol for symbol in self._unproxied("symbols").values()}
+        cached = self._unproxied("_blob_counts") or {}
+        kept = {}
+        for snapshot, _, snapshot_symbols, _ in [*self._past, *self._future]:
+            entry = cached.get(id(snapshot))
+            if entry is None or entry[0] is not snapshot:
+                entry = (snapshot, blob_uses(snapshot))
+            kept[id(snapshot)] = entry
+            counts.update(entry[1])
+            for symbol in snapshot_symbols.values():
+                symbols[id(symbol)] = symbol
+        for symbol in symbols.values():
+            counts.update(blob_uses(symbol["shapes"]))
+        self._blob_counts = kept
+        store = get_blob_store()
+        if self.room_id:
+            store.submit(store.set_refs, self.room_id, counts)
+        else:
+            self._blob_lease_renewed = time.time()
+            store.submit(store.set_refs, self.router.session.client_token, counts, SESSION_LEASE_SECONDS)
+
+    def _renew_blob_lease(self):
+        """Keep an open unshared session's blob refs from expiring, re-reporting them if they had."""
+        from codoc_in_vecdraw.storage.blob_store import SESSION_LEASE_SECONDS
+
+        if not self.room_id and time.time() - self._blob_lease_renewed >= SESSION_LEASE_SECONDS / 4:
+            self._sync_blob_refs()
+
+    def _select(self, ids: list[str]):
+        """Replace the selection; the last id becomes the primary selected shape."""
+        self.selected_ids = ids
+        self.selected_shape_id = ids[-1] if ids else ""
+
+    def _unproxied(self, name: str) -> Any:
+        """Return a var without Reflex's change-tracking proxy, for fast read-only passes."""
+        value = getattr(self, name)
+        return getattr(value, "__wrapped__", value)
+
+    def _doc_clock(self):
+        """Return the room's document clock, creating it on first use."""
+        from codoc_in_vecdraw.states.doc_ops import DocClock
+
+        clock = self._unproxied("_clock")
+        if clock is None:
+            clock = self._clock = DocClock()
+        return clock
+
+    def _actor(self) -> str:
+        """Return the id stamped on this client's edits."""
+        return self.router.session.client_token or "server"
+
+    def _since(self) -> tuple[int, str]:
+        """Return a stamp that every later edit, by anyone, is newer than."""
+        return (self._doc_clock().counter, self._actor())
+
+    def _set_shapes(self, shapes: list[Shape]):
+        """Assign a rebuilt shapes list, stamping the shapes and fields it adds, removes or changes.
+
+        Members of a group left apart are gathered at its topmost member.
+        """
+        from codoc_in_vecdraw.states.doc_ops import diff_ops
+        from codoc_in_vecdraw.states.scene_graph import gather_groups
+
+        shapes = gather_groups(shapes)
+        clock = self._doc_clock()
+        ops = diff_ops(self._unproxied("shapes"), shapes, clock.tick(self._actor()))
+        for op in ops:
+            clock.record(op)
+        self.shapes = shapes
+        self._update_lod_for_ops(ops)
+
+    def _update_lod_for_ops(self, ops: list[dict]):
+        """Recompute the overrides of the shapes a rebuilt list added, changed or removed."""
+        lod = self._unproxied("_lod")
+        if lod is None or not lod.active:
+            self._update_lod([])
+            return
+        touched = {op["id"] for op in ops if op["op"] == "set"}
+        changed = [op["shape"] for op in ops if op["op"] == "add"]
+        if touched:
+            changed += [s for s in self._unproxied("shapes") if s["id"] in touched]
+        self._update_lod(changed, [op["id"] for op in ops if op["op"] == "remove"])
+
+    def _add_shape(self, shape: Shape):
+        """Append a new shape on top of the others."""
+        clock = self._doc_clock()
+        clock.record({"op": "add", "shape": shape, "stamp": clock.tick(self._actor())})
+        self.shapes.append(shape)
+        self._update_lod([shape])
+
+    def _apply_ops(self, ops: list[dict]):
+        """Apply document operations, each field only where it is the latest write.
+
+        Field edits are swapped in place; adds and removes rebuild the list.
+        Groups are kept contiguous, as in ``_set_shapes``.
+        """
+        from codoc_in_vecdraw.states.doc_ops import apply_ops, op_ids
+        from codoc_in_vecdraw.states.scene_graph import gather_groups
+
+        shapes = self._unproxied("shapes")
+        rows = None
+        scene = self._unproxied("_scene")
+        if scene is not None and scene.is_current(shapes):
+            # Look up only the touched shapes instead of indexing the board
+            leaves = scene.by_id
+            rows = {i: leaves[i].index for i in op_ids(ops) if i in leaves}
+        replaced, added, removed = apply_ops(shapes, ops, self._doc_clock(), next_shape_version, rows)
+        if not added and not removed:
+            regrouped = any(s.get("groups") != shapes[i].get("groups") for i, s in replaced.items())
+            self._replace_shapes(replaced, record=False)
+            gathered = gather_groups(shapes) if regrouped else shapes
+            if gathered is not shapes:
+                self.shapes = gathered
+                self._update_lod([])
+            return
+        rebuilt = [replaced.get(i, s) for i, s in enumerate(shapes) if s["id"] not in removed]
+        for index, shape in sorted(added, key=lambda item: item[0]):
+            rebuilt.insert(min(index, len(rebuilt)), shape)
+        self.shapes = gather_groups(rebuilt)
+        self._update_lod([*replaced.values(), *(shape for _, shape in added)], removed)
+
+    def _replace_shapes(self, replaced: dict[int, Shape], record: bool = True):
+        """Swap in new versions of shapes at the given indices as one change.
+
+        Assigning a new list makes Reflex revalidate every element, and each
+        write through its proxy re-marks the state dirty, so the plain list is
+        updated and a single proxied write flags shapes as changed. The
+        changed fields are stamped on the room clock unless ``record`` is
+        False, for writes ``_apply_ops`` already stamped.
+        """
+        from codoc_in_vecdraw.states.doc_ops import changed_fields
+
+        shapes = self._unproxied("shapes")
+        if record and replaced:
+            clock = self._doc_clock()
+            stamp = clock.tick(self._actor())
+            for i, shape in replaced.items():
+                fields = changed_fields(shapes[i], shape)
+                clock.record({"op": "set", "id": shape["id"], "fields": fields, "stamp": stamp})
+        scene = self._unproxied("_scene")
+        if scene is not None and not scene.is_current(shapes):
+            scene = self._scene = None
+        table = self._unproxied("_table")
+        if table is not None and not table.is_current(shapes):
+            table = self._table = None
+        snap = self._unproxied("_snap")
+        if snap is not None and not snap.is_current(shapes):
+            snap = self._snap = None
+        for i, shape in replaced.items():
+            shapes[i] = shape
+            if scene is not None and not scene.update(i, shape):
+                scene = self._scene = None
+            if table is not None and not table.update(i, shape):
+                table = self._table = None
+            if snap is not None and not snap.update(i, shape):
+                snap = self._snap = None
+        if replaced:
+            self.shapes[i] = shape
+        self._update_lod(replaced.values())
+
+    def _scene_graph(self):
+        """Return the scene graph of shapes, rebuilding it if the list changed shape."""
+        from codoc_in_vecdraw.states.scene_graph import SceneGraph
+
+        shapes = self._unproxied("shapes")
+        scene = self._unproxied("_scene")
+        if scene is None or not scene.is_current(shapes):
+            scene = self._scene = SceneGraph(shapes)
+        return scene
+
+    def _shape_table(self):
+        """Return the columnar table of shapes, or None without NumPy."""
+        from codoc_in_vecdraw.states.shape_table import ShapeTable
+
+        if not ShapeTable.available():
+            return None
+        shapes = self._unproxied("shapes")
+        table = self._unproxied("_table")
+        if table is None or not table.is_current(shapes):
+            table = self._table = ShapeTable(shapes)
+        return table
+
+    def _snap_index(self):
+        """Return the snapping index of shapes, rebuilding it if the list changed shape."""
+        from codoc_in_vecdraw.states.snapping import SnapIndex
+
+        shapes = self._unproxied("shapes")
+        snap = self._unproxied("_snap")
+        if snap is None or not snap.is_current(shapes):
+            snap = self._snap = SnapIndex(shapes)
+        return snap
+
+    def _with_groups(self, ids: list[str]) -> list[str]:
+        """Extend shape ids to every shape of their outermost groups, keeping the last id last."""
+        if not ids:
+            return ids
+        scene = self._scene_graph()
+        wanted = set(ids)
+        extra = []
+        for shape_id in ids:
+            node = scene.top_level(shape_id)
+            if node is None or not node.is_group:
+                continue
+            for leaf in node.leaves():
+                if leaf.id not in wanted:
+                    wanted.add(leaf.id)
+                    extra.append(leaf.id)
+        return [*ids[:-1], *extra, ids[-1]]
+
+    def _selected_indices(self) -> list[int]:
+        """Return the positions in shapes of the selected shapes, in document order."""
+        leaves = self._scene_graph().by_id
+        return sorted(leaves[i].index for i in self._unproxied("selected_ids") if i in leaves)
+
+    def _start_drag(self, x: int, y: int):
+        """Begin moving or resizing the selection from (x, y)."""
+        from codoc_in_vecdraw.rendering.svg_renderer import document_bounds
+
+        self.is_dragging = True
+        self.drag_offset_x = x
+        self.drag_offset_y = y
+        # Shapes are replaced, never mutated, during a drag, so a shallow copy is a snapshot.
+        self._snapshot_shapes = list(self._unproxied("shapes"))
+        self._snapshot_since = self._since()
+        self._drag_indices = self._selected_indices()
+        table = self._shape_table()
+        if table is not None and self._drag_indices:
+            self._drag_box = list(table.bounds(self._drag_indices))
+        else:
+            self._drag_box = list(document_bounds(self._snapshot_shapes[i] for i in self._drag_indices))
+        self._drag_moved = [0, 0]
+
+    def _start_marquee(self):
+        """Begin a marquee selection, indexing the shapes' boxes once for the gesture.
+
+        With NumPy the columnar table answers each query in one vectorized
+        pass; otherwise a grid index is built for the gesture.
+        """
+        from codoc_in_vecdraw.states.spatial_index import GridIndex
+
+        self.is_marquee = True
+        self._marquee_base = list(self._unproxied("selected_ids"))
+        self._marquee_index = self._shape_table() or GridIndex(self._unproxied("shapes"))
+
+    def _update_marquee(self):
+        """Select the shapes intersecting the marquee, on top of the base selection."""
+        box = (
+            min(self.start_x, self.current_x),
+            min(self.start_y, self.current_y),
+            max(self.start_x, self.current_x),
+            max(self.start_y, self.current_y),
+        )
+        shapes = self._unproxied("shapes")
+        base = self._unproxied("_marquee_base")
+        in_base = set(base)
+        ids = list(base)
+        for i in self._unproxied("_marquee_index").query(box):
+            # Shapes removed by someone else mid-gesture drop out of range
+            if i < len(shapes) and shapes[i]["id"] not in in_base:
+                ids.append(shapes[i]["id"])
+        if len(ids) > len(base):
+            ids = self._with_groups(ids)
+        if ids != self._unproxied("selected_ids"):
+            self._select(ids)
+
+    @staticmethod
+    def _hits_shape(shape: Shape, x: int, y: int) -> bool:
+        """Whether (x, y) falls on the shape."""
+        if shape["type"] in ["rectangle", "image", "text", "triangle", "pencil", "instance"]:
+            return (
+                shape["x"] <= x <= shape["x"] + shape["width"]
+                and shape["y"] <= y <= shape["y"] + shape["height"]
+            )
+        elif shape["type"] == "ellipse":
+            cx = shape["x"] + shape["width"] / 2
+            cy = shape["y"] + shape["height"] / 2
+            rx_val = shape["width"] / 2
+            ry_val = shape["height"] / 2
+            if not rx_val or not ry_val:
+                return False
+            return (x - cx) ** 2 / rx_val**2 + (y - cy) ** 2 / ry_val**2 <= 1
+        elif shape["type"] == "line":
+            lx = min(shape["x"], shape["end_x"])
+            rx_ = max(shape["x"], shape["end_x"])
+            ty = min(shape["y"], shape["end_y"])
+            by = max(shape["y"], shape["end_y"])
+            return lx - 5 <= x <= rx_ + 5 and ty - 5 <= y <= by + 5
+        return False
+
+    def _shape_at(self, x: int, y: int) -> str:
+        """Return the id of the topmost shape under (x, y), or an empty string.
+
+        With NumPy every shape is tested in one vectorized pass over the
+        columnar table; otherwise groups whose cached box misses the point
+        are skipped with all their shapes.
+        """
+        table = self._shape_table()
+        if table is not None:
+            row = table.hit(x, y)
+            return table.ids[row] if row >= 0 else ""
+        return self._scene_graph().hit(x, y, self._hits_shape)
 
     @rx.event
     def set_tool(self, tool: str):
         """Set the active drawing tool."""
         self.current_tool = tool
-        self.selected_shape_id = ""
+        self._select([])
 
     @rx.event
     def handle_mouse_down(self, point: dict[str, int]):
@@ -198,9 +920,8 @@ class EditorState(rx.SharedState):
             self.start_y = raw_y
             return
 
-        # Adjust for panning
-        x = raw_x - self.pan_x
-        y = raw_y - self.pan_y
+        # Adjust for panning and zoom
+        x, y = self._to_canvas(raw_x, raw_y)
         
         print(f"Click at: {x}, {y} (Raw: {point['x']}, {point['y']})")
         print(f"Selected Shape ID: {self.selected_shape_id}")
@@ -210,8 +931,22 @@ class EditorState(rx.SharedState):
         self.current_x = x
         self.current_y = y
         
+        shift = bool(point.get("shift"))
+
+        # Check if we clicked a resize handle of the selection box
+        if len(self.selected_ids) > 1 and not shift:
+            box = self.selection_bounds
+            handle = self._get_handle_under_point(x, y, {"type": "group", **box})
+            if handle:
+                self.active_handle = handle
+                self._start_drag(x, y)
+                self._group_bounds = [
+                    box["x"], box["y"], box["x"] + box["width"], box["y"] + box["height"]
+                ]
+                return
+
         # Check if we clicked a handle of the selected shape
-        if self.selected_shape_id:
+        elif self.selected_shape_id and len(self.selected_ids) <= 1:
             selected_shape = next((s for s in self.shapes if s["id"] == self.selected_shape_id), None)
             if selected_shape:
                 print(f"Checking handles for shape: {selected_shape}")
@@ -220,46 +955,31 @@ class EditorState(rx.SharedState):
                 
                 if handle:
                     self.active_handle = handle
-                    self.is_dragging = True
-                    self.snapshot_shapes = copy.deepcopy(self.shapes)
-                    self.drag_offset_x = x
-                    self.drag_offset_y = y
+                    self._start_drag(x, y)
                     return
 
         if self.current_tool == "select":
-            found_shape_id = ""
-            for shape in reversed(self.shapes):
-                if shape["type"] in ["rectangle", "image", "text", "triangle", "pencil"]:
-                    if (
-                        shape["x"] <= x <= shape["x"] + shape["width"]
-                        and shape["y"] <= y <= shape["y"] + shape["height"]
-                    ):
-                        found_shape_id = shape["id"]
-                        break
-                elif shape["type"] == "ellipse":
-                    cx = shape["x"] + shape["width"] / 2
-                    cy = shape["y"] + shape["height"] / 2
-                    rx_val = shape["width"] / 2
-                    ry_val = shape["height"] / 2
-                    if (x - cx) ** 2 / rx_val**2 + (y - cy) ** 2 / ry_val**2 <= 1:
-                        found_shape_id = shape["id"]
-                        break
-                elif shape["type"] == "line":
-                    lx = min(shape["x"], shape["end_x"])
-                    rx_ = max(shape["x"], shape["end_x"])
-                    ty = min(shape["y"], shape["end_y"])
-                    by = max(shape["y"], shape["end_y"])
-                    if lx - 5 <= x <= rx_ + 5 and ty - 5 <= y <= by + 5:
-                        found_shape_id = shape["id"]
-                        break
-            if found_shape_id:
-                self.selected_shape_id = found_shape_id
-                self.is_dragging = True
-                self.drag_offset_x = x
-                self.drag_offset_y = y
-                self.snapshot_shapes = copy.deepcopy(self.shapes)
+            found_shape_id = self._shape_at(x, y)
+            if found_shape_id and shift:
+                # Shift-click toggles the shape, with its groups, in or out of the selection
+                if found_shape_id in self.selected_ids:
+                    unit = set(self._with_groups([found_shape_id]))
+                    self._select([i for i in self.selected_ids if i not in unit])
+                else:
+                    self._select(self._with_groups([*self.selected_ids, found_shape_id]))
+                    self._start_drag(x, y)
+            elif found_shape_id:
+                if found_shape_id in self.selected_ids:
+                    # Drag the whole selection, led by the clicked shape
+                    self._select([i for i in self.selected_ids if i != found_shape_id] + [found_shape_id])
+                else:
+                    self._select(self._with_groups([found_shape_id]))
+                self._start_drag(x, y)
             else:
-                self.selected_shape_id = ""
+                # Empty canvas: drag out a marquee
+                if not shift:
+                    self._select([])
+                self._start_marquee()
         elif self.current_tool == "text":
             self._save_to_history()
             new_shape: Shape = {
@@ -275,22 +995,31 @@ class EditorState(rx.SharedState):
                 "end_x": 0,
                 "end_y": 0,
                 "content": "Double click to edit",
-                "points": [],
+                "points": "",
                 "path_data": "",
                 "src": "",
+                "display_src": "",
+                "tiled": False,
+                "groups": [],
+                "style": "",
+                "version": next_shape_version(),
             }
-            self.shapes.append(new_shape)
-            self.selected_shape_id = new_shape["id"]
+            new_shape = self._with_style(new_shape)
+            self._add_shape(new_shape)
+            self._select([new_shape["id"]])
             self.set_tool("select")
         elif self.current_tool == "pencil":
             self.is_drawing = True
-            self.selected_shape_id = ""
-            self.snapshot_shapes = copy.deepcopy(self.shapes)
-            self.current_points = [{"x": x, "y": y}]
+            self._select([])
+            self._snapshot_shapes = list(self._unproxied("shapes"))
+            self._snapshot_since = self._since()
+            self._stroke_points = array("i", (x, y))
+            self.current_path_string = f"M {x} {y}"
         else:
             self.is_drawing = True
-            self.selected_shape_id = ""
-            self.snapshot_shapes = copy.deepcopy(self.shapes)
+            self._select([])
+            self._snapshot_shapes = list(self._unproxied("shapes"))
+            self._snapshot_since = self._since()
 
     @rx.event
     def handle_mouse_move(self, data: dict[str, int]):
@@ -314,13 +1043,19 @@ class EditorState(rx.SharedState):
             self.start_y = raw_y
             return
 
-        x = raw_x - self.pan_x
-        y = raw_y - self.pan_y
+        x, y = self._to_canvas(raw_x, raw_y)
         self.current_x = x
         self.current_y = y
         
         if self.is_drawing and self.current_tool == "pencil":
-            self.current_points.append({"x": x, "y": y})
+            stroke = self._unproxied("_stroke_points")
+            if stroke is not None:
+                stroke.extend((x, y))
+                self.current_path_string += f" L {x} {y}"
+            return
+
+        if self.is_marquee:
+            self._update_marquee()
             return
 
         # Debug log for dragging state
@@ -328,7 +1063,9 @@ class EditorState(rx.SharedState):
             # print(f"Dragging active: handle={self.active_handle}, shape={self.selected_shape_id}")
             pass
         
-        if self.is_dragging and self.selected_shape_id:
+        if self.is_dragging and self.selected_ids:
+            from codoc_in_vecdraw.states.transforms import scale_shape, translate_shape
+
             # Log only when actually dragging/resizing
             if self.active_handle:
                 print(f"Resizing: Handle={self.active_handle}, Pos=({x}, {y})")
@@ -339,68 +1076,119 @@ class EditorState(rx.SharedState):
             dy = y - self.drag_offset_y
             self.drag_offset_x = x
             self.drag_offset_y = y
-            
-            new_shapes = []
-            for shape in self.shapes:
-                if shape["id"] == self.selected_shape_id:
-                    s = shape.copy()
-                    
-                    if self.active_handle:
-                        # Handle resizing
-                        if s["type"] == "line":
-                            if self.active_handle == "start":
-                                s["x"] += dx
-                                s["y"] += dy
-                            elif self.active_handle == "end":
-                                s["end_x"] += dx
-                                s["end_y"] += dy
-                        else:
-                            # Rectangle / Ellipse / Triangle / Image / Text resizing
-                            if "n" in self.active_handle:
-                                s["y"] += dy
-                                s["height"] -= dy
-                            if "s" in self.active_handle:
-                                s["height"] += dy
-                            if "w" in self.active_handle:
-                                s["x"] += dx
-                                s["width"] -= dx
-                            if "e" in self.active_handle:
-                                s["width"] += dx
-                                
-                            # Handle negative dimensions (flipping)
-                            if s["width"] < 0:
-                                s["width"] = abs(s["width"])
-                                s["x"] -= s["width"]
-                                # Flip handle horizontally
-                                self.active_handle = self.active_handle.translate(str.maketrans("we", "ew"))
-                                
-                            if s["height"] < 0:
-                                s["height"] = abs(s["height"])
-                                s["y"] -= s["height"]
-                                # Flip handle vertically
-                                self.active_handle = self.active_handle.translate(str.maketrans("ns", "sn"))
-                    else:
-                        # Handle moving
-                        s["x"] += dx
-                        s["y"] += dy
-                        if s["type"] == "line":
+
+            # Only live copies of the selected shapes change per tick; shapes,
+            # and with it the static layer, waits for the end of the gesture.
+            shapes = self._unproxied("shapes")
+            replaced = {}
+            ids = set(self._unproxied("selected_ids"))
+            indices = self._unproxied("_drag_indices")
+            if any(i >= len(shapes) or shapes[i]["id"] not in ids for i in indices):
+                # Someone else in the room added or removed shapes mid-gesture
+                indices = self._drag_indices = self._selected_indices()
+            live = {s["id"]: s for s in self._unproxied("live_shapes")}
+            current = {i: live.get(shapes[i]["id"], shapes[i]) for i in indices}
+
+            if self.active_handle and self._group_bounds:
+                # Map every shape from the gesture's start box to the dragged box
+                snapshot = self._unproxied("_snapshot_shapes")
+                if len(snapshot) != len(shapes):
+                    return
+                x0, y0, x1, y1 = self._group_bounds
+                total_dx = x - self.start_x
+                total_dy = y - self.start_y
+                nx0, ny0, nx1, ny1 = x0, y0, x1, y1
+                if "n" in self.active_handle:
+                    ny0 = min(y0 + total_dy, y1 - 1)
+                if "s" in self.active_handle:
+                    ny1 = max(y1 + total_dy, y0 + 1)
+                if "w" in self.active_handle:
+                    nx0 = min(x0 + total_dx, x1 - 1)
+                if "e" in self.active_handle:
+                    nx1 = max(x1 + total_dx, x0 + 1)
+                for i in indices:
+                    replaced[i] = scale_shape(snapshot[i], (x0, y0, x1, y1), (nx0, ny0, nx1, ny1))
+            elif self.active_handle:
+                for i in indices:
+                    s = dict(current[i])
+                    s["version"] = next_shape_version()
+                    # Handle resizing
+                    if s["type"] == "line":
+                        if self.active_handle == "start":
+                            s["x"] += dx
+                            s["y"] += dy
+                        elif self.active_handle == "end":
                             s["end_x"] += dx
                             s["end_y"] += dy
-                        elif s["type"] == "pencil":
-                            # Move all points
-                            for p in s["points"]:
-                                p["x"] += dx
-                                p["y"] += dy
-                            # Recompute path_data
-                            d = f"M {s['points'][0]['x']} {s['points'][0]['y']}"
-                            for p in s['points'][1:]:
-                                d += f" L {p['x']} {p['y']}"
-                            s["path_data"] = d
-                            
-                    new_shapes.append(s)
-                else:
-                    new_shapes.append(shape)
-            self.shapes = new_shapes
+                    else:
+                        # Rectangle / Ellipse / Triangle / Image / Text resizing
+                        if "n" in self.active_handle:
+                            s["y"] += dy
+                            s["height"] -= dy
+                        if "s" in self.active_handle:
+                            s["height"] += dy
+                        if "w" in self.active_handle:
+                            s["x"] += dx
+                            s["width"] -= dx
+                        if "e" in self.active_handle:
+                            s["width"] += dx
+
+                        # Handle negative dimensions (flipping)
+                        if s["width"] < 0:
+                            s["width"] = abs(s["width"])
+                            s["x"] -= s["width"]
+                            # Flip handle horizontally
+                            self.active_handle = self.active_handle.translate(str.maketrans("we", "ew"))
+
+                        if s["height"] < 0:
+                            s["height"] = abs(s["height"])
+                            s["y"] -= s["height"]
+                            # Flip handle vertically
+                            self.active_handle = self.active_handle.translate(str.maketrans("ns", "sn"))
+                    replaced[i] = s
+            else:
+                # Handle moving: the gesture's start box follows the pointer and
+                # snaps, and the shapes move by what that adds to the last tick
+                from codoc_in_vecdraw.states.snapping import GRID_SIZE, SNAP_DISTANCE
+
+                offset_x, offset_y = x - self.start_x, y - self.start_y
+                box = self._unproxied("_drag_box")
+                guides = []
+                if self.snap_enabled and box:
+                    moved = (box[0] + offset_x, box[1] + offset_y, box[2] + offset_x, box[3] + offset_y)
+                    snap_x, snap_y, guides = self._snap_index().snap(
+                        moved, ids, SNAP_DISTANCE / self.zoom, GRID_SIZE if self.snap_to_grid else 0
+                    )
+                    offset_x, offset_y = round(offset_x + snap_x), round(offset_y + snap_y)
+                # Updated in place like _stroke_points; it never leaves the backend
+                moved = self._unproxied("_drag_moved")
+                moved_x, moved_y = moved
+                moved[:] = [offset_x, offset_y]
+                for i in indices:
+                    replaced[i] = translate_shape(current[i], offset_x - moved_x, offset_y - moved_y)
+                if guides or self.snap_guides:
+                    self.snap_guides = guides
+            self.live_shapes = [replaced[i] for i in indices if i in replaced]
+
+    def _commit_live_shapes(self):
+        """Write a finished gesture into shapes as one change.
+
+        Only the fields the gesture changed since it began are written, so
+        what others edited on the same shapes meanwhile is kept.
+        """
+        from codoc_in_vecdraw.states.doc_ops import changed_fields
+
+        snapshot = self._unproxied("_snapshot_shapes")
+        start = {snapshot[i]["id"]: snapshot[i] for i in self._unproxied("_drag_indices") if i < len(snapshot)}
+        stamp = self._doc_clock().tick(self._actor())
+        ops = []
+        for s in self._unproxied("live_shapes"):
+            base = start.get(s["id"])
+            fields = changed_fields(base, s) if base is not None else {}
+            if fields:
+                ops.append({"op": "set", "id": s["id"], "fields": fields, "stamp": stamp})
+        self._apply_ops(ops)
+        self.live_shapes = []
 
     @rx.event
     def handle_mouse_up(self, point: dict[str, int] | None = None):
@@ -413,16 +1201,29 @@ class EditorState(rx.SharedState):
                 raw_x = point["x"]
                 raw_y = point["y"]
                 if not self.is_panning:
-                    self.current_x = raw_x - self.pan_x
-                    self.current_y = raw_y - self.pan_y
+                    self.current_x, self.current_y = self._to_canvas(raw_x, raw_y)
             
         if self.is_panning:
             self.is_panning = False
             return
 
-        # Reset active handle and dragging state
+        if self.is_dragging and self.live_shapes:
+            self._commit_live_shapes()
+
+        # Resized images may now need a larger or smaller derivative
+        if self.is_dragging and self.active_handle and self.selected_ids:
+            shapes = self._unproxied("shapes")
+            self._replace_shapes({
+                i: self._with_display_src(shapes[i])
+                for i in self._selected_indices()
+                if shapes[i]["type"] == "image"
+            })
+
+        # Reset active handle
         self.active_handle = ""
-        self.is_dragging = False
+
+        if self.is_marquee:
+            self._update_marquee()
         
         if self.is_drawing and self.current_tool != "select":
             # Ensure coordinates are valid integers
@@ -437,20 +1238,19 @@ class EditorState(rx.SharedState):
             height = abs(current_y - start_y)
             
             if self.current_tool == "pencil":
-                if len(self.current_points) > 1:
-                    self.past.append(self.snapshot_shapes)
-                    self.future.clear()
+                stroke = self._unproxied("_stroke_points")
+                if stroke is not None and len(stroke) > 2:
+                    self._push_history(self._snapshot_shapes, since=self._snapshot_since)
+                    raw_points = [{"x": stroke[i], "y": stroke[i + 1]} for i in range(0, len(stroke), 2)]
                     # Calculate bounding box for pencil
-                    xs = [p["x"] for p in self.current_points]
-                    ys = [p["y"] for p in self.current_points]
+                    xs = [p["x"] for p in raw_points]
+                    ys = [p["y"] for p in raw_points]
                     min_x, max_x = min(xs), max(xs)
                     min_y, max_y = min(ys), max(ys)
-                    
-                    # Compute path data
-                    d = f"M {self.current_points[0]['x']} {self.current_points[0]['y']}"
-                    for p in self.current_points[1:]:
-                        d += f" L {p['x']} {p['y']}"
-                    
+
+                    # Simplify the stroke and fit curves at the room's fidelity
+                    points, d = self._fit_stroke(raw_points)
+
                     new_shape: Shape = {
                         "id": str(uuid.uuid4()),
                         "type": "pencil",
@@ -464,15 +1264,20 @@ class EditorState(rx.SharedState):
                         "end_x": 0,
                         "end_y": 0,
                         "content": "",
-                        "points": self.current_points,
+                        "points": points,
                         "path_data": d,
                         "src": "",
+                        "display_src": "",
+                        "tiled": False,
+                        "groups": [],
+                        "style": "",
+                        "version": next_shape_version(),
                     }
-                    self.shapes.append(new_shape)
-                    self.selected_shape_id = new_shape["id"]
+                    new_shape = self._with_style(new_shape)
+                    self._add_shape(new_shape)
+                    self._select([new_shape["id"]])
             elif width > 2 or height > 2 or self.current_tool == "line":
-                self.past.append(self.snapshot_shapes)
-                self.future.clear()
+                self._push_history(self._snapshot_shapes, since=self._snapshot_since)
                 new_shape: Shape = {
                     "id": str(uuid.uuid4()),
                     "type": self.current_tool,
@@ -486,94 +1291,341 @@ class EditorState(rx.SharedState):
                     "end_x": 0,
                     "end_y": 0,
                     "content": "",
-                    "points": [],
+                    "points": "",
                     "path_data": "",
                     "src": "",
+                    "display_src": "",
+                    "tiled": False,
+                    "groups": [],
+                    "style": "",
+                    "version": next_shape_version(),
                 }
                 if self.current_tool == "line":
                     new_shape["x"] = self.start_x
                     new_shape["y"] = self.start_y
                     new_shape["end_x"] = self.current_x
                     new_shape["end_y"] = self.current_y
-                self.shapes.append(new_shape)
-                self.selected_shape_id = new_shape["id"]
+                new_shape = self._with_style(new_shape)
+                self._add_shape(new_shape)
+                self._select([new_shape["id"]])
         elif self.is_dragging:
-            if self.shapes != self.snapshot_shapes:
-                self.past.append(self.snapshot_shapes)
-                self.future.clear()
+            # The whole move or resize gesture becomes a single history entry
+            if self._unproxied("shapes") != self._unproxied("_snapshot_shapes"):
+                self._push_history(self._snapshot_shapes, since=self._snapshot_since)
         self.is_drawing = False
         self.is_dragging = False
-        self.snapshot_shapes = []
-        self.current_points = []
+        self._snapshot_shapes = []
+        self._drag_indices = []
+        self._drag_box = []
+        self._group_bounds = []
+        if self.snap_guides:
+            self.snap_guides = []
+        self.is_marquee = False
+        self._marquee_base = []
+        self._marquee_index = None
+        self._stroke_points = None
+        self.current_path_string = ""
 
     @rx.event
     def select_shape(self, shape_id: str):
         """Select a specific shape."""
         if self.current_tool == "select":
-            self.selected_shape_id = shape_id
+            self._select([shape_id])
 
     @rx.event
     def update_property(self, key: str, value: Any):
-        """Update a property of the selected shape."""
-        if not self.selected_shape_id:
+        """Update a property of every selected shape.
+
+        Paint changes point each shape at the style entry with the new paint,
+        or, with restyle_shared, edit the primary shape's entry in place,
+        restyling every shape that uses it.
+        """
+        from codoc_in_vecdraw.states.styles import STYLE_FIELDS, paint_of, styled
+        from codoc_in_vecdraw.storage.document_import import NUMBER_FIELDS
+
+        if not self.selected_ids:
+            return
+        if key in NUMBER_FIELDS:
+            value = _number(value)
+            if value is None:
+                return
+        self._save_to_history()
+        shapes = self._unproxied("shapes")
+        styles = self._unproxied("styles")
+        if key not in STYLE_FIELDS:
+            self._replace_shapes({
+                i: {**shapes[i], key: value, "version": next_shape_version()}
+                for i in self._selected_indices()
+            })
+            return
+        if self.restyle_shared:
+            primary = next((s for s in shapes if s["id"] == self.selected_shape_id), None)
+            if primary is not None and primary.get("style") in styles:
+                # Entries are replaced, not mutated, so history keeps the old one
+                self.styles[primary["style"]] = {**styles[primary["style"]], key: value}
+                self._style_index = None
+                return
+        replaced = {}
+        for i in self._selected_indices():
+            if shapes[i]["type"] == "instance":
+                continue
+            style_id = self._style_for({**paint_of(shapes[i], styles), key: value})
+            if style_id != shapes[i].get("style"):
+                replaced[i] = {**styled(shapes[i], style_id), "version": next_shape_version()}
+        left = {shapes[i].get("style", "") for i in replaced}
+        self._replace_shapes(replaced)
+        self._prune_styles(left)
+
+    @rx.event
+    def set_restyle_shared(self, value: bool):
+        """Choose whether paint edits change the shared style entry of the selected shape."""
+        self.restyle_shared = bool(value)
+
+    @rx.event
+    def toggle_snap(self):
+        """Turn snapping to other shapes on or off."""
+        self.snap_enabled = not self.snap_enabled
+
+    @rx.event
+    def toggle_snap_to_grid(self):
+        """Turn snapping to the canvas grid on or off."""
+        self.snap_to_grid = not self.snap_to_grid
+
+    @rx.event
+    def group_selected(self):
+        """Group the selected shapes and groups under a new outermost group."""
+        ids = self._with_groups(list(self._unproxied("selected_ids")))
+        if len(ids) < 2:
+            return
+        self._save_to_history()
+        group_id = str(uuid.uuid4())
+        wanted = set(ids)
+        shapes = self._unproxied("shapes")
+        members = [
+            {**s, "groups": [group_id, *(s.get("groups") or [])], "version": next_shape_version()}
+            for s in shapes
+            if s["id"] in wanted
+        ]
+        # Members are gathered at the topmost member's place in the stacking order
+        top = max(i for i, s in enumerate(shapes) if s["id"] in wanted)
+        rest = [s for s in shapes[:top] if s["id"] not in wanted]
+        self._set_shapes(rest + members + shapes[top + 1:])
+        self._select(ids)
+
+    @rx.event
+    def ungroup_selected(self):
+        """Dissolve the outermost groups of the selected shapes."""
+        wanted = set(self._unproxied("selected_ids"))
+        shapes = self._unproxied("shapes")
+        indices = [i for i, s in enumerate(shapes) if s["id"] in wanted and s.get("groups")]
+        if not indices:
+            return
+        self._save_to_history()
+        self._replace_shapes({
+            i: {**shapes[i], "groups": shapes[i]["groups"][1:], "version": next_shape_version()}
+            for i in indices
+        })
+
+    @rx.event
+    def make_symbol(self):
+        """Turn the selected shapes into a symbol and put one instance of it in their place."""
+        from codoc_in_vecdraw.states.styles import inline_styles
+        from codoc_in_vecdraw.states.symbols import define_symbol, expand_instances, new_symbol_id
+
+        ids = self._with_groups(list(self._unproxied("selected_ids")))
+        wanted = set(ids)
+        shapes = self._unproxied("shapes")
+        members = [s for s in shapes if s["id"] in wanted]
+        if not members or (len(members) == 1 and members[0]["type"] == "instance"):
             return
         self._save_to_history()
+        symbols = self._unproxied("symbols")
+        # Symbols hold plain shapes with their paint, so nested instances are expanded
+        plain = inline_styles(expand_instances(members, symbols), self._unproxied("styles"))
+        symbol, box = define_symbol(plain)
+        symbol_id = new_symbol_id(symbols)
+        self.symbols[symbol_id] = symbol
+        # Instances are drawn by their symbol and carry no paint of their own
+        instance: Shape = {
+            "id": str(uuid.uuid4()),
+            "type": "instance",
+            "x": box[0],
+            "y": box[1],
+            "width": symbol["width"],
+            "height": symbol["height"],
+            "end_x": 0,
+            "end_y": 0,
+            "content": "",
+            "points": "",
+            "path_data": "",
+            "src": symbol_id,
+            "display_src": "",
+            "tiled": False,
+            "groups": [],
+            "style": "",
+            "version": next_shape_version(),
+        }
+        # The instance takes the topmost member's place in the stacking order
+        top = max(i for i, s in enumerate(shapes) if s["id"] in wanted)
+        rest = [s for s in shapes[:top] if s["id"] not in wanted]
+        self._set_shapes(rest + [instance] + shapes[top + 1:])
+        self._select([instance["id"]])
+
+    @rx.event
+    def detach_instances(self):
+        """Replace the selected instances with editable copies of their symbols' shapes."""
+        from codoc_in_vecdraw.states.symbols import expand_instance
+
+        wanted = set(self._unproxied("selected_ids"))
+        shapes = self._unproxied("shapes")
+        if not any(s["type"] == "instance" and s["id"] in wanted for s in shapes):
+            return
+        self._save_to_history()
+        symbols = self._unproxied("symbols")
+        detached = []
         new_shapes = []
-        for shape in self.shapes:
-            if shape["id"] == self.selected_shape_id:
-                s = shape.copy()
-                s[key] = value
+        for s in shapes:
+            if s["type"] != "instance" or s["id"] not in wanted:
                 new_shapes.append(s)
-            else:
-                new_shapes.append(shape)
-        self.shapes = new_shapes
+                continue
+            for part in expand_instance(s, symbols):
+                part = self._with_style({**part, "id": str(uuid.uuid4()), "version": next_shape_version()})
+                new_shapes.append(part)
+                detached.append(part["id"])
+        left = {s["src"] for s in shapes if s["type"] == "instance" and s["id"] in wanted}
+        self._set_shapes(new_shapes)
+        self._prune_symbols(left)
+        self._select(detached)
+
+    @rx.event
+    def set_stroke_fidelity(self, fidelity: str):
+        """Choose how closely new pencil strokes follow the pointer in this room."""
+        from codoc_in_vecdraw.rendering.strokes import STROKE_FIDELITY
+
+        if fidelity in STROKE_FIDELITY:
+            self.stroke_fidelity = fidelity
+
+    @rx.event
+    def set_keep_raw_points(self, keep: bool):
+        """Choose whether new strokes keep every pointer sample for later re-simplification."""
+        self.keep_raw_points = bool(keep)
+
+    @rx.event
+    def resimplify_selected(self):
+        """Refit the selected pencil strokes from their stored points at the room's fidelity."""
+        from codoc_in_vecdraw.rendering.point_codec import point_count, unpack_points
+
+        shapes = self._unproxied("shapes")
+        replaced = {}
+        for i in self._selected_indices():
+            shape = shapes[i]
+            if shape["type"] != "pencil" or point_count(shape["points"]) < 2:
+                continue
+            points, d = self._fit_stroke(unpack_points(shape["points"]))
+            replaced[i] = {**shape, "points": points, "path_data": d, "version": next_shape_version()}
+        if replaced:
+            self._save_to_history()
+            self._replace_shapes(replaced)
 
     @rx.event
     def delete_selected(self):
-        """Delete the currently selected shape."""
-        if not self.selected_shape_id:
+        """Delete every selected shape as one undoable step."""
+        if not self.selected_ids:
             return
         self._save_to_history()
-        self.shapes = [s for s in self.shapes if s["id"] != self.selected_shape_id]
-        self.selected_shape_id = ""
+        ids = set(self._unproxied("selected_ids"))
+        shapes = self._unproxied("shapes")
+        left = {s.get("style", "") for s in shapes if s["id"] in ids}
+        placed = {s["src"] for s in shapes if s["type"] == "instance" and s["id"] in ids}
+        self._set_shapes([s for s in shapes if s["id"] not in ids])
+        self._prune_styles(left)
+        self._prune_symbols(placed)
+        self._select([])
+        self._sync_blob_refs()
+
+    def _restore(self, entry: tuple[list[Shape], dict[str, Style], dict[str, Symbol], tuple[int, str]]):
+        """Return the board to a history entry, keeping what others wrote after it began.
+
+        With no such writes the entry's shapes, styles and symbols are restored
+        as they were, order included; otherwise only the rest of the step is reverted.
+        """
+        from codoc_in_vecdraw.states.doc_ops import diff_ops
+
+        shapes, styles, symbols, since = entry
+        clock = self._doc_clock()
+        ops = diff_ops(self._unproxied("shapes"), shapes, clock.tick(self._actor()))
+        kept = clock.without_later_writes(ops, since)
+        if len(kept) == len(ops) and all(a is b for a, b in zip(kept, ops)):
+            for op in ops:
+                clock.record(op)
+            self.shapes = shapes
+            self._update_lod_for_ops(ops)
+            self.styles = styles
+            self.symbols = symbols
+            return
+        self._apply_ops(kept)
+        # Kept shapes may use style entries and symbols added since
+        self.styles = {**self._unproxied("styles"), **styles}
+        self.symbols = {**self._unproxied("symbols"), **symbols}
+
+    def _history_entry(self) -> tuple[list[Shape], dict[str, Style], dict[str, Symbol], tuple[int, str]]:
+        """Return a snapshot of the board for the opposite history stack."""
+        return (
+            list(self._unproxied("shapes")),
+            dict(self._unproxied("styles")),
+            dict(self._unproxied("symbols")),
+            self._since(),
+        )
 
     @rx.event
     def undo(self):
         """Undo the last action."""
-        if self.past:
-            self.future.append(copy.deepcopy(self.shapes))
-            self.shapes = self.past.pop()
-            self.selected_shape_id = ""
+        if self._past:
+            self._future.append(self._history_entry())
+            self._restore(self._past.pop())
+            self.can_undo = bool(self._past)
+            self.can_redo = True
+            self._select([])
 
     @rx.event
     def redo(self):
         """Redo the last undone action."""
-        if self.future:
-            self.past.append(copy.deepcopy(self.shapes))
-            self.shapes = self.future.pop()
-            self.selected_shape_id = ""
-
-    @rx.event
-    async def handle_upload(self, files: list[rx.UploadFile]):
-        """Handle image upload."""
-        for file in files:
-            upload_data = await file.read()
-            # Generate a safe filename using UUID to avoid encoding issues
-            ext = file.filename.split(".")[-1] if "." in file.filename else "png"
-            safe_filename = f"{uuid.uuid4()}.{ext}"
-            
-            outfile = rx.get_upload_dir() / safe_filename
-            with open(outfile, "wb") as f:
-                f.write(upload_data)
-            
+        if self._future:
+            self._past.append(self._history_entry())
+            self._restore(self._future.pop())
+            self.can_undo = True
+            self.can_redo = bool(self._future)
+            self._select([])
+
+    @rx.event
+    def add_uploaded_images(self, results: list[dict]):
+        """Add an image shape for each file the client streamed to the blob route."""
+        from codoc_in_vecdraw.storage.blob_store import BLOB_NAME, get_blob_store
+
+        store = get_blob_store()
+        errors = []
+        stored = []
+        for result in results or []:
+            filename = str(result.get("filename", ""))
+            safe_filename = str(result.get("name", ""))
+            # Names come from the client, so only accept blobs that really were stored.
+            if not BLOB_NAME.match(safe_filename) or not (store.root / safe_filename).is_file():
+                error = result.get("error") or f"{filename} was not stored"
+                print(f"Upload of {filename} failed: {error}")
+                errors.append(rx.toast(f"Upload failed: {error}"))
+                continue
+            stored.append(safe_filename)
+
             # Add image shape
             self._save_to_history()
             print(f"DEBUG: Adding image shape for {safe_filename}")
+            # Placed 100px in from the visible top-left corner
+            left, top = self._to_canvas(100, 100)
             new_shape: Shape = {
                 "id": str(uuid.uuid4()),
                 "type": "image",
-                "x": 100 - self.pan_x,
-                "y": 100 - self.pan_y,
+                "x": left,
+                "y": top,
                 "width": 200,
                 "height": 200,
                 "fill": "none",
@@ -582,13 +1634,121 @@ class EditorState(rx.SharedState):
                 "end_x": 0,
                 "end_y": 0,
                 "content": "",
-                "points": [],
+                "points": "",
                 "path_data": "",
                 "src": safe_filename,
+                "display_src": "",
+                "tiled": False,
+                "groups": [],
+                "style": "",
+                "version": next_shape_version(),
             }
-            # Explicitly reassign shapes to ensure state update triggers
-            self.shapes = self.shapes + [new_shape]
-            self.selected_shape_id = new_shape["id"]
+            new_shape = self._with_style(new_shape)
+            self._add_shape(new_shape)
+            self._select([new_shape["id"]])
+        self._sync_blob_refs()
+        # Queued behind the refs just reported, so it sees the new images in use
+        store.submit(store.maybe_collect_garbage)
+        return errors + [EditorState.build_image_derivatives(stored)]
+
+    @rx.event
+    async def handle_import(self, files: list[rx.UploadFile]):
+        """Import exported JSON documents, streamed and validated in batches."""
+        from codoc_in_vecdraw.states.styles import paint_key, styled
+        from codoc_in_vecdraw.storage.document_import import DocumentImportError, read_shape_batches
+
+        if self.is_importing:
+            return
+        self.is_importing = True
+        self.import_progress = 0
+        yield
+
+        before = list(self._unproxied("shapes"))
+        styles_before = dict(self._unproxied("styles"))
+        symbols_before = dict(self._unproxied("symbols"))
+        since = self._since()
+        shapes = list(before)
+        ids = {s["id"] for s in shapes}
+        symbols = self._unproxied("symbols")
+        # Imports repeat a few paints many times; look each up in the room once
+        style_ids: dict[tuple, str] = {}
+        imported = rejected = 0
+        try:
+            for file in files:
+                # Each imported copy gets groups of its own, never those of the board or another copy
+                group_ids: dict[str, str] = {}
+                async for batch, skipped, read in read_shape_batches(file, symbols):
+                    for shape in batch:
+                        if not shape["id"] or shape["id"] in ids:
+                            shape["id"] = str(uuid.uuid4())
+                        ids.add(shape["id"])
+                        if shape["groups"]:
+                            shape["groups"] = [
+                                group_ids.setdefault(g, str(uuid.uuid4())) for g in shape["groups"]
+                            ]
+                        shape["version"] = next_shape_version()
+                        if shape["type"] != "instance":
+                            key = paint_key(shape)
+                            if key not in style_ids:
+                                style_ids[key] = self._style_for(shape)
+                            shape = styled(shape, style_ids[key])
+                        shapes.append(shape)
+                    imported += len(batch)
+                    rejected += skipped
+                    if file.size:
+                        self.import_progress = min(100, read * 100 // file.size)
+                    # Only the progress goes out; the shapes are added at the end
+                    yield
+        except DocumentImportError as e:
+            print(f"Import failed: {e}")
+            self.styles = styles_before
+            self.is_importing = False
+            yield rx.toast(f"Import failed: {e}")
+            return
+
+        # One assignment and one undo step for the whole import
+        self._push_history(before, styles_before, since, symbols_before)
+        self._set_shapes(shapes)
+        self._select([])
+        self._sync_blob_refs()
+        self.is_importing = False
+        self.import_progress = 100
+        message = f"Imported {imported} shapes"
+        if rejected:
+            message += f", skipped {rejected} invalid"
+        yield rx.toast(message)
+
+    @rx.event(background=True)
+    async def build_image_derivatives(self, srcs: list[str]):
+        """Generate downscaled derivatives for new uploads, then point image shapes at them."""
+        from codoc_in_vecdraw.storage.derivatives import generate_derivatives
+        from codoc_in_vecdraw.storage.tile_pyramid import generate_pyramid
+
+        for src in srcs:
+            try:
+                await generate_derivatives(src)
+                tiled = await generate_pyramid(src) is not None
+            except Exception as e:
+                print(f"Failed to build derivatives for {src}: {e}")
+                continue
+            async with self:
+                # Only these two fields are written, so edits made while the
+                # derivatives were building are kept
+                clock = self._doc_clock()
+                stamp = clock.tick(self._actor())
+                ops = []
+                for s in self._unproxied("shapes"):
+                    if s["type"] != "image" or s["src"] != src:
+                        continue
+                    fields = {}
+                    display_src = self._with_display_src(s)["display_src"]
+                    if display_src != s.get("display_src", ""):
+                        fields["display_src"] = display_src
+                    if tiled and not s.get("tiled"):
+                        fields["tiled"] = True
+                    if fields:
+                        ops.append({"op": "set", "id": s["id"], "fields": fields, "stamp": stamp})
+                self._apply_ops(ops)
 
     # --- AI Operations Interface ---
     
@@ -608,6 +1768,127 @@ class EditorState(rx.SharedState):
     def set_ai_ops_json(self, value: str):
         self.ai_ops_json = value
 
+    def _shape_from_op(self, op: dict) -> Shape | None:
+        """Build the shape added by an AI operation, with inline paint."""
+        from codoc_in_vecdraw.states.styles import styled
+
+        op_type = op.get("op")
+        # Common properties
+        shape_id = op.get("id", str(uuid.uuid4()))
+        x = op.get("x", 0)
+        y = op.get("y", 0)
+        fill = op.get("fill", "#000000")
+        stroke = op.get("stroke", "none")
+        stroke_width = op.get("stroke_width", 1)
+        
+        new_shape: Shape = {
+            "id": shape_id,
+            "type": "rectangle", # default
+            "x": x,
+            "y": y,
+            "width": 100,
+            "height": 100,
+            "fill": fill,
+            "stroke": stroke,
+            "stroke_width": stroke_width,
+            "end_x": 0,
+            "end_y": 0,
+            "content": "",
+            "points": "",
+            "path_data": "",
+            "src": "",
+            "display_src": "",
+            "tiled": False,
+            "groups": [],
+            "style": "",
+            "version": next_shape_version(),
+        }
+
+        if op_type == "addRect" or op_type == "add_rectangle":
+            new_shape["type"] = "rectangle"
+            new_shape["width"] = op.get("width", 100)
+            new_shape["height"] = op.get("height", 100)
+        
+        elif op_type == "addEllipse" or op_type == "add_ellipse":
+            new_shape["type"] = "ellipse"
+            # Support rx/ry or width/height
+            if "rx" in op:
+                new_shape["width"] = op["rx"] * 2
+            else:
+                new_shape["width"] = op.get("width", 100)
+                
+            if "ry" in op:
+                new_shape["height"] = op["ry"] * 2
+            else:
+                new_shape["height"] = op.get("height", 100)
+                
+            # If cx/cy provided, adjust x/y to top-left
+            if "cx" in op:
+                new_shape["x"] = op["cx"] - new_shape["width"] / 2
+            if "cy" in op:
+                new_shape["y"] = op["cy"] - new_shape["height"] / 2
+
+        elif op_type == "addText" or op_type == "add_text":
+            new_shape["type"] = "text"
+            new_shape["content"] = op.get("content", "Text")
+            new_shape["height"] = op.get("font_size", 20) # Map font_size to height for text
+            
+        elif op_type == "addLine" or op_type == "add_line":
+            new_shape["type"] = "line"
+            new_shape["end_x"] = op.get("end_x", x + 100)
+            new_shape["end_y"] = op.get("end_y", y + 100)
+
+        elif op_type == "addInstance" or op_type == "add_instance":
+            symbol = self._unproxied("symbols").get(op.get("symbol", ""))
+            if symbol is None:
+                return None
+            # Instances are drawn by their symbol and carry no paint of their own
+            new_shape = styled(new_shape, "")
+            new_shape["type"] = "instance"
+            new_shape["src"] = op["symbol"]
+            new_shape["width"] = op.get("width", symbol["width"])
+            new_shape["height"] = op.get("height", symbol["height"])
+
+        return new_shape
+
+    def _check_ai_ops(self, ops: list[dict]):
+        """Reject a batch, before it changes anything, if it is not safe to apply.
+
+        It may not reuse a shape or symbol id, and its coordinates and sizes
+        must be numbers.
+        """
+        taken = {s["id"] for s in self._unproxied("shapes")}
+        symbols = set(self._unproxied("symbols"))
+        for op in [*ops, *(part for op in ops for part in op.get("shapes", ()))]:
+            for name in AI_NUMBER_FIELDS:
+                if name in op and (isinstance(op[name], str) or _number(op[name]) is None):
+                    raise ValueError(f"{name} of a {op.get('op')} op must be a number")
+        for op in ops:
+            if op.get("op") == "clear":
+                taken.clear()
+            elif op.get("op") in ("defineSymbol", "define_symbol"):
+                if op.get("id") in symbols:
+                    raise ValueError(f"symbol id {op['id']!r} is already in use")
+                if op.get("id"):
+                    symbols.add(op["id"])
+            elif "id" in op:
+                if op["id"] in taken:
+                    raise ValueError(f"shape id {op['id']!r} is already in use")
+                taken.add(op["id"])
+
+    def _define_symbol_from_ops(self, op: dict) -> str:
+        """Add a symbol built from the add operations listed in ``op["shapes"]`` and return its id."""
+        from codoc_in_vecdraw.states.symbols import define_symbol, new_symbol_id
+
+        parts = [self._shape_from_op(part) for part in op.get("shapes", [])]
+        parts = [p for p in parts if p is not None and p["type"] != "instance"]
+        if not parts:
+            return ""
+        symbol, _ = define_symbol(parts, op.get("name", ""))
+        symbol_id = op.get("id") or new_symbol_id(self._unproxied("symbols"))
+        self.symbols[symbol_id] = symbol
+        return symbol_id
+
     @rx.event
     def run_ai_ops(self):
         """Parse and execute AI operations from JSON."""
@@ -617,77 +1898,34 @@ class EditorState(rx.SharedState):
             if not isinstance(ops, list):
                 ops = [ops]
             
+            self._check_ai_ops(ops)
             self._save_to_history()
+            # Symbols defined or cleared away by the batch, dropped at the end if nothing places them
+            unplaced: set[str] = set()
             
             for op in ops:
                 op_type = op.get("op")
                 
                 if op_type == "clear":
-                    self.shapes = []
+                    unplaced |= {s["src"] for s in self._unproxied("shapes") if s["type"] == "instance"}
+                    self._set_shapes([])
                     continue
                 
-                # Common properties
-                shape_id = op.get("id", str(uuid.uuid4()))
-                x = op.get("x", 0)
-                y = op.get("y", 0)
-                fill = op.get("fill", "#000000")
-                stroke = op.get("stroke", "none")
-                stroke_width = op.get("stroke_width", 1)
-                
-                new_shape: Shape = {
-                    "id": shape_id,
-                    "type": "rectangle", # default
-                    "x": x,
-                    "y": y,
-                    "width": 100,
-                    "height": 100,
-                    "fill": fill,
-                    "stroke": stroke,
-                    "stroke_width": stroke_width,
-                    "end_x": 0,
-                    "end_y": 0,
-                    "content": "",
-                    "points": [],
-                    "path_data": "",
-                    "src": "",
-                }
+                if op_type == "defineSymbol" or op_type == "define_symbol":
+                    unplaced.add(self._define_symbol_from_ops(op))
+                    continue
 
-                if op_type == "addRect" or op_type == "add_rectangle":
-                    new_shape["type"] = "rectangle"
-                    new_shape["width"] = op.get("width", 100)
-                    new_shape["height"] = op.get("height", 100)
-                
-                elif op_type == "addEllipse" or op_type == "add_ellipse":
-                    new_shape["type"] = "ellipse"
-                    # Support rx/ry or width/height
-                    if "rx" in op:
-                        new_shape["width"] = op["rx"] * 2
-                    else:
-                        new_shape["width"] = op.get("width", 100)
-                        
-                    if "ry" in op:
-                        new_shape["height"] = op["ry"] * 2
-                    else:
-                        new_shape["height"] = op.get("height", 100)
-                        
-                    # If cx/cy provided, adjust x/y to top-left
-                    if "cx" in op:
-                        new_shape["x"] = op["cx"] - new_shape["width"] / 2
-                    if "cy" in op:
-                        new_shape["y"] = op["cy"] - new_shape["height"] / 2
-
-                elif op_type == "addText" or op_type == "add_text":
-                    new_shape["type"] = "text"
-                    new_shape["content"] = op.get("content", "Text")
-                    new_shape["height"] = op.get("font_size", 20) # Map font_size to height for text
-                    
-                elif op_type == "addLine" or op_type == "add_line":
-                    new_shape["type"] = "line"
-                    new_shape["end_x"] = op.get("end_x", x + 100)
-                    new_shape["end_y"] = op.get("end_y", y + 100)
-                
-                self.shapes.append(new_shape)
+                new_shape = self._shape_from_op(op)
+                if new_shape is None:
+                    continue
+                if new_shape["type"] != "instance":
+                    new_shape = self._with_style(new_shape)
+                self._add_shape(new_shape)
             
+            unplaced.discard("")
+            self._prune_symbols(unplaced)
+            self._sync_blob_refs()
+
             # Close modal on success
             self.is_ai_modal_open = False
             rx.toast("AI Operations executed successfully")
@@ -696,15 +1934,96 @@ class EditorState(rx.SharedState):
             print(f"Error executing AI ops: {e}")
             rx.toast(f"Error: {str(e)}")
 
-    @rx.var
+    @rx.var(deps=["shapes", "styles", "symbols"], auto_deps=False)
     def json_data_base64(self) -> str:
         """Get the Base64 encoded JSON representation of the current shapes."""
-        json_str = json.dumps(self.shapes)
+        from codoc_in_vecdraw.rendering.point_codec import expand_points
+        from codoc_in_vecdraw.states.styles import inline_style
+        from codoc_in_vecdraw.states.symbols import expand_instances
+
+        # Exported documents keep the plain {"x", "y"} point lists, inline
+        # paint and no instances
+        styles = self._unproxied("styles")
+        shapes = expand_instances(self._unproxied("shapes"), self._unproxied("symbols"))
+        json_str = json.dumps([expand_points(inline_style(s, styles)) for s in shapes])
         return base64.b64encode(json_str.encode("utf-8")).decode("utf-8")
 
+    @rx.event
+    async def export_document(self):
+        """Download the document in the binary .vdoc format.
+
+        The document is written to an export file on a worker thread and the
+        browser fetches that file, rather than receiving it over the websocket.
+        """
+        import asyncio
+        from codoc_in_vecdraw.states.styles import inline_styles
+        from codoc_in_vecdraw.states.symbols import expand_instances
+        from codoc_in_vecdraw.storage.document_format import DocumentFormatError, write_document
+        from codoc_in_vecdraw.storage.exports import write_binary_export
+
+        # Same content as the JSON export: inline paint and no instances. A
+        # new list of never-mutated shapes, safe to read from the worker thread
+        shapes = inline_styles(
+            expand_instances(self._unproxied("shapes"), self._unproxied("symbols")),
+            self._unproxied("styles"),
+        )
+        try:
+            name = await asyncio.to_thread(write_binary_export, lambda f: f.write(write_document(shapes)), "vdoc")
+        except DocumentFormatError as e:
+            print(f"Export failed: {e}")
+            return rx.toast(f"Export failed: {e}")
+        return rx.download(url=rx.get_upload_url(name), filename="drawing.vdoc")
+
+    @rx.event
+    async def export_svg(self, embed_images: bool = True):
+        """Render the whole document to SVG on the server and download it.
+
+        The SVG is streamed into an export file as it is generated and the
+        browser fetches that file, so it never sits whole in memory.
+        """
+        import asyncio
+        from codoc_in_vecdraw.rendering.svg_renderer import iter_svg
+        from codoc_in_vecdraw.states.styles import inline_styles
+        from codoc_in_vecdraw.storage.exports import write_export
+
+        # A new list of never-mutated shapes, safe to read from the worker thread
+        chunks = iter_svg(
+            inline_styles(self._unproxied("shapes"), self._unproxied("styles")),
+            embed_images=embed_images,
+            symbols=dict(self._unproxied("symbols")),
+        )
+        name = await asyncio.to_thread(write_export, chunks, "svg")
+        return rx.download(url=rx.get_upload_url(name), filename="drawing.svg")
+
+    @rx.event
+    async def export_png(self, dpi: int = 96):
+        """Rasterize the whole document on the server at the given DPI and download it.
+
+        Bands of the PNG are encoded straight into an export file, which the
+        browser fetches, so the image never sits whole in memory.
+        """
+        import asyncio
+        import functools
+        from codoc_in_vecdraw.rendering.raster import rasterize_png
+        from codoc_in_vecdraw.states.styles import inline_styles
+        from codoc_in_vecdraw.states.symbols import expand_instances
+        from codoc_in_vecdraw.storage.exports import write_binary_export
+
+        # A new list of never-mutated shapes, safe to read from the worker thread
+        shapes = inline_styles(
+            expand_instances(self._unproxied("shapes"), self._unproxied("symbols")),
+            self._unproxied("styles"),
+        )
+        write = functools.partial(rasterize_png, shapes, dpi=dpi, upload_dir=rx.get_upload_dir())
+        # Tiles render in a process pool; keep the event loop free while they do.
+        name = await asyncio.to_thread(write_binary_export, write, "png")
+        return rx.download(url=rx.get_upload_url(name), filename="drawing.png")
+
     @rx.event
     def check_pending_ai_ops(self):
         """Poll for pending AI operations from external sources (MCP)."""
+        # Every open tab polls, so this also renews the session's blob lease
+        self._renew_blob_lease()
         # Use current room_id or "default" if empty
         target_room = self.room_id if self.room_id else "default"
         
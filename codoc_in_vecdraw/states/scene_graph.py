@@ -0,0 +1,211 @@
+"""Scene graph of nested shape groups with cached bounding boxes.
+
+Shapes stay a flat, draw-ordered list; each shape lists the ids of the groups
+containing it in its ``groups`` field, outermost first, and the members of a
+group are kept next to each other (``gather_groups``). The graph rebuilds the
+tree from those paths. Every node caches its bounding box, and editing a
+shape only marks the boxes of its ancestors stale, so hit-testing and area
+queries can skip whole groups whose box misses the point or region.
+"""
+
+from codoc_in_vecdraw.rendering.svg_renderer import shape_bounds
+
+# Slack around boxes when hit-testing, so thin lines are easy to pick.
+HIT_MARGIN = 5
+
+
+def groups_contiguous(shapes: list[dict]) -> bool:
+    """Whether the members of every group are next to each other in ``shapes``."""
+    closed = set()
+    open_groups: list[str] = []
+    for shape in shapes:
+        path = shape.get("groups") or []
+        common = 0
+        while common < min(len(open_groups), len(path)) and open_groups[common] == path[common]:
+            common += 1
+        closed.update(open_groups[common:])
+        if not closed.isdisjoint(path[common:]):
+            return False
+        open_groups = path
+    return True
+
+
+def gather_groups(shapes: list[dict]) -> list[dict]:
+    """Return ``shapes`` with the members of every group next to each other.
+
+    A group is drawn, and hit, at the place of its topmost member, so members
+    below it move up to join that one, keeping their order. Returns the list
+    itself when every group is already contiguous.
+    """
+    if groups_contiguous(shapes):
+        return shapes
+    root: list = []
+    children: dict[str, list] = {}
+    # Place of each group in its parent's children, updated to its topmost member
+    slots: dict[str, tuple[list, int]] = {}
+    for i, shape in enumerate(shapes):
+        siblings = root
+        for group_id in shape.get("groups") or ():
+            if group_id not in children:
+                children[group_id] = []
+                siblings.append(group_id)
+                slots[group_id] = (siblings, len(siblings) - 1)
+            else:
+                # Move the group after everything its parent gained since
+                parent, at = slots[group_id]
+                parent[at] = None
+                parent.append(group_id)
+                slots[group_id] = (parent, len(parent) - 1)
+            siblings = children[group_id]
+        siblings.append(i)
+    gathered = []
+    stack = list(reversed(root))
+    while stack:
+        item = stack.pop()
+        if isinstance(item, int):
+            gathered.append(shapes[item])
+        elif item is not None:
+            stack.extend(reversed(children[item]))
+    return gathered
+
+
+class SceneNode:
+    """A group, or a leaf standing for the shape at ``index``."""
+
+    __slots__ = ("id", "parent", "children", "index", "_bounds")
+
+    def __init__(self, node_id: str, parent: "SceneNode | None", index: int = -1):
+        self.id = node_id
+        self.parent = parent
+        self.children: list[SceneNode] = []
+        self.index = index
+        self._bounds: tuple[float, float, float, float] | None = None
+
+    @property
+    def is_group(self) -> bool:
+        return self.index < 0
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        """Box around the node, recomputed from its children only when stale."""
+        if self._bounds is None:
+            boxes = [c.bounds for c in self.children]
+            self._bounds = (
+                min(b[0] for b in boxes),
+                min(b[1] for b in boxes),
+                max(b[2] for b in boxes),
+                max(b[3] for b in boxes),
+            ) if boxes else (0, 0, 0, 0)
+        return self._bounds
+
+    def invalidate(self):
+        """Mark the boxes of this node's groups stale."""
+        node = self.parent
+        # A stale group's ancestors are already stale
+        while node is not None and node._bounds is not None:
+            node._bounds = None
+            node = node.parent
+
+    def leaves(self) -> list["SceneNode"]:
+        """Return the leaves under this node in draw order."""
+        if not self.is_group:
+            return [self]
+        found = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_group:
+                stack.extend(reversed(node.children))
+            else:
+                found.append(node)
+        return found
+
+
+class SceneGraph:
+    """Tree of groups over a shapes list, tied to that exact list object."""
+
+    def __init__(self, shapes: list[dict]):
+        self.shapes = shapes
+        self.root = SceneNode("", None)
+        self.groups: dict[str, SceneNode] = {}
+        self.leaves: list[SceneNode] = []
+        self.by_id: dict[str, SceneNode] = {}
+        for i, shape in enumerate(shapes):
+            parent = self.root
+            for group_id in shape.get("groups") or ():
+                node = self.groups.get(group_id)
+                if node is None:
+                    node = self.groups[group_id] = SceneNode(group_id, parent)
+                    parent.children.append(node)
+                parent = node
+            leaf = SceneNode(shape["id"], parent, i)
+            leaf._bounds = shape_bounds(shape)
+            parent.children.append(leaf)
+            self.leaves.append(leaf)
+            self.by_id[leaf.id] = leaf
+
+    def is_current(self, shapes: list[dict]) -> bool:
+        """Whether the graph still describes ``shapes``.
+
+        Every structural edit assigns a new list or changes its length; only
+        in-place replacements, reported through ``update``, keep both.
+        """
+        return self.shapes is shapes and len(self.leaves) == len(shapes)
+
+    def update(self, index: int, shape: dict) -> bool:
+        """Refresh the leaf of a replaced shape; False if its groups changed."""
+        leaf = self.leaves[index]
+        path = list(shape.get("groups") or ())
+        node = leaf.parent
+        for group_id in reversed(path):
+            if node is None or node.id != group_id:
+                return False
+            node = node.parent
+        if node is not self.root:
+            return False
+        if shape["id"] != leaf.id:
+            return False
+        leaf._bounds = shape_bounds(shape)
+        leaf.invalidate()
+        return True
+
+    def top_level(self, shape_id: str) -> SceneNode | None:
+        """Return the outermost group containing the shape, or its own leaf."""
+        node = self.by_id.get(shape_id)
+        while node is not None and node.parent is not self.root:
+            node = node.parent
+        return node
+
+    def hit(self, x: float, y: float, test) -> str:
+        """Return the id of the topmost shape under (x, y) accepted by ``test``."""
+        stack = list(self.root.children)
+        while stack:
+            node = stack.pop()
+            b = node.bounds
+            if not (
+                b[0] - HIT_MARGIN <= x <= b[2] + HIT_MARGIN
+                and b[1] - HIT_MARGIN <= y <= b[3] + HIT_MARGIN
+            ):
+                continue
+            if node.is_group:
+                # Children are visited topmost first
+                stack.extend(node.children)
+            elif test(self.shapes[node.index], x, y):
+                return node.id
+        return ""
+
+    def query(self, box: tuple[float, float, float, float]) -> list[int]:
+        """Return the positions of shapes whose boxes intersect ``box``."""
+        min_x, min_y, max_x, max_y = box
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            b = node.bounds
+            if b[0] > max_x or b[2] < min_x or b[1] > max_y or b[3] < min_y:
+                continue
+            if node.is_group:
+                stack.extend(node.children)
+            else:
+                found.append(node.index)
+        return sorted(found)
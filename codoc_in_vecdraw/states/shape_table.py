@@ -0,0 +1,160 @@
+"""Columnar hit-test, box-query and bounds index of shapes for very large boards.
+
+This is an index, not a store. Shapes stay the list of dicts that Reflex
+syncs to every client and the components render, so that list remains the
+only copy of the document; a second, columnar copy of everything would
+double the memory it was meant to save. The table mirrors only what its
+queries read: one NumPy column per geometry field, the shape type interned
+as a small integer code, and the version that tells whether a row is
+current. Clicks, marquee selections and the box around a selection then run
+as array operations over the whole board instead of a Python loop per
+shape, and the mirror costs about 70 bytes a shape.
+
+NumPy is opt-in through the ``fast`` extra: without
+it ``ShapeTable.available()`` is False and callers use the scene graph and a
+grid index instead.
+"""
+
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Slack around lines when hit-testing, matching EditorState._hits_shape.
+LINE_HIT_MARGIN = 5
+
+# Numeric fields stored as float64 columns.
+GEOMETRY_FIELDS = ("x", "y", "width", "height", "end_x", "end_y")
+
+# Types hit-tested by their box, like EditorState._hits_shape.
+BOX_HIT_TYPES = ("rectangle", "image", "text", "triangle", "pencil", "instance")
+
+
+class StringTable:
+    """Interns strings into dense integer codes."""
+
+    __slots__ = ("strings", "codes")
+
+    def __init__(self):
+        self.strings: list[str] = []
+        self.codes: dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def find(self, value: str) -> int:
+        """Return the code of ``value``, or -1 if it was never interned."""
+        return self.codes.get(value, -1)
+
+
+class ShapeTable:
+    """Geometry and types of shapes stored column-wise, tied to the list they were built from."""
+
+    @staticmethod
+    def available() -> bool:
+        """Whether NumPy is installed, so tables can be built."""
+        return np is not None
+
+    def __init__(self, shapes: list[dict]):
+        self.shapes = shapes
+        self.kinds = StringTable()
+        self.ids = [s["id"] for s in shapes]
+        self.kind = np.fromiter((self.kinds.code(s["type"]) for s in shapes), np.int16, len(shapes))
+        self.version = np.fromiter((s.get("version", 0) for s in shapes), np.int64, len(shapes))
+        self.columns = {
+            name: np.fromiter((s.get(name, 0) for s in shapes), np.float64, len(shapes))
+            for name in GEOMETRY_FIELDS
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def is_current(self, shapes: list[dict]) -> bool:
+        """Whether the table still describes ``shapes``.
+
+        As with the scene graph, structural edits assign a new list or change
+        its length; in-place replacements are reported through ``update``.
+        """
+        return self.shapes is shapes and len(self.ids) == len(shapes)
+
+    def update(self, i: int, shape: dict) -> bool:
+        """Store a replaced shape in row ``i``; False if it is a different shape."""
+        if shape["id"] != self.ids[i]:
+            return False
+        if self.version[i] == shape.get("version", 0):
+            # Versions are never reused, so the row already holds this shape
+            return True
+        self.kind[i] = self.kinds.code(shape["type"])
+        self.version[i] = shape.get("version", 0)
+        for name, column in self.columns.items():
+            column[i] = shape.get(name, 0)
+        return True
+
+    def _kind_mask(self, kinds: Iterable[str]):
+        codes = [c for c in map(self.kinds.find, kinds) if c >= 0]
+        return np.isin(self.kind, codes)
+
+    def boxes(self, rows=None):
+        """Return the (min_x, min_y, max_x, max_y) columns of the shapes' boxes.
+
+        Covers every shape, or only ``rows`` (an index array) when given.
+        """
+        c = self.columns
+        kind = self.kind
+        if rows is not None:
+            c = {name: column[rows] for name, column in c.items()}
+            kind = kind[rows]
+        line = kind == self.kinds.find("line")
+        far_x = np.where(line, c["end_x"], c["x"] + c["width"])
+        far_y = np.where(line, c["end_y"], c["y"] + c["height"])
+        # Lines may run right to left; other shapes keep the shape_bounds convention
+        min_x = np.where(line, np.minimum(c["x"], far_x), c["x"])
+        min_y = np.where(line, np.minimum(c["y"], far_y), c["y"])
+        max_x = np.where(line, np.maximum(c["x"], far_x), far_x)
+        max_y = np.where(line, np.maximum(c["y"], far_y), far_y)
+        return min_x, min_y, max_x, max_y
+
+    def bounds(self, rows: list[int]) -> tuple[float, float, float, float] | None:
+        """Return the box around the shapes in ``rows``, or None when there are none.
+
+        Matches ``transforms.selection_box`` over the same shapes.
+        """
+        if not rows:
+            return None
+        min_x, min_y, max_x, max_y = self.boxes(np.asarray(rows, np.intp))
+        return (min_x.min().item(), min_y.min().item(), max_x.max().item(), max_y.max().item())
+
+    def query(self, box: tuple[float, float, float, float]) -> list[int]:
+        """Return the rows, in document order, of shapes whose boxes intersect ``box``."""
+        min_x, min_y, max_x, max_y = self.boxes()
+        hit = (min_x <= box[2]) & (max_x >= box[0]) & (min_y <= box[3]) & (max_y >= box[1])
+        return np.flatnonzero(hit).tolist()
+
+    def hit(self, x: float, y: float) -> int:
+        """Return the row of the topmost shape under (x, y), or -1."""
+        c = self.columns
+        sx, sy, w, h = c["x"], c["y"], c["width"], c["height"]
+        boxed = self._kind_mask(BOX_HIT_TYPES) & (sx <= x) & (x <= sx + w) & (sy <= y) & (y <= sy + h)
+
+        rx, ry = w / 2, h / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inside = ((x - sx - rx) / rx) ** 2 + ((y - sy - ry) / ry) ** 2 <= 1
+        ellipse = (self.kind == self.kinds.find("ellipse")) & (rx != 0) & (ry != 0) & inside
+
+        ex, ey = c["end_x"], c["end_y"]
+        m = LINE_HIT_MARGIN
+        line = (
+            (self.kind == self.kinds.find("line"))
+            & (np.minimum(sx, ex) - m <= x)
+            & (x <= np.maximum(sx, ex) + m)
+            & (np.minimum(sy, ey) - m <= y)
+            & (y <= np.maximum(sy, ey) + m)
+        )
+        rows = np.flatnonzero(boxed | ellipse | line)
+        return int(rows[-1]) if len(rows) else -1
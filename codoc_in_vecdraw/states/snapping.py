@@ -0,0 +1,233 @@
+"""Grid and object snapping for dragged shapes.
+
+Every shape contributes its left edge, centre and right edge to sorted x
+lists, and its top edge, centre and bottom edge to sorted y lists. A drag
+tick finds the closest edge or centre of another shape with a binary search
+per list and a short walk past the shapes being dragged, instead of a scan
+of the board. Replacing a shape moves only its own entries, so the index
+follows edits like the scene graph and the shape table do.
+
+Besides edges and centres, a box dropped between two neighbours in a row
+or column snaps to equal spacing, and with the grid on, boxes that found no
+object to snap to align their top-left corner to the grid.
+"""
+
+from bisect import bisect_left
+
+from codoc_in_vecdraw.rendering.svg_renderer import shape_bounds
+
+# Snapping reach in screen pixels; divided by the zoom to get canvas units.
+SNAP_DISTANCE = 6
+
+# Grid pitch in canvas units, matching the dotted canvas background.
+GRID_SIZE = 20
+
+# Most entries looked at when searching for an
+# equal-spacing neighbour, so a dense row cannot turn a tick into a scan.
+MAX_NEIGHBOUR_SCAN = 32
+
+
+class SortedEdges:
+    """One coordinate of every shape, sorted, with the id of each entry."""
+
+    __slots__ = ("coords", "ids")
+
+    def __init__(self, entries: list[tuple[float, str]]):
+        entries.sort()
+        self.coords = [c for c, _ in entries]
+        self.ids = [shape_id for _, shape_id in entries]
+
+    def add(self, coord: float, shape_id: str):
+        i = bisect_left(self.coords, coord)
+        self.coords.insert(i, coord)
+        self.ids.insert(i, shape_id)
+
+    def remove(self, coord: float, shape_id: str) -> bool:
+        """Drop the entry of ``shape_id`` at ``coord``; False if there is none."""
+        coords, ids = self.coords, self.ids
+        i = bisect_left(coords, coord)
+        while i < len(coords) and coords[i] == coord:
+            if ids[i] == shape_id:
+                del coords[i]
+                del ids[i]
+                return True
+            i += 1
+        return False
+
+    def nearest(self, value: float, reach: float, exclude: set[str]) -> tuple[float, str] | None:
+        """Return the closest (coord, id) within ``reach`` of ``value`` not in ``exclude``."""
+        coords, ids = self.coords, self.ids
+        start = bisect_left(coords, value)
+        best = None
+        # Walk outwards on each side until the first entry that is not excluded
+        i = start - 1
+        while i >= 0 and value - coords[i] <= reach:
+            if ids[i] not in exclude:
+                best = (coords[i], ids[i])
+                break
+            i -= 1
+        i = start
+        while i < len(coords) and coords[i] - value <= reach:
+            if ids[i] not in exclude:
+                if best is None or coords[i] - value < value - best[0]:
+                    best = (coords[i], ids[i])
+                break
+            i += 1
+        return best
+
+
+def _axis_entries(boxes: dict[str, tuple], lo: int) -> tuple[list, list, list]:
+    starts = [(b[lo], shape_id) for shape_id, b in boxes.items()]
+    centres = [((b[lo] + b[lo + 2]) / 2, shape_id) for shape_id, b in boxes.items()]
+    ends = [(b[lo + 2], shape_id) for shape_id, b in boxes.items()]
+    return starts, centres, ends
+
+
+class SnapIndex:
+    """Sorted edge and centre coordinates of the shapes of one list."""
+
+    def __init__(self, shapes: list[dict]):
+        self.shapes = shapes
+        self.ids = [s["id"] for s in shapes]
+        self.boxes = {s["id"]: shape_bounds(s) for s in shapes}
+        # x then y: (starts, centres, ends)
+        self.axes = tuple(
+            tuple(SortedEdges(entries) for entries in _axis_entries(self.boxes, lo))
+            for lo in (0, 1)
+        )
+
+    def is_current(self, shapes: list[dict]) -> bool:
+        """Whether the index still describes ``shapes``.
+
+        As with the scene graph, structural edits assign a new list or change
+        its length; in-place replacements are reported through ``update``.
+        """
+        return self.shapes is shapes and len(self.ids) == len(shapes)
+
+    def _entries(self, box: tuple) -> list[tuple[SortedEdges, float]]:
+        found = []
+        for lo, edges in enumerate(self.axes):
+            starts, centres, ends = edges
+            found += [(starts, box[lo]), (centres, (box[lo] + box[lo + 2]) / 2), (ends, box[lo + 2])]
+        return found
+
+    def update(self, i: int, shape: dict) -> bool:
+        """Move the entries of the shape replaced at row ``i``.
+
+        Returns False, leaving the index to be rebuilt, if it is a different
+        shape or its entries cannot be told apart from another's.
+        """
+        shape_id = shape["id"]
+        if shape_id != self.ids[i] or len(self.boxes) != len(self.ids):
+            return False
+        box = shape_bounds(shape)
+        old = self.boxes[shape_id]
+        if box == old:
+            return True
+        for edges, coord in self._entries(old):
+            if not edges.remove(coord, shape_id):
+                return False
+        for edges, coord in self._entries(box):
+            edges.add(coord, shape_id)
+        self.boxes[shape_id] = box
+        return True
+
+    def _object_snap(self, box: tuple, lo: int, reach: float, exclude: set[str]):
+        """Return (offset, coord, target id) of the closest edge or centre alignment on one axis."""
+        moving = (box[lo], (box[lo] + box[lo + 2]) / 2, box[lo + 2])
+        best = None
+        for value in moving:
+            for edges in self.axes[lo]:
+                hit = edges.nearest(value, reach, exclude)
+                if hit is not None and (best is None or abs(hit[0] - value) < abs(best[0])):
+                    best = (hit[0] - value, hit[0], hit[1])
+        return best
+
+    def _neighbour(self, edges: SortedEdges, value: float, box: tuple, lo: int, exclude: set[str], step: int):
+        """Return the box of the closest shape beyond ``value`` that overlaps ``box`` across the axis."""
+        across = 1 - lo
+        i = bisect_left(edges.coords, value) + (-1 if step < 0 else 0)
+        for _ in range(MAX_NEIGHBOUR_SCAN):
+            if not 0 <= i < len(edges.coords):
+                return None
+            shape_id = edges.ids[i]
+            other = self.boxes[shape_id]
+            if shape_id not in exclude and other[across] < box[across + 2] and other[across + 2] > box[across]:
+                return other
+            i += step
+        return None
+
+    def _spacing_snap(self, box: tuple, lo: int, reach: float, exclude: set[str]):
+        """Return (offset, before, after) centring the box between its two neighbours on one axis."""
+        starts, _, ends = self.axes[lo]
+        before = self._neighbour(ends, box[lo] + reach, box, lo, exclude, -1)
+        after = self._neighbour(starts, box[lo + 2] - reach, box, lo, exclude, 1)
+        if before is None or after is None:
+            return None
+        gap_before = box[lo] - before[lo + 2]
+        gap_after = after[lo] - box[lo + 2]
+        offset = (gap_after - gap_before) / 2
+        if abs(offset) > reach or gap_before + offset <= 0:
+            return None
+        return offset, before, after
+
+    def snap(self, box: tuple, exclude: set[str], reach: float, grid: int = 0) -> tuple[float, float, list[dict]]:
+        """Return the (dx, dy) moving ``box`` onto the nearest snap target, and guide lines.
+
+        Shapes in ``exclude`` (the ones being dragged) are never targets.
+        """
+        offsets = [0.0, 0.0]
+        found = [None, None]
+        for lo in (0, 1):
+            aligned = self._object_snap(box, lo, reach, exclude)
+            spaced = self._spacing_snap(box, lo, reach, exclude)
+            if aligned is not None and (spaced is None or abs(aligned[0]) <= abs(spaced[0])):
+                offsets[lo] = aligned[0]
+                found[lo] = ("aligned", aligned)
+            elif spaced is not None:
+                offsets[lo] = spaced[0]
+                found[lo] = ("spaced", spaced)
+            elif grid:
+                offset = round(box[lo] / grid) * grid - box[lo]
+                if abs(offset) <= reach:
+                    offsets[lo] = offset
+
+        # Guides are drawn against the box where it lands
+        dx, dy = offsets
+        box = (box[0] + dx, box[1] + dy, box[2] + dx, box[3] + dy)
+        guides = []
+        for lo, hit in enumerate(found):
+            if hit is None:
+                continue
+            across = 1 - lo
+            kind, value = hit
+            if kind == "aligned":
+                _, coord, target = value
+                other = self.boxes[target]
+                # A line through the shared coordinate spanning both boxes
+                start = min(box[across], other[across])
+                end = max(box[across + 2], other[across + 2])
+                guides.append(_line(lo, coord, start, end))
+            else:
+                _, before, after = value
+                # The two equal gaps, through the middle of the dragged box
+                mid = (box[across] + box[across + 2]) / 2
+                guides.append(_guide(lo, before[lo + 2], box[lo], mid))
+                guides.append(_guide(lo, box[lo + 2], after[lo], mid))
+        return dx, dy, guides
+
+
+def _line(lo: int, coord: float, start: float, end: float) -> dict:
+    """A guide at ``coord`` on axis ``lo`` running from ``start`` to ``end`` across it."""
+    coord, start, end = round(coord), round(start), round(end)
+    if lo == 0:
+        return {"x1": coord, "y1": start, "x2": coord, "y2": end}
+    return {"x1": start, "y1": coord, "x2": end, "y2": coord}
+
+
+def _guide(lo: int, start: float, end: float, across: float) -> dict:
+    """A guide along axis ``lo`` from ``start`` to ``end``, at ``across`` on the other axis."""
+    start, end, across = round(start), round(end), round(across)
+    if lo == 0:
+        return {"x1": start, "y1": across, "x2": end, "y2": across}
+    return {"x1": across, "y1": start, "x2": across, "y2": end}
@@ -0,0 +1,67 @@
+"""Bucketed bounding-box index for area queries over shapes.
+
+Shapes are hashed into a uniform grid by their bounding boxes, so finding
+the shapes in a rectangle only visits the cells it covers instead of every
+shape on the board.
+"""
+
+from collections import defaultdict
+
+from codoc_in_vecdraw.rendering.svg_renderer import shape_bounds
+
+# Side of a grid cell in canvas units.
+GRID_CELL = 256
+
+# Boxes covering more cells than this are kept in a list checked on every query,
+# so one huge shape does not fill thousands of buckets.
+MAX_CELLS_PER_BOX = 64
+
+
+class GridIndex:
+    """Uniform-grid index mapping cells to the positions of the shapes overlapping them."""
+
+    def __init__(self, shapes: list[dict], cell: int = GRID_CELL):
+        self.cell = cell
+        self.boxes = [shape_bounds(s) for s in shapes]
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        self.oversized: list[int] = []
+        for i, box in enumerate(self.boxes):
+            c0, r0, c1, r1 = self._cell_range(box)
+            if (c1 - c0 + 1) * (r1 - r0 + 1) > MAX_CELLS_PER_BOX:
+                self.oversized.append(i)
+                continue
+            for col in range(c0, c1 + 1):
+                for row in range(r0, r1 + 1):
+                    self.cells[(col, row)].append(i)
+
+    def _cell_range(self, box) -> tuple[int, int, int, int]:
+        return (
+            int(box[0] // self.cell),
+            int(box[1] // self.cell),
+            int(box[2] // self.cell),
+            int(box[3] // self.cell),
+        )
+
+    def query(self, box: tuple[float, float, float, float]) -> list[int]:
+        """Return the positions, in document order, of shapes intersecting ``box``."""
+        min_x, min_y, max_x, max_y = box
+        c0, r0, c1, r1 = self._cell_range(box)
+        candidates = set(self.oversized)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self.cells):
+            # The box covers more cells than are occupied; walk the occupied ones
+            for (col, row), members in self.cells.items():
+                if c0 <= col <= c1 and r0 <= row <= r1:
+                    candidates.update(members)
+        else:
+            for col in range(c0, c1 + 1):
+                for row in range(r0, r1 + 1):
+                    candidates.update(self.cells.get((col, row), ()))
+        boxes = self.boxes
+        return sorted(
+            i
+            for i in candidates
+            if boxes[i][0] <= max_x
+            and boxes[i][2] >= min_x
+            and boxes[i][1] <= max_y
+            and boxes[i][3] >= min_y
+        )
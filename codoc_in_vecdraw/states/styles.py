@@ -0,0 +1,91 @@
+"""Shared per-room style table for fill, stroke and stroke width.
+
+Shapes drawn with the same tool nearly all carry the same paint, and every
+copy of it was repeated in each shape, history snapshot and sync payload.
+Shapes now name an entry of the room's style table in their ``style`` field
+and drop their own ``fill``, ``stroke`` and ``stroke_width`` keys; shapes
+with an empty ``style`` (older documents) still use those inline fields.
+
+Entries are interned by value, so shapes painted alike share one entry, and
+editing an entry restyles every shape that uses it. Entries are replaced,
+never mutated, so history snapshots can share them. Documents leave the
+editor with the paint inlined again, so exports keep the plain shape schema.
+"""
+
+import uuid
+
+STYLE_FIELDS = ("fill", "stroke", "stroke_width")
+
+def paint_key(paint: dict) -> tuple:
+    """Return the hashable identity of a fill, stroke and stroke width."""
+    return tuple(paint[field] for field in STYLE_FIELDS)
+
+
+def new_style_id(styles: dict) -> str:
+    """Return a short style id not used in ``styles``."""
+    while True:
+        style_id = uuid.uuid4().hex[:8]
+        if style_id not in styles:
+            return style_id
+
+
+def paint_of(shape: dict, styles: dict) -> dict:
+    """Return the fill, stroke and stroke width a shape is drawn with."""
+    entry = styles.get(shape.get("style") or "")
+    source = entry if entry is not None else shape
+    return {field: source[field] for field in STYLE_FIELDS}
+
+
+def styled(shape: dict, style_id: str) -> dict:
+    """Return the shape pointed at a style entry, without inline paint."""
+    s = {k: v for k, v in shape.items() if k not in STYLE_FIELDS}
+    s["style"] = style_id
+    return s
+
+
+def inline_style(shape: dict, styles: dict) -> dict:
+    """Return the shape with its style entry copied into its own paint fields."""
+    if not shape.get("style"):
+        return shape
+    return {**shape, **paint_of(shape, styles), "style": ""}
+
+
+def inline_styles(shapes: list[dict], styles: dict) -> list[dict]:
+    """Inline the paint of every shape, for export and server-side rendering."""
+    return [inline_style(s, styles) for s in shapes]
+
+
+def unused_styles(candidates: set[str], shapes: list[dict]) -> set[str]:
+    """Return the style ids of ``candidates`` that no shape uses."""
+    unused = set(candidates)
+    for s in shapes:
+        if not unused:
+            break
+        unused.discard(s.get("style"))
+    return unused
+
+
+class StyleIndex:
+    """Reverse lookup from paint to style id, tied to one style table object."""
+
+    def __init__(self, styles: dict):
+        self.styles = styles
+        self.ids = {paint_key(entry): style_id for style_id, entry in styles.items()}
+        self.size = len(styles)
+
+    def is_current(self, styles: dict) -> bool:
+        """Whether the index still describes ``styles``.
+
+        Undo and redo assign a new table and edits in place change an entry's
+        paint, which the caller reports by dropping the index.
+        """
+        return self.styles is styles and self.size == len(styles)
+
+    def find(self, paint: dict) -> str:
+        """Return the id of an entry with exactly this paint, or an empty string."""
+        return self.ids.get(paint_key(paint), "")
+
+    def add(self, style_id: str, paint: dict):
+        """Record an entry just added to the table."""
+        self.ids[paint_key(paint)] = style_id
+        self.size += 1
@@ -0,0 +1,98 @@
+"""Symbols: shape sets defined once per room and placed as instances.
+
+A diagram that repeats an icon used to hold a full copy of its shapes per
+repetition. The room's symbol table now holds each set once, in coordinates
+local to its box, and an ``instance`` shape only names a symbol (in its
+``src`` field) and gives the box it is drawn into. The canvas and the SVG
+export draw instances with ``<use>`` and define each ``<symbol>`` once, so
+memory, sync and rendering grow with the number of distinct symbols.
+Exports that need plain shapes (JSON, PNG) expand instances on the way out.
+"""
+
+import uuid
+
+from codoc_in_vecdraw.rendering.svg_renderer import document_bounds
+
+
+def new_symbol_id(symbols: dict) -> str:
+    """Return a short symbol id not used in ``symbols``."""
+    while True:
+        symbol_id = uuid.uuid4().hex[:8]
+        if symbol_id not in symbols:
+            return symbol_id
+
+
+def unused_symbols(candidates: set[str], shapes: list[dict]) -> set[str]:
+    """Return the symbol ids of ``candidates`` that no instance places."""
+    unused = set(candidates)
+    for s in shapes:
+        if not unused:
+            break
+        if s["type"] == "instance":
+            unused.discard(s["src"])
+    return unused
+
+
+def define_symbol(shapes: list[dict], name: str = "") -> tuple[dict, tuple]:
+    """Build a symbol from shapes with inline paint.
+
+    Returns the symbol, with its shapes moved so its box starts at the
+    origin, and the box (min_x, min_y, max_x, max_y) they covered.
+    """
+    from codoc_in_vecdraw.states.transforms import translate_shape
+
+    box = document_bounds(shapes)
+    local = [
+        {**translate_shape(s, -box[0], -box[1]), "groups": []}
+        for s in shapes
+    ]
+    symbol = {
+        "name": name,
+        "width": max(1, box[2] - box[0]),
+        "height": max(1, box[3] - box[1]),
+        "shapes": local,
+    }
+    return symbol, box
+
+
+def expand_instance(instance: dict, symbols: dict) -> list[dict]:
+    """Return the symbol's shapes placed into an instance's box.
+
+    Each copy gets an id derived from the instance and keeps the instance's
+    version, so render caches see the same copy until the instance changes.
+    """
+    from codoc_in_vecdraw.states.transforms import scale_shape
+
+    symbol = symbols.get(instance["src"])
+    if symbol is None:
+        return []
+    src = (0, 0, symbol["width"], symbol["height"])
+    dst = (
+        instance["x"],
+        instance["y"],
+        instance["x"] + instance["width"],
+        instance["y"] + instance["height"],
+    )
+    groups = instance.get("groups") or []
+    return [
+        {
+            **scale_shape(s, src, dst),
+            "id": f"{instance['id']}/{s['id']}",
+            "groups": list(groups),
+            "version": instance.get("version", 0),
+        }
+        for s in symbol["shapes"]
+    ]
+
+
+def expand_instances(shapes: list[dict], symbols: dict) -> list[dict]:
+    """Replace every instance with the plain shapes of its symbol."""
+    if not any(s["type"] == "instance" for s in shapes):
+        return shapes
+    expanded = []
+    for s in shapes:
+        if s["type"] == "instance":
+            expanded.extend(expand_instance(s, symbols))
+        else:
+            expanded.append(s)
+    return expanded
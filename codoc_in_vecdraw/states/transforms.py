@@ -0,0 +1,79 @@
+"""Copy-on-write geometric transforms of shapes.
+
+Each function returns a new shape dict with a fresh version and never
+mutates its input, so history snapshots can share unchanged shapes.
+"""
+
+from codoc_in_vecdraw.rendering.point_codec import pack_points, translate_points, unpack_xy
+from codoc_in_vecdraw.rendering.strokes import map_path
+from codoc_in_vecdraw.rendering.svg_renderer import shape_bounds
+from codoc_in_vecdraw.states.editor_state import Shape, next_shape_version
+
+
+def translate_shape(shape: Shape, dx: int, dy: int) -> Shape:
+    """Return the shape moved by (dx, dy)."""
+    s = dict(shape)
+    s["x"] += dx
+    s["y"] += dy
+    if s["type"] == "line":
+        s["end_x"] += dx
+        s["end_y"] += dy
+    elif s["type"] == "pencil":
+        s["points"] = translate_points(s["points"], dx, dy)
+        s["path_data"] = map_path(s["path_data"], lambda x, y: (x + dx, y + dy))
+    s["version"] = next_shape_version()
+    return s
+
+
+def scale_shape(
+    shape: Shape,
+    src: tuple[int, int, int, int],
+    dst: tuple[int, int, int, int],
+) -> Shape:
+    """Return the shape mapped from box ``src`` to box ``dst``.
+
+    Boxes are (min_x, min_y, max_x, max_y); positions and sizes are scaled
+    independently on each axis, as when resizing a selection by a corner.
+    """
+    sx = (dst[2] - dst[0]) / (src[2] - src[0]) if src[2] != src[0] else 1.0
+    sy = (dst[3] - dst[1]) / (src[3] - src[1]) if src[3] != src[1] else 1.0
+
+    def map_x(v):
+        return round(dst[0] + (v - src[0]) * sx)
+
+    def map_y(v):
+        return round(dst[1] + (v - src[1]) * sy)
+
+    s = dict(shape)
+    s["x"] = map_x(shape["x"])
+    s["y"] = map_y(shape["y"])
+    if s["type"] == "line":
+        s["end_x"] = map_x(shape["end_x"])
+        s["end_y"] = map_y(shape["end_y"])
+    else:
+        s["width"] = max(1, round(shape["width"] * sx))
+        s["height"] = max(1, round(shape["height"] * sy))
+    if s["type"] == "pencil":
+        xs, ys = unpack_xy(shape["points"])
+        s["points"] = pack_points([{"x": map_x(x), "y": map_y(y)} for x, y in zip(xs, ys)])
+        # Curve control points keep their fractions; only stored points are rounded
+        s["path_data"] = map_path(
+            shape["path_data"],
+            lambda x, y: (dst[0] + (x - src[0]) * sx, dst[1] + (y - src[1]) * sy),
+        )
+    s["version"] = next_shape_version()
+    return s
+
+
+def selection_box(shapes: list[Shape], ids: list[str]) -> tuple[int, int, int, int] | None:
+    """Return the (min_x, min_y, max_x, max_y) box around the given shapes, if any."""
+    wanted = set(ids)
+    boxes = [shape_bounds(s) for s in shapes if s["id"] in wanted]
+    if not boxes:
+        return None
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
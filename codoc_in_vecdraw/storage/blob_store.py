@@ -0,0 +1,252 @@
+"""Content-addressed storage for uploaded files.
+
+Uploads are named by the SHA-256 of their bytes, so the same file dropped
+many times is stored once and its URL never changes meaning, which lets
+clients cache it forever. Each room (or unshared session) reports the blobs
+its shapes and history refer to; blobs nobody refers to are collected. A
+session's report is a lease that its open tabs renew, so the refs of a
+session nobody comes back to expire instead of pinning its blobs forever.
+
+Several worker processes may share the upload directory, so the reference
+index on disk is the only source of truth: every update re-reads it under
+an exclusive file lock. Garbage collection walks the directory without the
+lock and re-checks its candidates under it before deleting. The editor
+queues all of this on the store's writer thread with ``submit``, so the
+event loop never waits for the lock or the disk.
+"""
+
+import contextlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+import reflex as rx
+from reflex.constants import Endpoint
+
+from codoc_in_vecdraw.storage.derivatives import DERIVATIVE_DIR
+from codoc_in_vecdraw.storage.tile_pyramid import TILE_DIR
+
+# Stored names look like "<64 hex digits>.<ext>"; legacy uuid names never match.
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,8}$")
+
+# Derivatives of a blob are derived from its content, so they are immutable too.
+BLOB_DERIVATIVE = re.compile(
+    rf"^(?:{DERIVATIVE_DIR}/[0-9a-f]{{64}}\.w\d+|{TILE_DIR}/[0-9a-f]{{64}}/\d+/\d+_\d+)\.webp$"
+)
+
+# Unreferenced blobs younger than this are kept, so a file that is still being
+# attached to a shape is not collected from under it.
+GC_GRACE_SECONDS = 60 * 60
+
+# Minimum time between opportunistic garbage collections.
+GC_INTERVAL_SECONDS = 10 * 60
+
+# How long an unshared session's refs outlive its last renewal; matches
+# Reflex's default token expiration, after which the session's state is gone.
+SESSION_LEASE_SECONDS = 60 * 60
+
+INDEX_VERSION = 2
+
+IMMUTABLE_CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+
+def blob_extension(filename: str | None) -> str:
+    """Return a safe, lowercase extension for a stored blob."""
+    filename = filename or ""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "png"
+    return ext if re.fullmatch(r"[a-z0-9]{1,8}", ext) else "bin"
+
+
+def blob_uses(shapes: Iterable[dict]) -> Counter:
+    """Count how many image shapes use each stored blob."""
+    return Counter(s["src"] for s in shapes if s["type"] == "image" and BLOB_NAME.match(s["src"]))
+
+
+class BlobStore:
+    """Deduplicating blob directory with per-holder reference counts."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._index_path = root / ".blobrefs.json"
+        self._lock_path = root / ".blobrefs.lock"
+        self._lock = threading.Lock()
+        self._last_gc = 0.0
+        # One thread, so updates queued by a room apply in the order they were made
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blob-store")
+
+    def submit(self, fn, *args) -> Future:
+        """Run a blocking store call on the writer thread, after those queued before it."""
+        return self._writer.submit(fn, *args)
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[dict]:
+        """Hold the store lock across threads and processes; yield the index read from disk.
+
+        The index holds ``refs``, mapping each holder (room id or session
+        token) to {blob name: number of uses}, and ``leases``, mapping the
+        holders whose refs expire to the time they do.
+        """
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield self._load()
+
+    def _load(self) -> dict:
+        try:
+            index = json.loads(self._index_path.read_text())
+        except FileNotFoundError:
+            index = {}
+        if index.get("version") != INDEX_VERSION:
+            # Older indexes mapped holders to their refs, none of them leased
+            index = {"version": INDEX_VERSION, "refs": index, "leases": {}}
+        return index
+
+    def commit(self, incoming: Path, digest: str, ext: str) -> str:
+        """Move a fully written temp file into the store and return its blob name.
+
+        When an identical blob already exists the temp file is discarded.
+        """
+        name = f"{digest}.{ext}"
+        target = self.root / name
+        with self._locked():
+            if target.exists():
+                incoming.unlink(missing_ok=True)
+                # Refresh the mtime so the grace period covers the new upload.
+                os.utime(target)
+            else:
+                os.replace(incoming, target)
+        return name
+
+    def set_refs(self, holder: str, counts: Mapping[str, int], lease_seconds: float | None = None):
+        """Replace the blob use counts of a holder, persisting on change.
+
+        With ``lease_seconds`` the refs expire that long from now unless
+        renewed; without, they stand until replaced.
+        """
+        counts = {name: n for name, n in counts.items() if n > 0 and BLOB_NAME.match(name)}
+        with self._locked() as index:
+            refs, leases = index["refs"], index["leases"]
+            expires = time.time() + lease_seconds if lease_seconds is not None and counts else None
+            if refs.get(holder, {}) == counts and leases.get(holder) is None and expires is None:
+                return
+            if counts:
+                refs[holder] = counts
+            else:
+                refs.pop(holder, None)
+            if expires is None:
+                leases.pop(holder, None)
+            else:
+                leases[holder] = expires
+            self._save(index)
+
+    def refcount(self, name: str) -> int:
+        """Return how many shapes, across all holders, use a blob."""
+        with self._locked() as index:
+            return sum(refs.get(name, 0) for refs in index["refs"].values())
+
+    def _live(self, index: dict, now: float) -> set[str]:
+        """Drop expired leases from ``index``, saving it, and return the referenced blobs."""
+        expired = [holder for holder, expires in index["leases"].items() if expires <= now]
+        for holder in expired:
+            index["refs"].pop(holder, None)
+            del index["leases"][holder]
+        if expired:
+            self._save(index)
+        return {name for refs in index["refs"].values() for name in refs}
+
+    def collect_garbage(self, grace_seconds: int = GC_GRACE_SECONDS) -> list[str]:
+        """Delete unreferenced blobs older than the grace period; return their names.
+
+        The directory is walked without the lock; each candidate is checked
+        again under it, since a holder or an upload may have claimed it since.
+        """
+        now = time.time()
+        with self._locked() as index:
+            self._last_gc = now
+            live = self._live(index, now)
+        candidates = []
+        for path in self.root.iterdir():
+            if not BLOB_NAME.match(path.name) or path.name in live:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                if now - path.stat().st_mtime >= grace_seconds:
+                    candidates.append(path)
+        removed = []
+        if not candidates:
+            return removed
+        with self._locked() as index:
+            live = self._live(index, time.time())
+            for path in candidates:
+                try:
+                    # commit() refreshes the mtime of a blob uploaded again
+                    if path.name in live or now - path.stat().st_mtime < grace_seconds:
+                        continue
+                except FileNotFoundError:
+                    continue
+                path.unlink(missing_ok=True)
+                for derivative in (self.root / DERIVATIVE_DIR).glob(f"{path.stem}.*"):
+                    derivative.unlink(missing_ok=True)
+                shutil.rmtree(self.root / TILE_DIR / path.stem, ignore_errors=True)
+                removed.append(path.name)
+        return removed
+
+    def maybe_collect_garbage(self) -> list[str]:
+        """Collect garbage if the last collection is older than GC_INTERVAL_SECONDS."""
+        if time.time() - self._last_gc < GC_INTERVAL_SECONDS:
+            return []
+        return self.collect_garbage()
+
+    def _save(self, index: dict):
+        tmp = self._index_path.with_name(self._index_path.name + ".tmp")
+        tmp.write_text(json.dumps(index))
+        os.replace(tmp, self._index_path)
+
+
+_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store rooted at the Reflex upload directory."""
+    global _store
+    if _store is None:
+        root = rx.get_upload_dir()
+        root.mkdir(parents=True, exist_ok=True)
+        _store = BlobStore(root)
+    return _store
+
+
+def immutable_blob_cache(app):
+    """Wrap an ASGI app so content-addressed uploads get immutable cache headers."""
+    prefix = str(Endpoint.UPLOAD) + "/"
+
+    async def wrapped(scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        name = path[len(prefix):] if path.startswith(prefix) else ""
+        if not (BLOB_NAME.match(name) or BLOB_DERIVATIVE.match(name)):
+            await app(scope, receive, send)
+            return
+
+        async def send_with_cache(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = [
+                    (k, v) for k, v in message.get("headers", []) if k.lower() != b"cache-control"
+                ]
+                headers.append((b"cache-control", IMMUTABLE_CACHE_CONTROL))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await app(scope, receive, send_with_cache)
+
+    return wrapped
@@ -0,0 +1,116 @@
+"""Downscaled WebP derivatives of uploaded images.
+
+Image shapes default to 200x200 on the canvas, yet every viewer used to fetch
+the full-resolution original. After an upload, a worker process writes a
+ladder of width buckets next to it; the editor then points each image shape
+at the smallest derivative that still covers its on-screen size.
+"""
+
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import reflex as rx
+from PIL import Image
+
+# Widths (in pixels) of the generated derivatives; the smallest doubles as the thumbnail.
+DERIVATIVE_WIDTHS = (128, 256, 512, 1024, 2048)
+
+# Derivatives live in this subdirectory of the upload directory.
+DERIVATIVE_DIR = "derivatives"
+
+# Assume high-DPI screens when deciding whether a derivative is sharp enough.
+DEVICE_PIXEL_RATIO = 2
+
+WEBP_QUALITY = 80
+
+# src -> {"width": original width, "height": original height, "widths": [...]}
+_manifests: dict[str, dict] = {}
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _stem(src: str) -> str:
+    return src.rsplit(".", 1)[0]
+
+
+def derivative_name(src: str, width: int) -> str:
+    """Return the upload-relative path of a derivative."""
+    return f"{DERIVATIVE_DIR}/{_stem(src)}.w{width}.webp"
+
+
+def _manifest_path(upload_dir: Path, src: str) -> Path:
+    return upload_dir / DERIVATIVE_DIR / f"{_stem(src)}.json"
+
+
+def build_derivatives(upload_dir: Path, src: str) -> dict:
+    """Write the derivatives of one upload and return its manifest.
+
+    Runs in a worker process. Only widths smaller than the original are
+    produced, and animated images are left alone so they keep animating.
+    """
+    out_dir = upload_dir / DERIVATIVE_DIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+    widths = []
+    with Image.open(upload_dir / src) as original:
+        manifest = {"width": original.width, "height": original.height, "widths": widths}
+        if not getattr(original, "is_animated", False):
+            image = original.convert("RGBA")
+            for width in DERIVATIVE_WIDTHS:
+                if width >= image.width:
+                    break
+                height = max(1, round(image.height * width / image.width))
+                target = upload_dir / derivative_name(src, width)
+                tmp = target.with_name(target.name + ".tmp")
+                image.resize((width, height), Image.Resampling.LANCZOS).save(
+                    tmp, "WEBP", quality=WEBP_QUALITY
+                )
+                tmp.replace(target)
+                widths.append(width)
+    _manifest_path(upload_dir, src).write_text(json.dumps(manifest))
+    return manifest
+
+
+async def run_in_worker(fn, *args):
+    """Run a CPU-heavy image job in the shared background process pool."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=2)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, fn, *args)
+
+
+async def generate_derivatives(src: str) -> dict:
+    """Build an upload's derivatives in the background worker pool."""
+    manifest = await run_in_worker(build_derivatives, rx.get_upload_dir(), src)
+    _manifests[src] = manifest
+    return manifest
+
+
+def get_manifest(src: str) -> dict | None:
+    """Return the derivative manifest for an upload, if it has been built."""
+    if src not in _manifests:
+        path = _manifest_path(rx.get_upload_dir(), src)
+        if not path.exists():
+            return None
+        _manifests[src] = json.loads(path.read_text())
+    return _manifests[src]
+
+
+def pick_display_src(src: str, width: float, height: float, scale: float = 1.0) -> str:
+    """Return the smallest derivative covering a shape's on-screen size.
+
+    An empty string means no derivative is big enough (or none exists yet) and
+    the original upload should be shown.
+    """
+    manifest = get_manifest(src) if src else None
+    if not manifest:
+        return ""
+    need_w = width * scale * DEVICE_PIXEL_RATIO
+    need_h = height * scale * DEVICE_PIXEL_RATIO
+    aspect = manifest["height"] / manifest["width"]
+    for w in manifest["widths"]:
+        if w >= need_w and w * aspect >= need_h:
+            return derivative_name(src, w)
+    return ""
@@ -0,0 +1,343 @@
+"""Versioned binary document format (``.vdoc``).
+
+JSON documents spell every field name of every shape and every pencil point
+as ``{"x": .., "y": ..}``, and have to be parsed in full before the first
+shape can be read. A ``.vdoc`` file holds the same shapes in four sections:
+
+    header    magic, format version, counts and the offset of each section
+    strings   every distinct string once (ids, types, colours, text, path
+              data, upload names, style ids, groups), as an index of end
+              offsets followed by the UTF-8 bytes
+    records   one fixed-width little-endian record per shape: string
+              references, float64 geometry, the version and where its
+              points are
+    points    the packed pencil deltas of rendering.point_codec, as raw bytes
+
+Files are memory-mapped on load, so a reader can count shapes, measure the
+document or rebuild a single shape without decoding the rest; strings are
+decoded only when a shape that uses them is read. ``json_to_document`` and
+``document_to_json`` convert to and from the JSON export schema.
+"""
+
+import base64
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterator
+
+from codoc_in_vecdraw.rendering.point_codec import expand_points, pack_points
+
+MAGIC = b"VDOC"
+FORMAT_VERSION = 1
+
+# magic, version, header size, shape count, string count, record size,
+# then the offsets of the string index, string data, records and points.
+HEADER = struct.Struct("<4sHHIII4Q")
+
+# String references (id, type, fill, stroke, content, path_data, src,
+# display_src, groups, style, extra), geometry (x, y, width, height, end_x,
+# end_y, stroke_width), flags, points typecode, version, then the offset and
+# byte length of the points in the points section.
+RECORD = struct.Struct("<11I7dBBqQI")
+GEOMETRY = struct.Struct("<7d")
+GEOMETRY_OFFSET = 11 * 4
+
+STRING_FIELDS = ("id", "type", "fill", "stroke", "content", "path_data", "src", "display_src")
+GEOMETRY_FIELDS = ("x", "y", "width", "height", "end_x", "end_y", "stroke_width")
+PAINT_FIELDS = ("fill", "stroke", "stroke_width")
+
+FLAG_TILED = 1
+# The shape is painted by its style entry and has no inline paint keys.
+FLAG_NO_PAINT = 2
+
+# Groups are stored as one string; ids never contain the unit separator.
+GROUP_SEPARATOR = "\x1f"
+
+_TYPECODES = {"": 0, "h": 1, "i": 2}
+_KNOWN_FIELDS = {*STRING_FIELDS, *GEOMETRY_FIELDS, "points", "tiled", "version", "groups", "style"}
+
+
+class DocumentFormatError(ValueError):
+    """Raised for data that is not a readable ``.vdoc`` document."""
+
+
+def is_document(data: bytes) -> bool:
+    """Whether ``data`` starts like a binary document."""
+    return data[:4] == MAGIC
+
+
+def _num(value: float) -> int | float:
+    """Return a stored coordinate as the int it was written as, when it is whole."""
+    return int(value) if value.is_integer() else value
+
+
+def _raw_points(points) -> tuple[int, bytes]:
+    """Return the typecode and little-endian delta bytes of a shape's points."""
+    packed = pack_points(points)
+    if not packed:
+        return 0, b""
+    return _TYPECODES[packed[0]], base64.b64decode(packed[1:])
+
+
+def write_document(shapes: list[dict]) -> bytes:
+    """Serialize shapes in the JSON shape schema to a binary document."""
+    strings: list[str] = [""]
+    codes: dict[str, int] = {"": 0}
+
+    def ref(value: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(strings)
+            strings.append(value)
+        return code
+
+    records = bytearray(RECORD.size * len(shapes))
+    points = bytearray()
+    for i, s in enumerate(shapes):
+        styled = "fill" not in s
+        flags = (FLAG_TILED if s.get("tiled") else 0) | (FLAG_NO_PAINT if styled else 0)
+        typecode, raw = _raw_points(s.get("points"))
+        extra = {k: v for k, v in s.items() if k not in _KNOWN_FIELDS}
+        try:
+            geometry = [float(s.get(name) or 0) for name in GEOMETRY_FIELDS]
+        except (TypeError, ValueError):
+            raise DocumentFormatError(f"Shape {s.get('id')!r} has a non-numeric coordinate or size") from None
+        RECORD.pack_into(
+            records,
+            i * RECORD.size,
+            *(ref(s.get(name) or "") for name in STRING_FIELDS),
+            ref(GROUP_SEPARATOR.join(s.get("groups") or ())),
+            ref(s.get("style") or ""),
+            ref(json.dumps(extra) if extra else ""),
+            *geometry,
+            flags,
+            typecode,
+            s.get("version", 0),
+            len(points),
+            len(raw),
+        )
+        points += raw
+
+    encoded = [value.encode("utf-8") for value in strings]
+    ends = array("Q")
+    end = 0
+    for value in encoded:
+        end += len(value)
+        ends.append(end)
+    if sys.byteorder == "big":
+        ends.byteswap()
+
+    index_offset = HEADER.size
+    data_offset = index_offset + 8 * len(strings)
+    records_offset = data_offset + end
+    points_offset = records_offset + len(records)
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        HEADER.size,
+        len(shapes),
+        len(strings),
+        RECORD.size,
+        index_offset,
+        data_offset,
+        records_offset,
+        points_offset,
+    )
+    return b"".join([header, ends.tobytes(), *encoded, records, points])
+
+
+def save_document(shapes: list[dict], path: str | Path):
+    """Write shapes to ``path`` atomically, so readers never map a partial file."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(write_document(shapes))
+    os.replace(tmp, path)
+
+
+class DocumentReader:
+    """Random access to the shapes of a binary document.
+
+    Opened on a path, the file is memory-mapped; bytes are read in place.
+    Strings are decoded on first use and cached.
+    """
+
+    def __init__(self, source: str | Path | bytes):
+        self._file = None
+        self._map = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._buffer = memoryview(source)
+        else:
+            self._file = open(source, "rb")
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self._file.close()
+                raise DocumentFormatError(f"{source} is empty")
+            self._buffer = memoryview(self._map)
+
+        if len(self._buffer) < HEADER.size or not is_document(self._buffer[:4]):
+            self.close()
+            raise DocumentFormatError("Not a binary vector document")
+        (
+            _,
+            self.version,
+            header_size,
+            self.shape_count,
+            self.string_count,
+            self.record_size,
+            self._index_offset,
+            self._data_offset,
+            self._records_offset,
+            self._points_offset,
+        ) = HEADER.unpack_from(self._buffer)
+        if self.version > FORMAT_VERSION or header_size < HEADER.size or self.record_size < RECORD.size:
+            self.close()
+            raise DocumentFormatError(f"Unsupported document format version {self.version}")
+        # Every read below stays inside these sections, so a truncated or
+        # corrupt file fails here or with DocumentFormatError, never mid-shape
+        size = len(self._buffer)
+        if not (
+            header_size <= self._index_offset
+            and self._index_offset + 8 * self.string_count <= self._data_offset <= size
+            and self._records_offset + self.shape_count * self.record_size <= size
+            and self._points_offset <= size
+            and (self.string_count or not self.shape_count)
+        ):
+            self.close()
+            raise DocumentFormatError("Truncated or corrupt document: sections exceed the file")
+        self._strings: dict[int, str] = {}
+
+    def close(self):
+        """Release the memory map; shapes already read stay valid."""
+        self._buffer.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "DocumentReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.shape_count
+
+    def string(self, i: int) -> str:
+        """Return string ``i`` of the string table."""
+        value = self._strings.get(i)
+        if value is None:
+            if not 0 <= i < self.string_count:
+                raise DocumentFormatError(f"String reference {i} is outside the string table")
+            start = struct.unpack_from("<Q", self._buffer, self._index_offset + 8 * (i - 1))[0] if i else 0
+            end = struct.unpack_from("<Q", self._buffer, self._index_offset + 8 * i)[0]
+            if not start <= end <= len(self._buffer) - self._data_offset:
+                raise DocumentFormatError(f"String {i} is outside the string data")
+            try:
+                value = str(self._buffer[self._data_offset + start : self._data_offset + end], "utf-8")
+            except UnicodeDecodeError as e:
+                raise DocumentFormatError(f"String {i} is not valid UTF-8: {e}") from e
+            self._strings[i] = value
+        return value
+
+    def _record(self, i: int) -> tuple:
+        if not 0 <= i < self.shape_count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self._buffer, self._records_offset + i * self.record_size)
+
+    def shape(self, i: int) -> dict:
+        """Rebuild shape ``i`` in the editor's shape schema, points packed.
+
+        Raises IndexError for ``i`` out of range and DocumentFormatError for
+        a record that does not decode.
+        """
+        record = self._record(i)
+        try:
+            return self._shape(record)
+        except DocumentFormatError:
+            raise
+        except (struct.error, ValueError, TypeError, IndexError) as e:
+            raise DocumentFormatError(f"Shape {i} is corrupt: {e}") from e
+
+    def _shape(self, record: tuple) -> dict:
+        string = self.string
+        shape = {name: string(code) for name, code in zip(STRING_FIELDS, record)}
+        groups, style, extra = record[8:11]
+        for name, value in zip(GEOMETRY_FIELDS, record[11:18]):
+            shape[name] = _num(value)
+        flags, typecode, version, offset, size = record[18:23]
+        shape["points"] = ""
+        if typecode:
+            start = self._points_offset + offset
+            if start + size > len(self._buffer):
+                raise DocumentFormatError("Points run past the end of the document")
+            raw = base64.b64encode(self._buffer[start : start + size]).decode("ascii")
+            shape["points"] = ("", "h", "i")[typecode] + raw
+        shape["tiled"] = bool(flags & FLAG_TILED)
+        shape["version"] = version
+        shape["groups"] = string(groups).split(GROUP_SEPARATOR) if groups else []
+        shape["style"] = string(style)
+        if extra:
+            shape.update(json.loads(string(extra)))
+        if flags & FLAG_NO_PAINT:
+            for name in PAINT_FIELDS:
+                del shape[name]
+        return shape
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self.shape(i) for i in range(self.shape_count))
+
+    def bounds(self) -> tuple[float, float, float, float]:
+        """Return the box around every shape, reading only types and geometry.
+
+        Matches ``svg_renderer.document_bounds`` without building any shape.
+        """
+        if not self.shape_count:
+            return (0, 0, 0, 0)
+        line = -1
+        for code in range(self.string_count):
+            if self.string(code) == "line":
+                line = code
+                break
+        min_x = min_y = float("inf")
+        max_x = max_y = float("-inf")
+        for i in range(self.shape_count):
+            base = self._records_offset + i * self.record_size
+            kind = struct.unpack_from("<I", self._buffer, base + 4)[0]
+            x, y, w, h, end_x, end_y, _ = GEOMETRY.unpack_from(self._buffer, base + GEOMETRY_OFFSET)
+            if kind == line:
+                x, end_x = min(x, end_x), max(x, end_x)
+                y, end_y = min(y, end_y), max(y, end_y)
+            else:
+                end_x, end_y = x + w, y + h
+            min_x, min_y = min(min_x, x), min(min_y, y)
+            max_x, max_y = max(max_x, end_x), max(max_y, end_y)
+        return (_num(min_x), _num(min_y), _num(max_x), _num(max_y))
+
+
+def load_document(source: str | Path | bytes) -> list[dict]:
+    """Read every shape of a binary document."""
+    with DocumentReader(source) as reader:
+        return list(reader)
+
+
+def json_to_document(data: bytes | str) -> bytes:
+    """Convert a JSON shape export to a binary document."""
+    shapes = json.loads(data)
+    if not isinstance(shapes, list):
+        raise DocumentFormatError("Document must be a JSON list of shapes")
+    return write_document(shapes)
+
+
+def document_to_json(source: str | Path | bytes) -> str:
+    """Convert a binary document to the JSON export schema, points expanded."""
+    with DocumentReader(source) as reader:
+        return json.dumps([expand_points(s) for s in reader])
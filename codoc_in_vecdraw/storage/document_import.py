@@ -0,0 +1,236 @@
+"""Streaming import of exported JSON documents.
+
+A document is read from the upload in fixed-size chunks and fed through an
+incremental parser that hands back each shape object as soon as it is
+complete, so only the unparsed tail of the text is held at any time, never
+the whole file or its full parse tree. Shapes are validated one by one and
+returned in bounded batches; points are packed as they arrive.
+"""
+
+import codecs
+import json
+import re
+from typing import AsyncIterator
+
+import reflex as rx
+
+from codoc_in_vecdraw.rendering.point_codec import PACKED_TYPECODES, pack_points, unpack_xy
+
+# Bytes read from the upload per step.
+IMPORT_CHUNK_SIZE = 256 * 1024
+
+# Shapes validated and handed to the editor per batch.
+IMPORT_BATCH_SIZE = 1000
+
+# Longest single shape object accepted, in characters; bounds the parse buffer.
+MAX_SHAPE_CHARS = 8 * 1024 * 1024
+
+SHAPE_TYPES = {"rectangle", "ellipse", "triangle", "line", "pencil", "text", "image", "instance"}
+
+NUMBER_FIELDS = ("x", "y", "width", "height", "stroke_width", "end_x", "end_y")
+STRING_FIELDS = ("fill", "stroke", "content", "path_data", "src", "display_src")
+
+_WHITESPACE = " \t\n\r"
+
+# Characters that end a run of plain text inside and outside JSON strings.
+_STRING_STOP = re.compile(r'["\\]')
+_OBJECT_STOP = re.compile(r'["{}]')
+
+
+class DocumentImportError(ValueError):
+    """Raised when an uploaded document is not a JSON list of shapes."""
+
+
+class ShapeStreamParser:
+    """Incremental parser for a JSON array of objects.
+
+    ``feed`` takes the next bytes of the document and returns the objects
+    they complete. Malformed structure raises ``DocumentImportError`` as soon
+    as the text holding it has arrived: an object the decoder rejects is only
+    waited on while its braces are still open.
+    """
+
+    def __init__(self, max_item_chars: int = MAX_SHAPE_CHARS):
+        self.max_item_chars = max_item_chars
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        # start: before "[", first: after "[", next: after an item,
+        # item: after ",", end: after "]"
+        self._state = "start"
+        # How far the braces of the pending object were scanned, and where that left off
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+
+    def _object_closed(self, buf: str, start: int) -> bool:
+        """Whether the braces of the object at ``start`` all close within ``buf``.
+
+        Scanning resumes where the previous call for the same object stopped.
+        """
+        i = start + self._scanned
+        depth, in_string = self._depth, self._in_string
+        while i < len(buf):
+            if in_string:
+                match = _STRING_STOP.search(buf, i)
+                if match is None:
+                    i = len(buf)
+                elif match.group() == "\\":
+                    if match.end() == len(buf):
+                        # Resume at the backslash once the escaped character arrives
+                        i = match.start()
+                        break
+                    i = match.end() + 1
+                else:
+                    in_string = False
+                    i = match.end()
+                continue
+            match = _OBJECT_STOP.search(buf, i)
+            if match is None:
+                i = len(buf)
+                continue
+            i = match.end()
+            if match.group() == '"':
+                in_string = True
+            elif match.group() == "{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return True
+        self._scanned, self._depth, self._in_string = i - start, depth, in_string
+        return False
+
+    def feed(self, data: bytes, final: bool = False) -> list[dict]:
+        try:
+            buf = self._buffer + self._text.decode(data, final)
+        except UnicodeDecodeError as e:
+            raise DocumentImportError(f"Document is not UTF-8: {e}") from e
+        items = []
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buf):
+                break
+            char = buf[pos]
+            if self._state == "start":
+                if char != "[":
+                    raise DocumentImportError("Document must be a JSON list of shapes")
+                self._state = "first"
+                pos += 1
+            elif self._state in ("first", "next") and char == "]":
+                self._state = "end"
+                pos += 1
+            elif self._state == "next":
+                if char != ",":
+                    raise DocumentImportError(f"Expected ',' or ']' in document, found {char!r}")
+                self._state = "item"
+                pos += 1
+            elif self._state in ("first", "item"):
+                if char != "{":
+                    raise DocumentImportError("Every shape must be a JSON object")
+                try:
+                    item, pos = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if final or self._object_closed(buf, pos):
+                        raise DocumentImportError(f"Malformed shape in document: {e.msg}") from e
+                    if len(buf) - pos > self.max_item_chars:
+                        raise DocumentImportError("Shape object too large") from e
+                    # The object continues in the next chunk
+                    break
+                self._scanned = self._depth = 0
+                self._in_string = False
+                items.append(item)
+                self._state = "next"
+            else:
+                raise DocumentImportError("Unexpected data after the end of the document")
+        self._buffer = buf[pos:]
+        if final and self._state != "end":
+            raise DocumentImportError("Document ended before its closing ']'")
+        return items
+
+
+async def read_shape_objects(
+    file: rx.UploadFile, chunk_size: int = IMPORT_CHUNK_SIZE
+) -> AsyncIterator[tuple[list[dict], int]]:
+    """Yield the shape objects completed by each chunk, with the bytes read so far."""
+    parser = ShapeStreamParser()
+    read = 0
+    while chunk := await file.read(chunk_size):
+        read += len(chunk)
+        items = parser.feed(chunk)
+        if items:
+            yield items, read
+    yield parser.feed(b"", final=True), read
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def normalize_shape(raw: dict, symbols: dict) -> dict | None:
+    """Return an imported shape in the editor schema, or None if it is invalid.
+
+    Missing fields get their blank values and unknown fields are dropped.
+    The caller assigns the id, if it collides, and a fresh version.
+    """
+    if raw.get("type") not in SHAPE_TYPES:
+        return None
+    shape = {"id": raw.get("id"), "type": raw["type"]}
+    if not isinstance(shape["id"], str) or not shape["id"]:
+        shape["id"] = ""
+    for name in NUMBER_FIELDS:
+        value = raw.get(name, 0)
+        if not _is_number(value):
+            return None
+        shape[name] = value
+    for name in STRING_FIELDS:
+        value = raw.get(name, "")
+        if not isinstance(value, str):
+            return None
+        shape[name] = value
+    points = raw.get("points") or ""
+    if isinstance(points, str) and points and points[0] not in PACKED_TYPECODES:
+        return None
+    try:
+        shape["points"] = pack_points(points)
+        if isinstance(points, str) and points:
+            # Check a packed string before the renderers trust it
+            unpack_xy(points)
+    except (KeyError, TypeError, ValueError, OverflowError, IndexError):
+        return None
+    groups = raw.get("groups") or []
+    if not isinstance(groups, list) or not all(isinstance(g, str) for g in groups):
+        return None
+    shape["groups"] = groups
+    shape["tiled"] = bool(raw.get("tiled", False))
+    # Exports carry inline paint; style ids of another room mean nothing here
+    shape["style"] = ""
+    shape["version"] = 0
+    if shape["type"] == "instance" and shape["src"] not in symbols:
+        return None
+    return shape
+
+
+async def read_shape_batches(
+    file: rx.UploadFile, symbols: dict, batch_size: int = IMPORT_BATCH_SIZE
+) -> AsyncIterator[tuple[list[dict], int, int]]:
+    """Yield batches of at most ``batch_size`` valid shapes.
+
+    Each batch comes with the number of invalid shapes skipped since the
+    previous one and the bytes of the upload read so far.
+    """
+    batch, rejected = [], 0
+    async for items, read in read_shape_objects(file):
+        for raw in items:
+            shape = normalize_shape(raw, symbols)
+            if shape is None:
+                rejected += 1
+                continue
+            batch.append(shape)
+            if len(batch) == batch_size:
+                yield batch, rejected, read
+                batch, rejected = [], 0
+    if batch or rejected:
+        yield batch, rejected, read
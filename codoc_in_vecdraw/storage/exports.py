@@ -0,0 +1,99 @@
+"""Short-lived export files served from the upload directory.
+
+Large exports are written to disk chunk by chunk as they are generated and
+downloaded through the backend's upload endpoint, so neither the server nor
+the websocket ever holds the whole document. Names are random and files
+older than ``EXPORT_TTL_SECONDS`` are deleted when the next export is made.
+"""
+
+import contextlib
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import IO, BinaryIO, Callable, Iterable, Iterator
+
+import reflex as rx
+from reflex.constants import Endpoint
+
+EXPORT_DIR = "exports"
+
+# How long an export stays downloadable.
+EXPORT_TTL_SECONDS = 10 * 60
+
+
+def _prune(directory: Path, now: float):
+    for path in directory.iterdir():
+        try:
+            if now - path.stat().st_mtime > EXPORT_TTL_SECONDS:
+                path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            # Another worker pruned it first
+            pass
+
+
+@contextlib.contextmanager
+def _new_export(ext: str, mode: str) -> Iterator[tuple[IO, str]]:
+    """Open a new export file and yield it with its upload-relative name.
+
+    The file only appears under that name once the block completes.
+    """
+    directory = rx.get_upload_dir() / EXPORT_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    _prune(directory, time.time())
+    name = f"{secrets.token_hex(16)}.{ext}"
+    tmp = directory / f".{name}.tmp"
+    try:
+        with open(tmp, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f, f"{EXPORT_DIR}/{name}"
+        os.replace(tmp, directory / name)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def write_export(chunks: Iterable[str], ext: str) -> str:
+    """Write text chunks to a new export file and return its upload-relative name.
+
+    Blocking; run it in a thread.
+    """
+    with _new_export(ext, "w") as (f, name):
+        for chunk in chunks:
+            f.write(chunk)
+    return name
+
+
+def write_binary_export(write: Callable[[BinaryIO], object], ext: str) -> str:
+    """Have ``write`` fill a new binary export file and return its upload-relative name.
+
+    Blocking; run it in a thread.
+    """
+    with _new_export(ext, "wb") as (f, name):
+        write(f)
+    return name
+
+
+def attachment_exports(app):
+    """Wrap an ASGI app so export files download as attachments.
+
+    The backend serves uploads from another origin than the page, where
+    browsers ignore a link's download attribute and would open the file.
+    """
+    prefix = f"{Endpoint.UPLOAD}/{EXPORT_DIR}/"
+
+    async def wrapped(scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if not path.startswith(prefix):
+            await app(scope, receive, send)
+            return
+        ext = path.rsplit(".", 1)[-1]
+        disposition = f'attachment; filename="drawing.{ext if ext.isalnum() else "bin"}"'.encode()
+
+        async def send_as_attachment(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = [*message.get("headers", []), (b"content-disposition", disposition)]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await app(scope, receive, send_as_attachment)
+
+    return wrapped
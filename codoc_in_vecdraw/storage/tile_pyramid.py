@@ -0,0 +1,150 @@
+"""Deep-zoom tile pyramids for very large uploaded images.
+
+A single multi-megapixel ``<image>`` is slow for browsers to decode and makes
+panning janky. For uploads above ``TILED_MIN_SIDE`` a pyramid of fixed-size
+tiles is written at every power-of-two level, and image shapes in tiled mode
+draw only the tiles of the level that matches their on-screen size and that
+intersect the viewport.
+"""
+
+import json
+import math
+from pathlib import Path
+
+import reflex as rx
+from PIL import Image
+
+from codoc_in_vecdraw.storage.derivatives import run_in_worker
+
+# Images with a side at least this long (in pixels) get a pyramid.
+TILED_MIN_SIDE = 4096
+
+TILE_SIZE = 256
+
+# Pyramids live under this subdirectory of the upload directory.
+TILE_DIR = "tiles"
+
+# Assume high-DPI screens when choosing a level, as for derivatives.
+DEVICE_PIXEL_RATIO = 2
+
+WEBP_QUALITY = 80
+
+_manifests: dict[str, dict | None] = {}
+
+
+def _stem(src: str) -> str:
+    return src.rsplit(".", 1)[0]
+
+
+def tile_name(src: str, level: int, col: int, row: int) -> str:
+    """Return the upload-relative path of one tile."""
+    return f"{TILE_DIR}/{_stem(src)}/{level}/{col}_{row}.webp"
+
+
+def _manifest_path(upload_dir: Path, src: str) -> Path:
+    return upload_dir / TILE_DIR / _stem(src) / "pyramid.json"
+
+
+def build_pyramid(upload_dir: Path, src: str) -> dict | None:
+    """Write the tile pyramid for a large upload and return its manifest.
+
+    Level ``max_level`` is full resolution and every level below halves it,
+    down to a single pixel at level 0. Returns None for images too small to
+    need tiling. Runs in a worker process.
+    """
+    with Image.open(upload_dir / src) as original:
+        if max(original.size) < TILED_MIN_SIDE:
+            return None
+        image = original.convert("RGBA")
+
+    width, height = image.size
+    max_level = math.ceil(math.log2(max(width, height)))
+    for level in range(max_level, -1, -1):
+        level_dir = upload_dir / TILE_DIR / _stem(src) / str(level)
+        level_dir.mkdir(parents=True, exist_ok=True)
+        for row in range(math.ceil(image.height / TILE_SIZE)):
+            for col in range(math.ceil(image.width / TILE_SIZE)):
+                box = (
+                    col * TILE_SIZE,
+                    row * TILE_SIZE,
+                    min((col + 1) * TILE_SIZE, image.width),
+                    min((row + 1) * TILE_SIZE, image.height),
+                )
+                image.crop(box).save(level_dir / f"{col}_{row}.webp", "WEBP", quality=WEBP_QUALITY)
+        if level:
+            # Round up so level sizes match ceil(size / 2 ** (max_level - level)).
+            half = ((image.width + 1) // 2, (image.height + 1) // 2)
+            image = image.resize(half, Image.Resampling.BOX)
+
+    manifest = {"width": width, "height": height, "tile_size": TILE_SIZE, "max_level": max_level}
+    _manifest_path(upload_dir, src).write_text(json.dumps(manifest))
+    return manifest
+
+
+async def generate_pyramid(src: str) -> dict | None:
+    """Build an upload's pyramid in the background worker pool, if it needs one."""
+    manifest = await run_in_worker(build_pyramid, rx.get_upload_dir(), src)
+    _manifests[src] = manifest
+    return manifest
+
+
+def get_pyramid(src: str) -> dict | None:
+    """Return the pyramid manifest for an upload, or None if it is not tiled."""
+    if src not in _manifests:
+        path = _manifest_path(rx.get_upload_dir(), src)
+        _manifests[src] = json.loads(path.read_text()) if path.exists() else None
+    return _manifests[src]
+
+
+def visible_tiles(
+    shape: dict,
+    viewport: tuple[float, float, float, float],
+    scale: float = 1.0,
+) -> list[dict]:
+    """Return the tiles of a tiled image shape that intersect the viewport.
+
+    ``viewport`` is ``(min_x, min_y, max_x, max_y)`` in document units and
+    ``scale`` is the canvas zoom. Each tile is a dict with its upload path and
+    document-space ``x``, ``y``, ``width`` and ``height``.
+    """
+    pyramid = get_pyramid(shape["src"])
+    if not pyramid or shape["width"] <= 0 or shape["height"] <= 0:
+        return []
+
+    # Pick the coarsest level that still has enough pixels for the screen.
+    needed = max(
+        shape["width"] * scale * DEVICE_PIXEL_RATIO / pyramid["width"],
+        shape["height"] * scale * DEVICE_PIXEL_RATIO / pyramid["height"],
+    )
+    max_level = pyramid["max_level"]
+    level = max_level
+    if needed > 0:
+        level = min(max_level, max(0, max_level + math.ceil(math.log2(needed))))
+    divisor = 2 ** (max_level - level)
+    level_w = max(1, math.ceil(pyramid["width"] / divisor))
+    level_h = max(1, math.ceil(pyramid["height"] / divisor))
+
+    # Document units per level pixel (the image is stretched to the shape box).
+    unit_x = shape["width"] / level_w
+    unit_y = shape["height"] / level_h
+    tile = pyramid["tile_size"]
+    min_x, min_y, max_x, max_y = viewport
+    col0 = max(0, math.floor((min_x - shape["x"]) / unit_x / tile))
+    col1 = min(math.ceil(level_w / tile) - 1, math.floor((max_x - shape["x"]) / unit_x / tile))
+    row0 = max(0, math.floor((min_y - shape["y"]) / unit_y / tile))
+    row1 = min(math.ceil(level_h / tile) - 1, math.floor((max_y - shape["y"]) / unit_y / tile))
+
+    tiles = []
+    for row in range(row0, row1 + 1):
+        for col in range(col0, col1 + 1):
+            px0, py0 = col * tile, row * tile
+            tiles.append(
+                {
+                    "src": tile_name(shape["src"], level, col, row),
+                    "x": shape["x"] + px0 * unit_x,
+                    "y": shape["y"] + py0 * unit_y,
+                    "width": (min(px0 + tile, level_w) - px0) * unit_x,
+                    "height": (min(py0 + tile, level_h) - py0) * unit_y,
+                }
+            )
+    return tiles
@@ -0,0 +1,101 @@
+"""Streaming storage of uploaded images.
+
+Reflex's own upload endpoint reads every file of a request into memory
+before any handler runs, so images are posted to ``UPLOAD_ROUTE`` instead,
+one file per request with the raw bytes as the body. The body is copied to
+disk in the chunks the server delivers, with the size cap enforced as they
+arrive and the blocking file calls pushed to worker threads; the client then
+hands the stored blob names to ``EditorState.add_uploaded_images``.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator
+
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse
+
+from codoc_in_vecdraw.storage.blob_store import blob_extension, get_blob_store
+
+# Route, on the backend, that accepts one raw image per POST.
+UPLOAD_ROUTE = "/blobs"
+
+# Largest accepted upload; enforced while streaming, before the file is complete.
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size cap."""
+
+
+def _too_large(filename: str, max_bytes: int) -> UploadTooLargeError:
+    return UploadTooLargeError(
+        f"{filename} exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+    )
+
+
+async def stream_to_disk(
+    chunks: AsyncIterator[bytes],
+    dest: Path,
+    filename: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    hasher=None,
+) -> int:
+    """Copy a stream of chunks to ``dest`` and return the bytes written.
+
+    The data lands in a ``.part`` file that is renamed into place only once
+    complete, so a rejected or failed upload never leaves a truncated file.
+    If given, ``hasher`` is updated with every chunk.
+    """
+    partial = dest.with_name(dest.name + ".part")
+    out = await asyncio.to_thread(open, partial, "wb")
+    written = 0
+    try:
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > max_bytes:
+                raise _too_large(filename, max_bytes)
+            if hasher is not None:
+                hasher.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        await asyncio.to_thread(partial.unlink, True)
+        raise
+    await asyncio.to_thread(out.close)
+    await asyncio.to_thread(os.replace, partial, dest)
+    return written
+
+
+async def save_stream(chunks: AsyncIterator[bytes], filename: str) -> str:
+    """Stream one upload into the blob store and return its content-addressed name."""
+    store = get_blob_store()
+    incoming = store.root / f".{uuid.uuid4()}.incoming"
+    hasher = hashlib.sha256()
+    await stream_to_disk(chunks, incoming, filename, MAX_UPLOAD_BYTES, hasher=hasher)
+    return await asyncio.to_thread(
+        store.commit, incoming, hasher.hexdigest(), blob_extension(filename)
+    )
+
+
+async def upload_endpoint(request: Request) -> JSONResponse:
+    """Store the raw request body as a blob; ``?filename=`` gives its extension.
+
+    Responds ``{"name": <blob name>}``, or ``{"error": ...}`` with status 413
+    when the body is over the cap. A declared ``Content-Length`` over the cap
+    is refused before anything is read.
+    """
+    filename = request.query_params.get("filename", "")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+        return JSONResponse({"error": str(_too_large(filename, MAX_UPLOAD_BYTES))}, status_code=413)
+    try:
+        name = await save_stream(request.stream(), filename)
+    except UploadTooLargeError as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except ClientDisconnect:
+        return JSONResponse({"error": f"{filename} upload was interrupted"}, status_code=400)
+    return JSONResponse({"name": name})
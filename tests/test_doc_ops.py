@@ -0,0 +1,131 @@
+import itertools
+import random
+
+import pytest
+
+from codoc_in_vecdraw.states.doc_ops import ABSENT, DocClock, apply_ops, diff_ops
+
+_versions = itertools.count(1)
+
+
+def new_version() -> int:
+    return next(_versions)
+
+
+def apply(shapes: list[dict], ops: list[dict], clock: DocClock) -> list[dict]:
+    """Apply operations and write the result back the way the editor does."""
+    replaced, added, removed = apply_ops(shapes, ops, clock, new_version)
+    rebuilt = [replaced.get(i, s) for i, s in enumerate(shapes) if s["id"] not in removed]
+    for index, shape in sorted(added, key=lambda item: item[0]):
+        rebuilt.insert(min(index, len(rebuilt)), shape)
+    return rebuilt
+
+
+def content(shapes: list[dict]) -> list[dict]:
+    """Shapes without their versions, sorted by id, to compare documents."""
+    return sorted(({k: v for k, v in s.items() if k != "version"} for s in shapes), key=lambda s: s["id"])
+
+
+BASE = [{"id": "a", "x": 0, "fill": "red", "version": 0}]
+
+CONCURRENT_OPS = [
+    {"op": "set", "id": "a", "fields": {"x": 5}, "stamp": (3, "A")},
+    {"op": "set", "id": "a", "fields": {"x": 7, "fill": "green"}, "stamp": (3, "B")},
+    {"op": "add", "shape": {"id": "b", "x": 1, "version": 0}, "index": 1, "stamp": (2, "A")},
+    {"op": "set", "id": "b", "fields": {"x": 9}, "stamp": (4, "B")},
+    {"op": "set", "id": "a", "fields": {"fill": "blue"}, "stamp": (1, "C")},
+    {"op": "add", "shape": {"id": "c", "x": 3, "version": 0}, "index": 2, "stamp": (2, "C")},
+    {"op": "remove", "id": "c", "stamp": (5, "A")},
+]
+
+
+def test_concurrent_writes_merge_per_field():
+    merged = apply(BASE, CONCURRENT_OPS, DocClock())
+    assert content(merged) == [{"id": "a", "x": 7, "fill": "green"}, {"id": "b", "x": 9}]
+
+
+def _orderings() -> list[list[dict]]:
+    """Orderings that stress the merge rules, plus a fixed random sample of the rest."""
+    by_stamp = sorted(CONCURRENT_OPS, key=lambda op: op["stamp"])
+    adds_last = [op for op in CONCURRENT_OPS if op["op"] != "add"] + [op for op in CONCURRENT_OPS if op["op"] == "add"]
+    orderings = [by_stamp, by_stamp[::-1], CONCURRENT_OPS[::-1], adds_last]
+    rng = random.Random(50)
+    for _ in range(40):
+        orderings.append(rng.sample(CONCURRENT_OPS, len(CONCURRENT_OPS)))
+    return orderings
+
+
+@pytest.mark.parametrize("order", _orderings())
+def test_apply_order_does_not_matter(order):
+    assert content(apply(BASE, order, DocClock())) == content(apply(BASE, CONCURRENT_OPS, DocClock()))
+
+
+def test_ops_applied_one_at_a_time_match_one_batch():
+    clock = DocClock()
+    shapes = BASE
+    for op in reversed(CONCURRENT_OPS):
+        shapes = apply(shapes, [op], clock)
+    assert content(shapes) == content(apply(BASE, CONCURRENT_OPS, DocClock()))
+
+
+def test_repeated_ops_are_ignored():
+    clock = DocClock()
+    once = apply(BASE, CONCURRENT_OPS, clock)
+    assert content(apply(once, CONCURRENT_OPS, clock)) == content(once)
+
+
+def test_diff_ops_round_trip():
+    before = [{"id": "a", "x": 0, "fill": "red", "version": 1}, {"id": "b", "x": 1, "version": 2}]
+    after = [{"id": "a", "x": 4, "version": 3}, {"id": "c", "x": 2, "version": 4}]
+    ops = diff_ops(before, after, (1, "A"))
+    assert {"op": "set", "id": "a", "fields": {"x": 4, "fill": ABSENT}, "stamp": (1, "A")} in ops
+    assert content(apply(before, ops, DocClock())) == content(after)
+
+
+def test_undo_keeps_later_writes_by_others():
+    clock = DocClock()
+    start = [{"id": "a", "x": 0, "fill": "red", "version": 1}]
+    since = (clock.counter, "A")
+    moved = apply(start, [{"op": "set", "id": "a", "fields": {"x": 10}, "stamp": clock.tick("A")}], clock)
+    recoloured = apply(moved, [{"op": "set", "id": "a", "fields": {"fill": "blue"}, "stamp": clock.tick("B")}], clock)
+    undo = clock.without_later_writes(diff_ops(recoloured, start, clock.tick("A")), since)
+    assert content(apply(recoloured, undo, clock)) == [{"id": "a", "x": 0, "fill": "blue"}]
+
+
+def test_remove_forgets_field_stamps():
+    clock = DocClock()
+    shapes = apply([], [{"op": "add", "shape": {"id": "a", "x": 0, "version": 0}, "stamp": clock.tick("A")}], clock)
+    shapes = apply(shapes, [{"op": "set", "id": "a", "fields": {"x": 3}, "stamp": clock.tick("B")}], clock)
+    apply(shapes, [{"op": "remove", "id": "a", "stamp": clock.tick("A")}], clock)
+    assert "a" not in clock.fields
+    assert "a" not in clock.added
+    assert "a" in clock.removed
+
+
+def test_compact_drops_stamps_before_the_horizon():
+    clock = DocClock()
+    shapes = apply([], [{"op": "add", "shape": {"id": "a", "x": 0, "version": 0}, "stamp": clock.tick("A")}], clock)
+    shapes = apply(shapes, [{"op": "remove", "id": "a", "stamp": clock.tick("B")}], clock)
+    horizon = (clock.counter, "A")
+    shapes = apply(shapes, [{"op": "add", "shape": {"id": "b", "x": 0, "version": 0}, "stamp": clock.tick("B")}], clock)
+    clock.compact(horizon)
+    assert clock.removed == {}
+    assert list(clock.added) == ["b"]
+    assert clock.compacted == clock.counter
+
+
+def test_compact_keeps_undo_results():
+    start = [{"id": "a", "x": 0, "version": 1}, {"id": "b", "x": 0, "version": 2}]
+    results = []
+    for compact in (False, True):
+        clock = DocClock()
+        before = apply(start, [{"op": "set", "id": "a", "fields": {"x": 1}, "stamp": clock.tick("B")}], clock)
+        since = (clock.counter, "A")
+        shapes = apply(before, [{"op": "set", "id": "b", "fields": {"x": 2}, "stamp": clock.tick("A")}], clock)
+        shapes = apply(shapes, [{"op": "remove", "id": "a", "stamp": clock.tick("B")}], clock)
+        if compact:
+            clock.compact(since)
+        undo = clock.without_later_writes(diff_ops(shapes, before, clock.tick("A")), since)
+        results.append(content(apply(shapes, undo, clock)))
+    # B's later delete of a is kept, A's edit of b is reverted
+    assert results[0] == results[1] == [{"id": "b", "x": 0}]